@@ -1,9 +1,19 @@
 import os
+import uuid
+import base64
 from itertools import product
-from typing import List, Tuple, Dict
-from flask import Flask, render_template, send_from_directory, request, jsonify, Response, stream_with_context
-from objects.individual import Individual, Brain
-from evolution import create_population, evolve
+import numpy as np
+from typing import Any, Callable, Dict
+from flask import (
+    Flask, render_template, send_from_directory, request, jsonify, Response, session, stream_with_context, g,
+)
+from objects.brain import BRAIN_CACHE
+from objects.genome import genes_to_hex
+from objects.population import Population
+from objects.trajectory import Trajectory
+from sessions import Simulation, SimulationManager
+from streaming import stream_simulation
+from frames import FRAME_MIMETYPE, PNG_MIMETYPE, FrameEncoder
 
 
 app = Flask(
@@ -12,161 +22,346 @@ app = Flask(
     static_folder='web/static',
     template_folder='web/templates',
 )
+app.secret_key = os.environ.get('FLASK_SECRET_KEY') or os.urandom(16)
 
 DEFAULT_POP_SIZE = 80
-DEFAULT_NUM_GENERATIONS = 100
-DEFAULT_LIFESPAN = 60
-DEFAULT_WORLD_SIZE: Tuple[int, int] = (150, 150)
-DEFAULT_NUM_GENES: int = 6
 MAX_GENERATIONS: int = 10000
-DEFAULT_MUTE_PROBABILITY: float = 0.0001
-DEFAULT_MATE_PROBABILITY: float = 0.5
+CHECKPOINT_DIR: str = os.environ.get('CHECKPOINT_DIR', 'checkpoints')
+DEFAULT_FPS: float = 30
+MAX_SESSIONS: int = int(os.environ.get('MAX_SESSIONS', 64))
+SESSION_IDLE_TIMEOUT: float = float(os.environ.get('SESSION_IDLE_TIMEOUT', 15*60))
+SESSION_CHECKPOINT_DIR: str = os.environ.get('SESSION_CHECKPOINT_DIR')
+RECORDINGS_DIR: str = os.environ.get('RECORDINGS_DIR', 'recordings')
+MAX_WORKERS: int = int(os.environ.get('MAX_WORKERS', 0)) or None
+MAX_STREAMS: int = int(os.environ.get('MAX_STREAMS', 0)) or None
+
+manager: SimulationManager = SimulationManager(
+    max_sessions=MAX_SESSIONS,
+    idle_timeout=SESSION_IDLE_TIMEOUT,
+    max_workers=MAX_WORKERS,
+    checkpoint_dir=SESSION_CHECKPOINT_DIR,
+    max_streams=MAX_STREAMS,
+)
 
-world_size: Tuple[int, int] = DEFAULT_WORLD_SIZE
-num_generations: int = DEFAULT_NUM_GENERATIONS
-lifespan: int = DEFAULT_LIFESPAN
-num_genes: int = DEFAULT_NUM_GENES
-mute_probability: float = DEFAULT_MUTE_PROBABILITY
-mate_probability: float = DEFAULT_MATE_PROBABILITY
-step_idx: int = 0
-generation_idx: int = 0
 
-current_coordinates: List[Tuple[int, int]] = None
-population: List[Individual] = None
-death_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]] = None
-safe_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]] = None
-heat_sources: List[Tuple[int, int]] = None
+def get_simulation() -> Simulation:
+    """Simulation of the session of the current request, pinned until the end of the request, see
+    `SimulationManager.get`."""
+    if 'simulation' not in g:
+        if 'simulation_id' not in session:
+            session['simulation_id'] = uuid.uuid4().hex
+        g.simulation = manager.get(session['simulation_id'])
+    return g.simulation
+
+
+@app.teardown_request
+def release_simulation(exception=None) -> None:
+    simulation = g.pop('simulation', None)
+    if simulation is not None:
+        manager.release(simulation)
+
+
+def population_response(simulation: Simulation, to_json: Callable[[], Any]) -> Response:
+    """JSON snapshot of the population, a binary frame for clients that accept `FRAME_MIMETYPE`, or a PNG image
+    of the world rendered on the server for clients that accept `PNG_MIMETYPE`.
+
+    Binary clients pass the palette version they have as the `palette_version` query arg, see `FrameEncoder`.
+    """
+    with simulation.lock:
+        mimetype = request.accept_mimetypes.best_match(['application/json', FRAME_MIMETYPE, PNG_MIMETYPE])
+        if mimetype == PNG_MIMETYPE:
+            return Response(
+                simulation.frame_encoder.render(
+                    genomes=simulation.genomes(),
+                    coords=np.asarray([ind.coords for ind in simulation.population], dtype=np.int64).reshape(-1, 2),
+                    world_size=simulation.world_size,
+                    survival_mask=simulation.survival_mask,
+                    heat_field=simulation.heat_field,
+                ),
+                mimetype=PNG_MIMETYPE,
+            )
+        if mimetype != FRAME_MIMETYPE:
+            return jsonify(to_json())
+        return Response(
+            simulation.frame_encoder.encode(
+                genomes=simulation.genomes(),
+                coords=np.asarray([ind.coords for ind in simulation.population], dtype=np.int64).reshape(-1, 2),
+                client_palette_version=request.args.get('palette_version', type=int),
+            ),
+            mimetype=FRAME_MIMETYPE,
+        )
 
 
 @app.route('/')
 def root():
-    global DEFAULT_NUM_GENERATIONS
-    global MAX_GENERATIONS
-    global DEFAULT_POP_SIZE
     return render_template(
         'root.html',
-        world_size=world_size,
+        world_size=get_simulation().world_size,
         gen_num=0,
         max_generations=MAX_GENERATIONS,
-        num_generations=DEFAULT_NUM_GENERATIONS,
+        num_generations=Simulation.DEFAULT_NUM_GENERATIONS,
         pop_size=DEFAULT_POP_SIZE,
     )
 
 
 @app.route('/update_population')
 def update_population():
-    global population
-    global current_coordinates
-    global lifespan
-    global world_size
-    global num_genes
-
-    population, current_coordinates = create_population(
-        population_size=int(request.args['pop_size']),
-        lifespan=lifespan,
-        world_size=world_size,
-        num_genes=num_genes,
+    simulation = get_simulation()
+    manager.run(simulation, simulation.reset_population, int(request.args['pop_size']))
+    return population_response(
+        simulation, lambda: [{'coords': ind.coords, 'color': ind.color} for ind in simulation.population],
     )
-    return jsonify([{'coords': ind.coords, 'color': ind.color} for ind in population])
 
 
 @app.route('/update_world_size')
 def update_world_size():
-    global world_size
-    global population
+    simulation = get_simulation()
     world_size = (int(request.args['worldY']), int(request.args['worldX']))
-    for ind in population:
-        ind.world_size = world_size
+    manager.run(simulation, simulation.set_world_size, world_size)
     return f"world_size={world_size}"
 
 
+@app.route('/update_boxes', methods=['POST'])
+def update_boxes():
+    simulation = get_simulation()
+    boxes = request.get_json()
+    safe_boxes = [tuple(map(tuple, box)) for box in boxes.get('safe_boxes') or []]
+    death_boxes = [tuple(map(tuple, box)) for box in boxes.get('death_boxes') or []]
+    manager.run(simulation, simulation.set_boxes, safe_boxes=safe_boxes, death_boxes=death_boxes)
+    return jsonify({'safe_boxes': safe_boxes, 'death_boxes': death_boxes})
+
+
+@app.route('/add_heat_source')
+def add_heat_source():
+    simulation = get_simulation()
+    heat_source = (int(request.args['row']), int(request.args['col']))
+    manager.run(simulation, simulation.heat_field.add_source, heat_source)
+    return jsonify(simulation.heat_field.heat_sources)
+
+
+@app.route('/remove_heat_source')
+def remove_heat_source():
+    simulation = get_simulation()
+    heat_source = (int(request.args['row']), int(request.args['col']))
+    if heat_source in simulation.heat_field.heat_sources:
+        manager.run(simulation, simulation.heat_field.remove_source, heat_source)
+    return jsonify(simulation.heat_field.heat_sources)
+
+
 @app.route('/update_lifespan')
 def update_lifespan():
-    global lifespan
-    global population
+    simulation = get_simulation()
     lifespan = int(request.args['lifespan'])
-    for ind in population:
-        ind.lifespan = lifespan
+    manager.run(simulation, simulation.set_lifespan, lifespan)
     return f"lifespan={lifespan}"
 
 
 @app.route('/update_num_genes')
 def update_num_genes():
-    global num_genes
-    global population
-    num_genes = int(request.args['num_genes'])
-    for ind in population:
-        ind.brain = Brain.init_random_genes(num_genes)
-        ind.express_color()
-    return jsonify([{'coords': ind.coords, 'color': ind.color} for ind in population])
+    simulation = get_simulation()
+    manager.run(simulation, simulation.set_num_genes, int(request.args['num_genes']))
+    return population_response(
+        simulation, lambda: [{'coords': ind.coords, 'color': ind.color} for ind in simulation.population],
+    )
 
 
 @app.route('/update_num_generations')
 def update_num_generations():
-    global num_generations
-    num_generations = int(request.args['num_generations'])
-    print(f"num_generations={num_generations}")
+    simulation = get_simulation()
+    simulation.num_generations = int(request.args['num_generations'])
+    return f"num_generations={simulation.num_generations}"
 
 
 @app.route('/update_mute_probability')
 def update_mute_probability():
-    global mute_probability
-    mute_probability = int(request.args['mute_probability'])
-    print(f"mute_probability={mute_probability}")
+    simulation = get_simulation()
+    simulation.mute_probability = int(request.args['mute_probability'])
+    return f"mute_probability={simulation.mute_probability}"
 
 
 @app.route('/update_mate_probability')
 def update_mate_probability():
-    global mate_probability
-    mate_probability = int(request.args['mate_probability'])
-    print(f"mate_probability={mate_probability}")
+    simulation = get_simulation()
+    simulation.mate_probability = int(request.args['mate_probability'])
+    return f"mate_probability={simulation.mate_probability}"
 
 
 @app.route('/update_generation_idx')
 def update_generation_idx():
-    global generation_idx
-    generation_idx = int(request.args['generation_idx'])
-    print(f"generation_idx={generation_idx}")
+    simulation = get_simulation()
+    simulation.generation_idx = int(request.args['generation_idx'])
+    return f"generation_idx={simulation.generation_idx}"
 
 
 @app.route('/update_step_idx')
 def update_step_idx():
-    global step_idx
-    step_idx = int(request.args['step_idx'])
-    print(f"step_idx={step_idx}")
+    simulation = get_simulation()
+    simulation.step_idx = int(request.args['step_idx'])
+    return f"step_idx={simulation.step_idx}"
+
+
+def checkpoint_path() -> str:
+    """Checkpoint file of the session of the current request for the `/save_checkpoint` and `/load_checkpoint`
+    routes, never chosen by the client, see `get_simulation`."""
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    return os.path.join(CHECKPOINT_DIR, f"{session['simulation_id']}.checkpoint.npz")
+
+
+@app.route('/save_checkpoint')
+def save_app_checkpoint():
+    simulation = get_simulation()
+    manager.run(simulation, simulation.save, checkpoint_path())
+    return jsonify({'generation_idx': simulation.generation_idx, 'step_idx': simulation.step_idx})
+
+
+@app.route('/load_checkpoint')
+def load_app_checkpoint():
+    simulation = get_simulation()
+    path = checkpoint_path()
+    if not os.path.exists(path):
+        return jsonify({'error': "No saved checkpoint."}), 404
+    manager.run(simulation, simulation.load, path)
+    with simulation.lock:
+        return jsonify({
+            'world_size': simulation.world_size,
+            'generation_idx': simulation.generation_idx,
+            'step_idx': simulation.step_idx,
+            'population': [{'coords': ind.coords, 'color': ind.color} for ind in simulation.population],
+        })
 
 
 @app.route('/evolve_step')
 def evolve_step():
-    global population
-    global current_coordinates
-    global lifespan
-    global world_size
-    global num_genes
-    global num_generations
-    global mute_probability
-    global mate_probability
-
-    population, current_coordinates = evolve(
-        population_size=len(population),
-        num_genes=num_genes,
-        world_size=world_size,
-        num_generations=num_generations,
-        lifespan=lifespan,
-        start_generation=int(request.args['generationIdx']),
-        end_generation=min(num_generations-1, int(request.args['generationIdx'])+1),
-        start_step=int(request.args['stepIdx']),
-        end_step=min(num_generations-1, int(request.args['stepIdx'])+1),
-        mute_probability=mute_probability,
-        mate_probability=mate_probability,
-        death_boxes=None,
-        safe_boxes=[
-            ((0,0), (20, 15))
-        ],
-        heat_sources=[],
-        population=population,
+    simulation = get_simulation()
+    manager.run(
+        simulation,
+        simulation.evolve_step,
+        generation_idx=int(request.args['generationIdx']),
+        step_idx=int(request.args['stepIdx']),
+    )
+    return population_response(
+        simulation,
+        lambda: [{'coords': ind.coords, 'hex_gene_sequence': ind.color} for ind in simulation.population],
+    )
+
+
+@app.route('/metrics')
+def get_metrics():
+    return jsonify({**get_simulation().metrics.summary(), 'brain_cache': BRAIN_CACHE.info()})
+
+
+@app.route('/sessions')
+def get_sessions():
+    return jsonify({'num_sessions': len(manager), 'max_sessions': manager.max_sessions})
+
+
+@app.route('/replay/<name>')
+def replay(name: str):
+    """Recorded steps of a trajectory of `RECORDINGS_DIR`, see `record_evolution`.
+
+    Query args: `start_generation`, `end_generation`, `start_step` and `end_step`. Returns the `generation`, `step`,
+    `individual` and `coords` columns of the entries of the range, and the hex genomes of its generations. Answers 400
+    if the range is not within the recorded generations and steps.
+    """
+    path = os.path.join(RECORDINGS_DIR, os.path.basename(name))
+    if not os.path.isdir(path):
+        return jsonify({'error': f"Unknown recording {name}."}), 404
+    trajectory = Trajectory(path)
+    start_generation = request.args.get('start_generation', trajectory.start_generation, type=int)
+    end_generation = request.args.get('end_generation', start_generation + 1, type=int)
+    start_step = request.args.get('start_step', 0, type=int)
+    end_step = request.args.get('end_step', trajectory.lifespan, type=int)
+    recorded_generations = (trajectory.start_generation, trajectory.start_generation + trajectory.num_generations)
+    if not (
+        recorded_generations[0] <= start_generation <= end_generation <= recorded_generations[1]
+        and 0 <= start_step <= end_step <= trajectory.lifespan
+    ):
+        return jsonify({'error': (
+            f"Range out of the recording: generations [{recorded_generations[0]}, {recorded_generations[1]}), "
+            f"steps [0, {trajectory.lifespan})."
+        )}), 400
+    entries = trajectory.entries(
+        start_generation=start_generation,
+        end_generation=end_generation,
+        start_step=start_step,
+        end_step=end_step,
+    )
+    return jsonify({
+        'world_size': trajectory.world_size,
+        **{column: values.tolist() for column, values in entries.items()},
+        'genomes': {
+            generation: [genes_to_hex(genes) for genes in trajectory.generation_genomes(generation)]
+            for generation in range(start_generation, end_generation)
+        },
+    })
+
+
+@app.route('/evolve_stream')
+def evolve_stream():
+    """Runs the whole simulation once and streams its frames as server-sent events.
+
+    Query args: `fps` (target frame rate), `steps_per_second` (maximum simulation speed, defaults to `fps`), `seed`
+    and `format`. Frames are dropped when the client can not keep up. With `format=binary` the individuals of every
+    frame are sent as a base64 encoded `FrameEncoder` frame, with the palette only when the genomes change. With
+    `format=png` every frame is a base64 encoded PNG image of the world rendered on the server. The simulation runs on
+    the stream pool of the session manager, see `SimulationManager.submit_stream`. The session must have a population,
+    see `/update_population`.
+    """
+    simulation = get_simulation()
+    fps = float(request.args.get('fps', DEFAULT_FPS))
+    steps_per_second = float(request.args.get('steps_per_second', fps))
+    seed = request.args.get('seed')
+    frame_format = request.args.get('format')
+    stream_frame_encoder = FrameEncoder()
+    with simulation.lock:
+        if not simulation.population:
+            return jsonify({'error': "No population, see /update_population."}), 400
+        steps = simulation.iter_steps(seed=None if seed is None else int(seed))
+
+    def encode(gen_i: int, step_i: int, population: Population) -> Dict:
+        alive = np.flatnonzero(population.alive)
+        if frame_format == 'png':
+            return {
+                'generation': gen_i,
+                'step': step_i,
+                'png': base64.b64encode(stream_frame_encoder.render(
+                    population.genomes,
+                    population.coords,
+                    world_size=simulation.world_size,
+                    indices=alive,
+                    survival_mask=simulation.survival_mask,
+                    heat_field=simulation.heat_field,
+                )).decode(),
+            }
+        if frame_format == 'binary':
+            return {
+                'generation': gen_i,
+                'step': step_i,
+                'frame': base64.b64encode(
+                    stream_frame_encoder.encode(population.genomes, population.coords, indices=alive)
+                ).decode(),
+            }
+        colors = population.hex_gene_sequences
+        return {
+            'generation': gen_i,
+            'step': step_i,
+            'individuals': [
+                {'coords': coords, 'color': colors[i]}
+                for i, coords in zip(alive.tolist(), population.coords[alive].tolist())
+            ],
+        }
+
+    return Response(
+        stream_with_context(stream_simulation(
+            steps,
+            encode,
+            fps=fps,
+            steps_per_second=steps_per_second,
+            submit=lambda func, *args: manager.submit_stream(simulation, func, *args),
+        )),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
     )
-    return jsonify([{'coords': ind.coords, 'hex_gene_sequence': ind.brain.hex_gene_sequence} for ind in population])
 
 
 @app.route('/grid')
@@ -187,4 +382,4 @@ def favicon():
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=8080, debug=True)
@@ -0,0 +1,518 @@
+import os
+import numpy as np
+import multiprocessing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from evolution import generation_record, log_info, select_next_generation
+from objects.genome import mutate_genomes, random_genomes, reproduce
+from objects.heat import HeatField, SparseHeatField
+from objects.population import Population
+from objects.world import DENSE_MAX_CELLS, OccupancyGrid, SparseOccupancyGrid, compile_survival_mask, sample_coordinates
+
+
+class TileOccupancy(OccupancyGrid):
+    """Occupancy grid of a window of the world: a tile and the one cell wide halo around it.
+
+    Coordinates are world coordinates and bounds checks are done against the whole world, so it can be used wherever
+    an `OccupancyGrid` of the whole world is, as long as only the cells of the window are looked up. Halo cells are
+    occupied by `HALO`.
+
+    Args:
+        world_size (Tuple[int, int]): size of the 2-D world.
+        origin (Tuple[int, int]): top left cell of the window.
+        shape (Tuple[int, int]): size of the window.
+    """
+
+    HALO: int = -2
+
+    def __init__(self, world_size: Tuple[int, int], origin: Tuple[int, int], shape: Tuple[int, int]) -> None:
+        self.world_size = tuple(world_size)
+        self.origin = np.asarray(origin, dtype=np.int64)
+        self.grid = np.full(shape, self.EMPTY, dtype=np.int64)
+
+    def place_many(self, coords: np.ndarray, occupant_ids: Optional[np.ndarray] = None) -> None:
+        super().place_many(coords - self.origin, occupant_ids)
+
+    def remove_many(self, coords: np.ndarray) -> None:
+        super().remove_many(coords - self.origin)
+
+    def occupants(self, coords: np.ndarray) -> np.ndarray:
+        inside = self.in_bounds_many(coords)
+        occupants = np.full(len(coords), self.EMPTY, dtype=np.int64)
+        local_coords = coords[inside] - self.origin
+        occupants[inside] = self.grid[local_coords[:, 0], local_coords[:, 1]]
+        return occupants
+
+
+class TileHeatField(HeatField):
+    """Heat risk field of a window of the world, looked up with world coordinates.
+
+    Args:
+        origin (Tuple[int, int]): top left cell of the window.
+        shape (Tuple[int, int]): size of the window.
+        heat_sources (List[Tuple[int, int]]): heat sources of the world.
+    """
+
+    def __init__(self, origin: Tuple[int, int], shape: Tuple[int, int], heat_sources: List[Tuple[int, int]]) -> None:
+        self.origin = np.asarray(origin, dtype=np.int64)
+        super().__init__(shape, heat_sources=[(row - origin[0], col - origin[1]) for row, col in heat_sources])
+
+    def risk(self, coords: np.ndarray) -> np.ndarray:
+        return super().risk(coords - self.origin)
+
+    def is_burning(self, coords: np.ndarray) -> np.ndarray:
+        return super().is_burning(coords - self.origin)
+
+
+class Tile():
+    """Part of the world stepped by one worker process.
+
+    The tile keeps the individuals standing on it as a `Population` with world coordinates, plus their global ids,
+    and one occupancy grid of the tile and its halo, updated in place with the cells that change. Tiles larger than
+    `DENSE_MAX_CELLS` cells use a `SparseOccupancyGrid` and a `SparseHeatField`, so their memory grows with the
+    individuals on them instead of with their area.
+    Every step is split in two calls so that the tiles can exchange data in between, see `run_domains`:
+    - `propose`: senses the world, with the halo of occupied cells of the neighbour tiles, and runs the brains. Moves
+      to interior cells, which no other tile can claim, are applied right away. Moves to shared cells, the cells on
+      the border of a tile next to another tile, are returned as claims.
+    - `apply`: applies the claims won by the tile individuals and adds the individuals that moved in from other tiles.
+
+    Args:
+        bounds (Tuple[Tuple[int, int], Tuple[int, int]]): ((top, left), (bottom, right)) cells of the tile, bottom and
+            right excluded.
+        world_size (Tuple[int, int]): size of the 2-D world.
+        lifespan (int): number of steps of every generation.
+        heat_sources (List[Tuple[int, int]]): heat sources of the world.
+        seed (np.random.SeedSequence): seed of the random neurons of the tile.
+    """
+
+    def __init__(
+        self,
+        bounds: Tuple[Tuple[int, int], Tuple[int, int]],
+        world_size: Tuple[int, int],
+        lifespan: int,
+        heat_sources: List[Tuple[int, int]],
+        seed: np.random.SeedSequence,
+    ) -> None:
+        (self.top, self.left), (self.bottom, self.right) = bounds
+        self.world_size = tuple(world_size)
+        self.lifespan = lifespan
+        self.rng = np.random.default_rng(seed)
+        self.origin = (max(self.top - 1, 0), max(self.left - 1, 0))
+        self.shape = (
+            min(self.bottom + 1, self.world_size[0]) - self.origin[0],
+            min(self.right + 1, self.world_size[1]) - self.origin[1],
+        )
+        if self.shape[0]*self.shape[1] <= DENSE_MAX_CELLS:
+            self.occupancy = TileOccupancy(self.world_size, self.origin, self.shape)
+            self.heat_field = TileHeatField(self.origin, self.shape, heat_sources)
+        else:
+            self.occupancy = SparseOccupancyGrid(self.world_size)
+            self.heat_field = SparseHeatField(self.world_size, heat_sources)
+        self.halo = np.zeros((0, 2), dtype=np.int64)
+        self.population = None
+        self.ids = None
+
+    def in_tile(self, coords: np.ndarray) -> np.ndarray:
+        return (
+            (coords[:, 0] >= self.top) & (coords[:, 0] < self.bottom)
+            & (coords[:, 1] >= self.left) & (coords[:, 1] < self.right)
+        )
+
+    def shared(self, coords: np.ndarray) -> np.ndarray:
+        """Whether each cell can be claimed by the individuals of another tile: it is out of the tile, or on a border
+        of the tile that is not a wall of the world."""
+        return (
+            ~self.in_tile(coords)
+            | ((coords[:, 0] == self.top) & (self.top > 0))
+            | ((coords[:, 0] == self.bottom - 1) & (self.bottom < self.world_size[0]))
+            | ((coords[:, 1] == self.left) & (self.left > 0))
+            | ((coords[:, 1] == self.right - 1) & (self.right < self.world_size[1]))
+        )
+
+    def reset(self, genomes: np.ndarray, coords: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Starts a generation with the given individuals, returns the border cells, see `border`."""
+        if self.population is not None:
+            self.occupancy.remove_many(self.population.coords[self.population.alive & (self.ids >= 0)])
+        self.population = Population(genomes=genomes, coords=coords, lifespan=self.lifespan, world_size=self.world_size)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.occupancy.place_many(self.population.coords, np.arange(len(self.population)))
+        return self.border()
+
+    def border(self) -> np.ndarray:
+        """Cells of the tile that are in the halo of another tile and are occupied by an individual that is not about
+        to be burnt, as every individual senses the world after the burnt ones are removed."""
+        present = self.population.alive & (self.ids >= 0)
+        coords = self.population.coords[present]
+        coords = coords[self.shared(coords)]
+        if self.heat_field:
+            burnt = self.heat_field.is_burning(coords) | (self.heat_field.risk(coords) > Population.HEAT_RISK_THRESHOLD)
+            coords = coords[~burnt]
+        return coords
+
+    def propose(self, halo: np.ndarray) -> Dict[str, np.ndarray]:
+        """First half of a step.
+
+        Args:
+            halo (np.ndarray): (n, 2) occupied cells of the halo of the tile.
+
+        Returns:
+            Dict[str, np.ndarray]: claims on shared cells: `ids` and (n, 2) `targets`, plus the `genomes` and `steps` of
+                the claimants, sent along in case they move to another tile.
+        """
+        population = self.population
+        # halo cells are never taken by the individuals of the tile, the ones that leave are removed, see `apply`
+        self.occupancy.remove_many(self.halo)
+        self.halo = halo
+        self.occupancy.place_many(halo, np.full(len(halo), TileOccupancy.HALO))
+
+        indices, input_vectors = population.sense_env(occupancy=self.occupancy, heat_field=self.heat_field, rng=self.rng)
+        output = population.output(indices, input_vectors)
+        population.steps[indices] += 1
+
+        # a move is valid if the target cell is inside the world and was free before anyone moved
+        coords = population.coords[indices]
+        targets = coords + np.sign(output[:, :2]).astype(np.int64)
+        valid = (targets != coords).any(axis=1) & self.occupancy.free(targets)
+        shared = self.shared(targets)
+
+        # interior cells are only claimed by individuals of this tile, the lowest global id wins
+        local = np.flatnonzero(valid & ~shared)
+        flat_targets = targets[local, 0]*self.world_size[1] + targets[local, 1]
+        order = np.lexsort((self.ids[indices[local]], flat_targets))
+        _, first = np.unique(flat_targets[order], return_index=True)
+        movers = local[order[first]]
+        self.move(indices[movers], targets[movers])
+
+        claims = indices[valid & shared]
+        return {
+            'ids': self.ids[claims],
+            'targets': targets[valid & shared],
+            'genomes': population.genomes[claims],
+            'steps': population.steps[claims],
+        }
+
+    def move(self, indices: np.ndarray, targets: np.ndarray) -> None:
+        self.occupancy.remove_many(self.population.coords[indices])
+        self.occupancy.place_many(targets, indices)
+        self.population.coords[indices] = targets
+
+    def apply(
+        self,
+        move_ids: np.ndarray,
+        move_targets: np.ndarray,
+        departure_ids: np.ndarray,
+        arrivals: Dict[str, np.ndarray],
+    ) -> np.ndarray:
+        """Second half of a step.
+
+        Args:
+            move_ids (np.ndarray): ids of the tile individuals that won a claim on a cell of the tile.
+            move_targets (np.ndarray): (n, 2) cells they won.
+            departure_ids (np.ndarray): ids of the tile individuals that won a claim on a cell of another tile.
+            arrivals (Dict[str, np.ndarray]): claims of individuals of other tiles won on cells of this tile.
+
+        Returns:
+            np.ndarray: border cells of the tile after the step, see `border`.
+        """
+        order = np.argsort(self.ids)
+        local_indices = lambda ids: order[np.searchsorted(self.ids, ids, sorter=order)]
+        self.move(local_indices(move_ids), move_targets)
+
+        # individuals that left keep their slot until the end of the generation, with no id
+        departures = local_indices(departure_ids)
+        self.occupancy.remove_many(self.population.coords[departures])
+        self.population.alive[departures] = False
+        self.ids[departures] = -1
+
+        if len(arrivals['ids']):
+            self.occupancy.place_many(arrivals['targets'], len(self.population) + np.arange(len(arrivals['ids'])))
+            self.population = Population.concatenate([
+                self.population,
+                Population(
+                    genomes=arrivals['genomes'],
+                    coords=arrivals['targets'],
+                    lifespan=self.lifespan,
+                    world_size=self.world_size,
+                    steps=arrivals['steps'],
+                ),
+            ])
+            self.ids = np.concatenate([self.ids, arrivals['ids']])
+        return self.border()
+
+    def gather(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Ids, genomes, coordinates and alive flags of the individuals standing on the tile."""
+        present = self.ids >= 0
+        population = self.population
+        return self.ids[present], population.genomes[present], population.coords[present], population.alive[present]
+
+
+def run_tile(connection: Any, *args) -> None:
+    """Worker process of a tile: runs the methods of a `Tile` sent through `connection` until it gets `None`."""
+    tile = Tile(*args)
+    while True:
+        call = connection.recv()
+        if call is None:
+            break
+        method, method_args = call
+        connection.send(getattr(tile, method)(*method_args))
+    connection.close()
+
+
+def next_generation(
+    genomes: np.ndarray,
+    survived: np.ndarray,
+    population_size: int,
+    mate_probability: Optional[float],
+    mute_probability: Optional[float],
+    rng: np.random.Generator,
+) -> Tuple[np.ndarray, int, int, str]:
+    """Survival, mating and mutation rules of `iter_evolve_vectorized`, on genomes only, see
+    `select_next_generation`.
+
+    Args:
+        genomes (np.ndarray): (N, num_genes) genomes of the generation.
+        survived (np.ndarray): whether each individual survived.
+        population_size (int): maximum size of the next generation.
+        mate_probability (Optional[float]): probability of each pair of survivors mating.
+        mute_probability (Optional[float]): probability of muting each hex digit.
+        rng (np.random.Generator): random generator.
+
+    Returns:
+        Tuple[np.ndarray, int, int, str]: genomes of the next generation, number of survivors, number of children and
+            survival type.
+    """
+    survivors = genomes[survived]
+    num_survivors = len(survivors)
+    children = reproduce(survivors, mate_probability=mate_probability, max_children=population_size, rng=rng)
+    num_children = len(children)
+    indices, _, survival_type = select_next_generation(
+        num_children, num_survivors, population_size=population_size, rng=rng,
+    )
+    genomes = np.concatenate([children, survivors])[indices]
+    if mute_probability:
+        mutate_genomes(genomes, mute_probability=mute_probability, rng=rng)
+    return genomes, num_survivors, num_children, survival_type
+
+
+class TileGrid():
+    """Grid of (rows, cols) tiles of about the same size covering the world, numbered row by row.
+
+    The main process uses it to route data between the tiles: the individuals of a new generation, the halos and the
+    claims on shared cells, see `Tile`.
+
+    Args:
+        world_size (Tuple[int, int]): size of the 2-D world.
+        tiles (Tuple[int, int]): rows and columns of the grid.
+    """
+
+    def __init__(self, world_size: Tuple[int, int], tiles: Tuple[int, int]) -> None:
+        self.world_size = tuple(world_size)
+        self.tiles = tuple(tiles)
+        row_edges = np.linspace(0, world_size[0], tiles[0] + 1).astype(np.int64)
+        col_edges = np.linspace(0, world_size[1], tiles[1] + 1).astype(np.int64)
+        self.row_edges, self.col_edges = row_edges[1:-1], col_edges[1:-1]
+        self.bounds = [
+            ((int(row_edges[i]), int(col_edges[j])), (int(row_edges[i + 1]), int(col_edges[j + 1])))
+            for i in range(tiles[0])
+            for j in range(tiles[1])
+        ]
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    def tile_of(self, coords: np.ndarray) -> np.ndarray:
+        """Tile of each of an (N, 2) array of cells."""
+        return (
+            np.searchsorted(self.row_edges, coords[:, 0], side='right')*self.tiles[1]
+            + np.searchsorted(self.col_edges, coords[:, 1], side='right')
+        )
+
+    def scatter(self, genomes: np.ndarray, coords: np.ndarray) -> List[Tuple]:
+        """`Tile.reset` arguments of every tile, the global id of every individual is its index."""
+        owners = self.tile_of(coords)
+        ids = np.arange(len(genomes))
+        return [(genomes[owners == i], coords[owners == i], ids[owners == i]) for i in range(len(self))]
+
+    def halos(self, borders: List[np.ndarray]) -> List[Tuple]:
+        """`Tile.propose` arguments of every tile: the border cells of the other tiles around it."""
+        cells = np.concatenate(borders).reshape(-1, 2)
+        owners = self.tile_of(cells)
+        return [
+            (cells[
+                (owners != i)
+                & (cells[:, 0] >= top - 1) & (cells[:, 0] <= bottom)
+                & (cells[:, 1] >= left - 1) & (cells[:, 1] <= right)
+            ],)
+            for i, ((top, left), (bottom, right)) in enumerate(self.bounds)
+        ]
+
+    def resolve(self, claims: List[Dict[str, np.ndarray]]) -> List[Tuple]:
+        """Resolves the claims of every tile on shared cells, see `Tile.propose`.
+
+        Each cell goes to the claimant with the lowest global id, the rule `Population.move` applies to the whole
+        world.
+
+        Returns:
+            List[Tuple]: `Tile.apply` arguments of every tile.
+        """
+        origins = np.concatenate([np.full(len(tile_claims['ids']), i) for i, tile_claims in enumerate(claims)])
+        ids = np.concatenate([tile_claims['ids'] for tile_claims in claims])
+        targets = np.concatenate([tile_claims['targets'] for tile_claims in claims]).reshape(-1, 2)
+        genomes = np.concatenate([tile_claims['genomes'] for tile_claims in claims])
+        steps = np.concatenate([tile_claims['steps'] for tile_claims in claims])
+
+        flat_targets = targets[:, 0]*self.world_size[1] + targets[:, 1]
+        order = np.lexsort((ids, flat_targets))
+        _, first = np.unique(flat_targets[order], return_index=True)
+        winners = order[first]
+        owners = self.tile_of(targets[winners])
+        origins = origins[winners]
+
+        arguments = []
+        for i in range(len(claims)):
+            stays = winners[(origins == i) & (owners == i)]
+            leaves = winners[(origins == i) & (owners != i)]
+            arrives = winners[(origins != i) & (owners == i)]
+            arguments.append((
+                ids[stays],
+                targets[stays],
+                ids[leaves],
+                {'ids': ids[arrives], 'targets': targets[arrives], 'genomes': genomes[arrives], 'steps': steps[arrives]},
+            ))
+        return arguments
+
+
+def run_domains(
+    population_size: int,
+    num_genes: int,
+    world_size: Tuple[int, int],
+    num_generations: int,
+    lifespan: int,
+    tiles: Optional[Tuple[int, int]] = None,
+    mute_probability: Optional[float] = None,
+    mate_probability: Optional[float] = None,
+    death_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]] = None,
+    safe_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]] = None,
+    heat_sources: List[Tuple[int, int]] = [],
+    seed: Optional[int] = None,
+    on_generation: Optional[Callable[[Dict[str, Any]], None]] = None,
+    verbosity: str = 'v',
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Spatial domain decomposition of `evolve_vectorized`, for very large worlds.
+
+    The world is split into a grid of tiles and every tile is stepped by its own worker process, see `Tile`. Each step
+    the tiles exchange the occupied cells of their borders (the halo), so every individual senses the world as it was
+    at the beginning of the step. Moves to cells on the border between tiles are resolved by the main process with
+    the rule of `Population.move`: the cell must have been free before anyone moved, and the individual with the
+    lowest global id wins. The steps are therefore the ones of `evolve_vectorized`, apart from the random neurons,
+    drawn by each tile with its own generator: a run is reproducible for a given `seed` and tile grid.
+
+    At the end of every generation the genomes are gathered in the main process, where survival, mating and mutation
+    run on genomes only, see `next_generation`, and the new generation is scattered to the tiles.
+
+    Args:
+        population_size (int): number of individuals.
+        num_genes (int): number of genes of every individual.
+        world_size (Tuple[int, int]): size of the 2-D world.
+        num_generations (int): number of generations to evolve.
+        lifespan (int): number of steps of every generation.
+        tiles (Optional[Tuple[int, int]]): rows and columns of the tile grid. Defaults to a row of tiles per core.
+        mute_probability (Optional[float]): probability of muting each hex digit.
+        mate_probability (Optional[float]): probability of each pair of survivors mating.
+        death_boxes (List[Tuple[Tuple[int, int], Tuple[int, int]]]): death boxes.
+        safe_boxes (List[Tuple[Tuple[int, int], Tuple[int, int]]]): safe boxes.
+        heat_sources (List[Tuple[int, int]]): heat sources.
+        seed (Optional[int]): seed of the run.
+        on_generation (Optional[Callable[[Dict[str, Any]], None]]): called at the end of every generation with a
+            record of it, see `generation_record`.
+        verbosity (str): verbosity level, 'v' logs every generation.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: genomes and coordinates of the next generation, as `evolve_vectorized`.
+    """
+    verbosity_level = 0 if not verbosity else len(verbosity)
+    tiles = tiles or (min(os.cpu_count() or 1, world_size[0]), 1)
+    seed_sequence = np.random.SeedSequence(seed)
+    rng = np.random.default_rng(seed_sequence.spawn(1)[0])
+    survival_mask = compile_survival_mask(world_size, safe_boxes=safe_boxes, death_boxes=death_boxes)
+    grid = TileGrid(world_size, tiles)
+
+    def call(method: str, arguments: List[Tuple]) -> List[Any]:
+        for connection, tile_arguments in zip(connections, arguments):
+            connection.send((method, tile_arguments))
+        return [connection.recv() for connection in connections]
+
+    connections, processes = [], []
+    for tile_bounds, tile_seed in zip(grid.bounds, seed_sequence.spawn(len(grid))):
+        connection, worker_connection = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=run_tile,
+            args=(worker_connection, tile_bounds, world_size, lifespan, list(heat_sources), tile_seed),
+            daemon=True,
+        )
+        process.start()
+        connections.append(connection)
+        processes.append(process)
+
+    try:
+        genomes = random_genomes(population_size, num_genes, rng=rng)
+        coords = sample_coordinates(population_size, world_size, rng=rng)
+        for gen_i in range(num_generations):
+            borders = call('reset', grid.scatter(genomes, coords))
+            for _ in range(lifespan):
+                claims = call('propose', grid.halos(borders))
+                borders = call('apply', grid.resolve(claims))
+
+            ids, genomes, coords, alive = (np.concatenate(column) for column in zip(*call('gather', [()]*len(grid))))
+            order = np.argsort(ids)
+            genomes, coords, alive = genomes[order], coords[order], alive[order]
+            generation_size = len(genomes)
+
+            survived = alive & survival_mask[coords[:, 0], coords[:, 1]]
+            genomes, num_survivors, num_children, survival_type = next_generation(
+                genomes,
+                survived,
+                population_size=population_size,
+                mate_probability=mate_probability,
+                mute_probability=mute_probability,
+                rng=rng,
+            )
+            coords = sample_coordinates(len(genomes), world_size, rng=rng)
+            if on_generation:
+                on_generation(generation_record(
+                    generation=gen_i,
+                    generation_size=generation_size,
+                    num_survivors=num_survivors,
+                    num_children=num_children,
+                    survival_type=survival_type,
+                ))
+            log_info(
+                f"Gen {gen_i + 1}/{num_generations}, survivors: {num_survivors}/{generation_size}, {survival_type}",
+                1,
+                verbosity_level,
+            )
+            if len(genomes) == 0:
+                log_info("Evolution did not succeed.", 1, verbosity_level)
+                break
+    finally:
+        for connection in connections:
+            connection.send(None)
+        for process in processes:
+            process.join()
+
+    return genomes, coords
+
+
+if __name__ == '__main__':
+    run_domains(
+        population_size=20000,
+        num_genes=12,
+        world_size=(1000, 1000),
+        num_generations=5,
+        lifespan=100,
+        tiles=(2, 2),
+        mute_probability=0.0005,
+        mate_probability=0.7,
+        safe_boxes=[((0, 0), (500, 500))],
+        seed=0,
+    )
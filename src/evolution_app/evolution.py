@@ -2,10 +2,18 @@ import copy
 import time
 import json
 import numpy as np
-import random
-from itertools import product, combinations
-from typing import List, Tuple, Optional
-from objects.individual import Individual, mate
+from typing import Any, Callable, Dict, Generator, List, Tuple, Optional, Union
+from objects.brain import Brain
+from objects.checkpoint import load_checkpoint, save_checkpoint
+from objects.genome import random_genomes, reproduce
+from objects.heat import HeatField, create_heat_field
+from objects.individual import Individual
+from objects.lineage import Lineage
+from objects.metrics import MetricsCollector, NULL_METRICS
+from objects.population import Population
+from objects.statistics import StatisticsLog, generation_statistics
+from objects.trajectory import TrajectoryRecorder
+from objects.world import OccupancyGrid, compile_survival_mask, create_occupancy_grid, sample_coordinates
 
 
 def log_info(msg, min_verbosity, verbosity_level):
@@ -16,13 +24,9 @@ def log_info(msg, min_verbosity, verbosity_level):
 def randomize_coordinates(
     pop_size: int,
     world_size: Tuple[int, int],
+    rng: Optional[np.random.Generator] = None,
 ) -> List[Tuple[int, int]]:
-    every_coord = [coord for coord in product(range(world_size[0]), range(world_size[1]))]
-    if pop_size > len(every_coord):
-        raise Exception(f"Population size of {pop_size} is too big for a {world_size} world.")
-    else:
-        random.shuffle(every_coord)
-        return every_coord[:pop_size]
+    return [tuple(coords) for coords in sample_coordinates(pop_size, world_size, rng=rng).tolist()]
 
 
 def create_population(
@@ -30,23 +34,25 @@ def create_population(
     lifespan: int,
     world_size: Tuple[int, int],
     num_genes: Optional[int] = None,
+    rng: Optional[np.random.Generator] = None,
 ) -> List[Individual]:
-    coordinates = randomize_coordinates(population_size, world_size)
+    coordinates = randomize_coordinates(population_size, world_size, rng=rng)
+    genomes = random_genomes(population_size, num_genes or Individual.DEFAULT_NUM_GENES, rng=rng)
     return [
         Individual(
-            individual_id=f'individual_gen0_{i}',
+            individual_id=i,
             lifespan=lifespan,
             world_size=world_size,
             initial_coords=coords,
-            num_genes=num_genes,
+            brain=Brain(genes=genes),
         )
-        for i, coords in zip(range(population_size), coordinates)
+        for i, (coords, genes) in enumerate(zip(coordinates, genomes))
     ], coordinates
 
 
 def print_status(
     world_size,
-    current_coordinates,
+    current_coordinates: OccupancyGrid,
     heat_sources = [],
     message='',
 ):
@@ -74,6 +80,65 @@ def is_in_box(
     )
 
 
+def generation_record(
+    generation: int,
+    generation_size: int,
+    num_survivors: int,
+    num_children: int,
+    survival_type: str,
+) -> Dict[str, Any]:
+    """Summary of a generation passed to the `on_generation` callback of `evolve`."""
+    return {
+        'generation': generation,
+        'population_size': generation_size,
+        'num_survivors': num_survivors,
+        'num_children': num_children,
+        'survival_rate': num_survivors/generation_size,
+        'survival_type': survival_type,
+    }
+
+
+def select_next_generation(
+    num_children: int,
+    num_survivors: int,
+    population_size: int,
+    rng: np.random.Generator,
+) -> Tuple[np.ndarray, int, str]:
+    """Survival rules of every engine: which children and survivors make up the next generation.
+
+    The children, in random order, come first. If there are fewer than `population_size`, random survivors fill the
+    rest, and if there are still too few individuals, half of the missing ones are clones of the first children and
+    the other half clones of the survivors.
+
+    Args:
+        num_children (int): number of children.
+        num_survivors (int): number of survivors.
+        population_size (int): maximum size of the next generation.
+        rng (np.random.Generator): random generator.
+
+    Returns:
+        Tuple[np.ndarray, int, str]: indices of the next generation in the concatenation of the children and the
+            survivors, number of clones at the end of it and survival type.
+    """
+    children = rng.permutation(num_children)
+    survivors = num_children + np.arange(num_survivors)
+    if num_children >= population_size:
+        return children[:population_size], 0, 'only new'
+    if num_survivors + num_children >= population_size:
+        survivors = survivors[rng.permutation(num_survivors)[:population_size-num_children]]
+        return np.concatenate([children, survivors]), 0, 'new and some old'
+
+    survivors = survivors[rng.permutation(num_survivors)]
+    individuals_left = population_size - num_children - num_survivors
+    generations = [children, survivors]
+    if num_children > 0:
+        generations.append(children[np.arange(int(np.ceil(individuals_left/2))) % num_children])
+    if num_survivors > 0:
+        generations.append(survivors[np.arange(int(individuals_left/2)) % num_survivors])
+    indices = np.concatenate(generations)
+    return indices, len(indices) - num_children - num_survivors, 'cloned'
+
+
 def evolve(
     population_size: int,
     num_genes: int,
@@ -88,25 +153,80 @@ def evolve(
     mate_probability: Optional[float] = None,
     death_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]] = None,
     safe_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]] = None,
+    survival_mask: Optional[np.ndarray] = None,
     heat_sources: Tuple[int, int] = [],
+    heat_field: Optional[HeatField] = None,
     population: List[Individual] = None,
-    verbosity: str = 'v'
+    verbosity: str = 'v',
+    vectorized: bool = False,
+    seed: Optional[int] = None,
+    on_generation: Optional[Callable[[Dict[str, Any]], None]] = None,
+    metrics: Optional[MetricsCollector] = None,
+    rng: Optional[np.random.Generator] = None,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_interval: int = 1,
+    recorder: Optional[TrajectoryRecorder] = None,
+    statistics: Optional[StatisticsLog] = None,
+    lineage: Optional[Lineage] = None,
 ):
+    if recorder and not vectorized:
+        raise Exception("Trajectories can only be recorded with the vectorized engine.")
+    if statistics and not vectorized:
+        raise Exception("Statistics can only be logged with the vectorized engine.")
+    if lineage and not vectorized:
+        raise Exception("Lineages can only be recorded with the vectorized engine.")
+    if vectorized:
+        return evolve_vectorized(
+            population_size=population_size,
+            num_genes=num_genes,
+            world_size=world_size,
+            num_generations=num_generations,
+            lifespan=lifespan,
+            start_generation=start_generation,
+            end_generation=end_generation,
+            start_step=start_step,
+            end_step=end_step,
+            mute_probability=mute_probability,
+            mate_probability=mate_probability,
+            death_boxes=death_boxes,
+            safe_boxes=safe_boxes,
+            survival_mask=survival_mask,
+            heat_sources=heat_sources,
+            heat_field=heat_field,
+            population=population,
+            verbosity=verbosity,
+            seed=seed,
+            on_generation=on_generation,
+            metrics=metrics,
+            rng=rng,
+            checkpoint_path=checkpoint_path,
+            checkpoint_interval=checkpoint_interval,
+            recorder=recorder,
+            statistics=statistics,
+            lineage=lineage,
+        )
+
     assert(not verbosity or (len(verbosity) <= 3 and all([e == 'v' for e in verbosity])))
     verbosity_level = 0 if not verbosity else len(verbosity)
 
     end_step = end_step or lifespan
     end_generation = end_generation or num_generations
+    if survival_mask is None:
+        survival_mask = compile_survival_mask(world_size, safe_boxes=safe_boxes, death_boxes=death_boxes)
+    if heat_field is None:
+        heat_field = create_heat_field(world_size, heat_sources=heat_sources)
+    metrics = metrics or NULL_METRICS
+    rng = rng or np.random.default_rng(seed)
     if not population:
-        population, current_coordinates = create_population(
+        population, _ = create_population(
             population_size=population_size,
             lifespan=lifespan,
             world_size=world_size,
             num_genes=num_genes,
+            rng=rng,
         )
-    else:
-        current_coordinates = [ind.coords for ind in population]
-    
+    next_id = max((ind.id for ind in population), default=-1) + 1
+
     last_survival_rate = 1
     last_survival_type = 'Only new'
     for gen_i in range(start_generation, end_generation):
@@ -115,20 +235,24 @@ def evolve(
             log_info("Evolution did not succeed.", 1, verbosity_level)
             break
 
+        occupancy = create_occupancy_grid(world_size, [ind.coords for ind in population])
         for step_i in range(start_step, end_step):
             for ind in population:
-                ind.sense_env(mate_coordinates=current_coordinates, heat_sources=heat_sources)
+                with metrics.phase('sensing'):
+                    ind.sense_env(occupancy=occupancy, heat_field=heat_field, rng=rng)
                 if ind.alive is False:
-                    population.remove(ind)
+                    occupancy.remove(ind.coords)
                 else:
-                    _ = ind.take_step(mate_coordinates=current_coordinates)
-                current_coordinates = [e.coords for e in population]
+                    with metrics.phase('movement'):
+                        _ = ind.take_step(occupancy=occupancy)
+            metrics.count('individuals_processed', len(population))
+            population = [ind for ind in population if ind.alive]
             if verbosity_level >= 3:
                 time.sleep(0.05)
                 print_status(
                     world_size=world_size,
-                    current_coordinates=current_coordinates,
-                    heat_sources=heat_sources,
+                    current_coordinates=occupancy,
+                    heat_sources=heat_field,
                     message=(
                         f" Gen {gen_i}/{num_generations}, "
                         f"step {step_i}/{lifespan}, "
@@ -142,71 +266,379 @@ def evolve(
             continue
 
         # we remove the dead individuals
-        survivors = [
-            ind
-            for ind in population
-            if ind.alive
-            and (
-                (not safe_boxes or any([is_in_box(ind.coords, safe_box) for safe_box in (safe_boxes)]))
-                and (not death_boxes or not any([is_in_box(ind.coords, death_box) for death_box in (death_boxes)]))
+        with metrics.phase('survivor_selection'):
+            coordinates = np.asarray([ind.coords for ind in population], dtype=np.int64).reshape(-1, 2)
+            survived = survival_mask[coordinates[:, 0], coordinates[:, 1]]
+            survivors = [ind for ind, ind_survived in zip(population, survived) if ind_survived]
+        num_survivors = len(survivors)
+        last_survival_rate = num_survivors/generation_size
+
+        # survivors mate to create individuals for the next generation
+        with metrics.phase('mating'):
+            new_generation = []
+            if survivors:
+                new_generation = [
+                    Individual(
+                        individual_id=next_id + i,
+                        lifespan=lifespan,
+                        world_size=world_size,
+                        brain=Brain(genes=genes),
+                    )
+                    for i, genes in enumerate(reproduce(
+                        np.stack([ind.brain.genes for ind in survivors]),
+                        mate_probability=mate_probability,
+                        max_children=population_size,
+                        rng=rng,
+                    ))
+                ]
+        num_children = len(new_generation)
+        next_id += num_children
+        metrics.count('matings', -(-num_children//2))
+        metrics.count('children', num_children)
+
+        indices, num_clones, last_survival_type = select_next_generation(
+            num_children, num_survivors, population_size=population_size, rng=rng,
+        )
+        candidates = new_generation + survivors
+        population = [candidates[i] for i in indices[:len(indices) - num_clones]]
+        for i in indices[len(indices) - num_clones:]:
+            clone = copy.copy(candidates[i])
+            clone.id = next_id
+            next_id += 1
+            population.append(clone)
+
+        if on_generation:
+            on_generation(generation_record(
+                generation=gen_i,
+                generation_size=generation_size,
+                num_survivors=num_survivors,
+                num_children=num_children,
+                survival_type=last_survival_type,
+            ))
+
+        # muting
+        if mute_probability:
+            with metrics.phase('mutation'):
+                metrics.count('genes_mutated', sum([
+                    ind.mute(mute_probability=mute_probability, rng=rng) for ind in population
+                ]))
+
+        # randomize coordinates for the next generation
+        with metrics.phase('repositioning'):
+            current_coordinates = randomize_coordinates(
+                pop_size=len(population),
+                world_size=world_size,
+                rng=rng,
             )
-        ]
+            for coords, ind in zip(current_coordinates, population):
+                ind.coords = coords
+        metrics.end_generation(gen_i)
+
+    return population, [ind.coords for ind in population]
+
+
+def iter_evolve_vectorized(
+    population_size: int,
+    num_genes: int,
+    world_size: Tuple[int, int],
+    num_generations: int,
+    lifespan: int,
+    start_generation: int = 0,
+    end_generation: int = None,
+    start_step: int = 0,
+    end_step: int = None,
+    mute_probability: Optional[float] = None,
+    mate_probability: Optional[float] = None,
+    death_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]] = None,
+    safe_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]] = None,
+    survival_mask: Optional[np.ndarray] = None,
+    heat_sources: Tuple[int, int] = [],
+    heat_field: Optional[HeatField] = None,
+    population: Union[Population, List[Individual]] = None,
+    verbosity: str = 'v',
+    seed: Optional[int] = None,
+    on_generation: Optional[Callable[[Dict[str, Any]], None]] = None,
+    metrics: Optional[MetricsCollector] = None,
+    rng: Optional[np.random.Generator] = None,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_interval: int = 1,
+    statistics: Optional[StatisticsLog] = None,
+    lineage: Optional[Lineage] = None,
+) -> Generator[Tuple[int, int, Population], None, Tuple[Population, np.ndarray]]:
+    """Struct-of-arrays version of `evolve`, as a generator.
+
+    Runs the same lifespan, survival and mating rules, but the whole population is advanced one step at a time with
+    batched array operations instead of looping over `Individual` objects. Within a step every individual senses the
+    world as it was at the beginning of the step, see `Population.take_step`.
+
+    `on_generation`, if given, is called at the end of every generation with a record of it, see `generation_record`.
+    `metrics`, if given, times every phase of every generation, see `MetricsCollector`.
+
+    `rng`, if given, is used instead of a generator seeded with `seed`. If `checkpoint_path` is given, the state of the
+    simulation is saved there every `checkpoint_interval` generations and when the call returns, and
+    `resume_evolution` restarts it exactly where it stopped.
+
+    `statistics`, if given, gets a row of statistics of every generation before survivor selection, see
+    `generation_statistics`.
+
+    `lineage`, if given, records the parents of every individual born and the mutations of every generation, and the
+    `ids` of the population are the ids of its individuals in it, see `Lineage`. Individuals with no id yet are
+    recorded as founders.
+
+    Yields:
+        Tuple[int, int, Population]: generation, step and population after every step. The population is updated in
+            place, it must not be modified by the caller.
+
+    Returns:
+        Tuple[Population, np.ndarray]: the population and the coordinates of its alive individuals.
+    """
+    assert(not verbosity or (len(verbosity) <= 3 and all([e == 'v' for e in verbosity])))
+    verbosity_level = 0 if not verbosity else len(verbosity)
+    rng = rng or np.random.default_rng(seed)
+
+    end_step = end_step or lifespan
+    end_generation = end_generation or num_generations
+    if survival_mask is None:
+        survival_mask = compile_survival_mask(world_size, safe_boxes=safe_boxes, death_boxes=death_boxes)
+    if heat_field is None:
+        heat_field = create_heat_field(world_size, heat_sources=heat_sources)
+    metrics = metrics or NULL_METRICS
+    if population is None:
+        population = Population.random(
+            population_size=population_size,
+            lifespan=lifespan,
+            world_size=world_size,
+            coords=sample_coordinates(population_size, world_size, rng=rng),
+            num_genes=num_genes,
+            rng=rng,
+        )
+    elif not isinstance(population, Population):
+        population = Population.from_individuals(population)
+    if lineage is not None:
+        founders = np.flatnonzero(population.ids < 0)
+        population.ids[founders] = lineage.add_founders(len(founders), generation=start_generation)
+
+    config = {
+        'population_size': population_size,
+        'num_genes': num_genes,
+        'world_size': world_size,
+        'num_generations': num_generations,
+        'lifespan': lifespan,
+        'mute_probability': mute_probability,
+        'mate_probability': mate_probability,
+        'death_boxes': death_boxes,
+        'safe_boxes': safe_boxes,
+        'heat_sources': heat_field.heat_sources,
+    }
+    last_survival_rate = 1
+    last_survival_type = 'Only new'
+    checkpoint_generation, checkpoint_step = start_generation, start_step
+    for gen_i in range(start_generation, end_generation):
+        generation_size = int(population.alive.sum())
+        if generation_size == 0:
+            log_info("Evolution did not succeed.", 1, verbosity_level)
+            break
+
+        # once every individual is idle nothing can change until the end of the generation or until a heat source is
+        # added or removed, see `Population.take_step`
+        occupancy = population.occupancy()
+        idle = np.zeros(len(population), dtype=bool)
+        settled = False
+        heat_version = heat_field.version
+        for step_i in range(start_step, end_step):
+            if heat_field.version != heat_version:
+                heat_version = heat_field.version
+                idle[:] = False
+                settled = False
+            if settled:
+                population.idle_step(rng)
+                metrics.count('settled_steps')
+            else:
+                population.take_step(occupancy=occupancy, heat_field=heat_field, rng=rng, metrics=metrics, idle=idle)
+                settled = population.settled(idle)
+            checkpoint_generation, checkpoint_step = gen_i, step_i + 1
+            yield gen_i, step_i, population
+            if verbosity_level >= 3:
+                time.sleep(0.05)
+                print_status(
+                    world_size=world_size,
+                    current_coordinates=occupancy,
+                    heat_sources=heat_field,
+                    message=(
+                        f" Gen {gen_i}/{num_generations}, "
+                        f"step {step_i}/{lifespan}, "
+                        f"pop size {generation_size} "
+                        f"{last_survival_type}, "
+                        f"last gen survival rate: {(100*last_survival_rate):.2f}% "
+                    ),
+                )
+
+        if end_step < lifespan:
+            continue
+
+        # we remove the dead individuals
+        with metrics.phase('survivor_selection'):
+            survived = population.alive & survival_mask[population.coords[:, 0], population.coords[:, 1]]
+            survivors = population.subset(np.flatnonzero(survived))
+        if statistics:
+            with metrics.phase('statistics'):
+                statistics.append(generation_statistics(
+                    generation=gen_i,
+                    genomes=population.genomes,
+                    coords=population.coords,
+                    alive=population.alive,
+                    survived=survived,
+                    world_size=world_size,
+                    safe_boxes=safe_boxes,
+                ))
         num_survivors = len(survivors)
         last_survival_rate = num_survivors/generation_size
 
         # survivors mate to create individuals for the next generation
-        new_generation = []
-        for i, (ind1, ind2) in enumerate(combinations(survivors, 2)):
-            child1, child2 = mate(
-                ind1=ind1,
-                ind2=ind2,
+        with metrics.phase('mating'):
+            new_generation, parents = survivors.mate(
                 mate_probability=mate_probability,
-                child1_id=f"individual_gen{gen_i}_{i}_1",
-                child2_id=f"individual_gen{gen_i}_{i}_2",
+                rng=rng,
+                max_children=population_size,
+                return_parents=True,
             )
-            if child1 and child2:
-                new_generation += [child1, child2]
-        num_children = len(new_generation)
-        random.shuffle(new_generation)
-
-        if num_children >= population_size:
-            population = new_generation[:population_size]
-            last_survival_type = 'only new'
-        elif num_survivors + num_children >= population_size:
-            random.shuffle(survivors)
-            population = new_generation + survivors[:population_size-num_children]
-            last_survival_type = 'new and some old'
-        else:
-            random.shuffle(survivors)
-            last_survival_type = 'cloned'
-            individuals_left = population_size - num_children - num_survivors
-            clones = []
-            if num_children > 0:
-                clones += [
-                    copy.copy(new_generation[i%num_children])
-                    for i in range(int(np.ceil(individuals_left/2)))
-                ]
-            if num_survivors > 0:
-                clones += [
-                    copy.copy(survivors[i%len(survivors)])
-                    for i in range(int(individuals_left/2))
-                ]
-            population = new_generation + survivors + clones
+            num_children = len(new_generation)
+            if lineage is not None:
+                new_generation.ids = lineage.add_births(
+                    survivors.ids[parents], generation=gen_i + 1, kind=Lineage.CROSSOVER,
+                )
+        metrics.count('matings', -(-num_children//2))
+        metrics.count('children', num_children)
+
+        indices, num_clones, last_survival_type = select_next_generation(
+            num_children, num_survivors, population_size=population_size, rng=rng,
+        )
+        population = Population.concatenate([new_generation, survivors]).subset(indices)
+        if lineage is not None and num_clones:
+            population.ids[-num_clones:] = lineage.add_clones(population.ids[-num_clones:], generation=gen_i + 1)
+
+        if on_generation:
+            on_generation(generation_record(
+                generation=gen_i,
+                generation_size=generation_size,
+                num_survivors=num_survivors,
+                num_children=num_children,
+                survival_type=last_survival_type,
+            ))
 
         # muting
         if mute_probability:
-            for ind in population:
-                ind.mute(mute_probability=mute_probability)
+            with metrics.phase('mutation'):
+                changed = population.mute(mute_probability=mute_probability, rng=rng)
+                metrics.count('genes_mutated', len(changed))
+                if lineage is not None and len(changed):
+                    mutated, counts = np.unique(changed//population.genomes.shape[1], return_counts=True)
+                    lineage.add_mutations(population.ids[mutated], generation=gen_i + 1, counts=counts)
 
         # randomize coordinates for the next generation
-        current_coordinates = randomize_coordinates(
-            pop_size=generation_size,
-            world_size=world_size,
+        with metrics.phase('repositioning'):
+            population.coords = sample_coordinates(pop_size=len(population), world_size=world_size, rng=rng)
+            population.alive[:] = True
+        metrics.end_generation(gen_i)
+
+        # a resumed generation starts at `start_step`, the next ones start from scratch
+        start_step = 0
+        checkpoint_generation, checkpoint_step = gen_i + 1, 0
+        if checkpoint_path and (gen_i + 1 - start_generation) % checkpoint_interval == 0:
+            save_checkpoint(
+                checkpoint_path,
+                population=population,
+                generation=checkpoint_generation,
+                step=checkpoint_step,
+                rng=rng,
+                config=config,
+                survival_mask=survival_mask,
+            )
+
+    if checkpoint_path:
+        save_checkpoint(
+            checkpoint_path,
+            population=population,
+            generation=checkpoint_generation,
+            step=checkpoint_step,
+            rng=rng,
+            config=config,
+            survival_mask=survival_mask,
         )
-        for coords, ind in zip(current_coordinates, population):
-            ind.coords = coords
+    return population, population.coords[population.alive]
+
+
+def evolve_vectorized(recorder: Optional[TrajectoryRecorder] = None, **kwargs) -> Tuple[Population, np.ndarray]:
+    """Struct-of-arrays version of `evolve`, runs `iter_evolve_vectorized` to the end.
+
+    Args:
+        recorder (Optional[TrajectoryRecorder]): records every step, to be replayed with `Trajectory`.
+        **kwargs: `iter_evolve_vectorized` arguments.
+
+    Returns:
+        Tuple[Population, np.ndarray]: the population and the coordinates of its alive individuals.
+    """
+    steps = iter_evolve_vectorized(**kwargs)
+    while True:
+        try:
+            gen_i, step_i, population = next(steps)
+        except StopIteration as stop:
+            if recorder:
+                recorder.close()
+            return stop.value
+        if recorder:
+            recorder.record_step(gen_i, step_i, population)
+
+
+def record_evolution(path: str, **kwargs) -> Tuple[Population, np.ndarray]:
+    """Runs `evolve_vectorized` headless and records every step to `path`, see `TrajectoryRecorder`.
+
+    Args:
+        path (str): directory the trajectory is saved to.
+        **kwargs: `iter_evolve_vectorized` arguments.
+
+    Returns:
+        Tuple[Population, np.ndarray]: the population and the coordinates of its alive individuals.
+    """
+    start_generation = kwargs.get('start_generation', 0)
+    population = kwargs.get('population')
+    recorder = TrajectoryRecorder(
+        path,
+        num_generations=(kwargs.get('end_generation') or kwargs['num_generations']) - start_generation,
+        lifespan=kwargs['lifespan'],
+        population_size=max(kwargs['population_size'], len(population) if population else 0),
+        num_genes=kwargs['num_genes'],
+        world_size=kwargs['world_size'],
+        start_generation=start_generation,
+    )
+    return evolve_vectorized(recorder=recorder, **{'verbosity': '', **kwargs})
+
+
+def resume_evolution(checkpoint_path: str, **kwargs) -> Tuple[Population, np.ndarray]:
+    """Restarts a simulation from a checkpoint saved by `evolve_vectorized`.
+
+    The population, random generator state, generation, step and world configuration are read from the checkpoint,
+    so the run continues exactly as if it had never stopped.
+
+    Args:
+        checkpoint_path (str): checkpoint file.
+        **kwargs: `evolve_vectorized` arguments overriding the ones of the checkpoint, e.g. `end_generation`. The
+            checkpoint keeps being updated unless `checkpoint_path` is overridden.
 
-    return population, current_coordinates
+    Returns:
+        Tuple[Population, np.ndarray]: the population and the coordinates of its alive individuals.
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    return evolve_vectorized(**{
+        **checkpoint['config'],
+        'population': checkpoint['population'],
+        'start_generation': checkpoint['generation'],
+        'start_step': checkpoint['step'],
+        'rng': checkpoint['rng'],
+        'survival_mask': checkpoint['survival_mask'],
+        'checkpoint_path': checkpoint_path,
+        **kwargs,
+    })
 
 
 if __name__ == '__main__':
@@ -0,0 +1,215 @@
+import zlib
+import struct
+import numpy as np
+from typing import Optional, Tuple, Union
+from objects.genome import GENE_LENGTH_HEX
+from objects.heat import HeatField
+from objects.world import SurvivalBoxes
+
+
+FRAME_MIMETYPE: str = 'application/vnd.evolution.frame'
+FRAME_MAGIC: bytes = b'EVFR'
+FRAME_VERSION: int = 1
+FLAG_PALETTE: int = 1
+FLAG_WIDE_INDICES: int = 2
+FLAG_WIDE_COORDS: int = 4
+HEADER = struct.Struct('<4sBBHIII')
+PNG_MIMETYPE: str = 'image/png'
+PNG_SIGNATURE: bytes = b'\x89PNG\r\n\x1a\n'
+BACKGROUND_COLOR: Tuple[int, int, int, int] = (255, 255, 255, 255)
+SAFE_COLOR: Tuple[int, int, int, int] = (226, 244, 226, 255)
+HEAT_COLOR: Tuple[int, int, int, int] = (255, 80, 0, 255)
+
+
+def genome_colors(genomes: np.ndarray) -> np.ndarray:
+    """(N, 3) `uint8` RGB colors of (N, num_genes) genomes.
+
+    Same colors as `stringToColor` of `web/static/js/main.js` applied to the hex gene sequences, computed on the
+    nibbles of the genes instead of on strings.
+    """
+    genomes = np.asarray(genomes, dtype=np.uint32)
+    shifts = np.arange(4*(GENE_LENGTH_HEX - 1), -1, -4, dtype=np.uint32)
+    nibbles = ((genomes[:, :, None] >> shifts) & 0xF).reshape(len(genomes), -1)
+    char_codes = np.where(nibbles < 10, nibbles + ord('0'), nibbles - 10 + ord('a')).astype(np.uint32)
+    hashes = np.zeros(len(genomes), dtype=np.uint32)
+    for column in char_codes.T:
+        # hash = charCode + ((hash << 5) - hash), in 32-bit integer arithmetic
+        hashes = column + (hashes << np.uint32(5)) - hashes
+    return np.stack([(hashes >> np.uint32(8*i)) & 0xFF for i in range(3)], axis=1).astype(np.uint8)
+
+
+def render_frame(
+    world_size: Tuple[int, int],
+    coords: np.ndarray,
+    colors: np.ndarray,
+    survival_mask: Optional[Union[np.ndarray, SurvivalBoxes]] = None,
+    heat_field: Optional[HeatField] = None,
+) -> np.ndarray:
+    """(rows, cols, 4) `uint8` RGBA raster of the world, one pixel per cell.
+
+    The safe cells of a `SurvivalBoxes` mask are drawn box by box, and heat sources from the list of sources of the
+    field, so sparse worlds are rendered without a raster of their mask or field.
+
+    Args:
+        world_size (Tuple[int, int]): size of the 2-D world.
+        coords (np.ndarray): (N, 2) coordinates of the individuals.
+        colors (np.ndarray): (N, 3) `uint8` RGB colors of the individuals.
+        survival_mask (Optional[Union[np.ndarray, SurvivalBoxes]]): cells shaded as safe, see
+            `compile_survival_mask`.
+        heat_field (Optional[HeatField]): heat sources.
+
+    Returns:
+        np.ndarray: RGBA raster.
+    """
+    frame = np.empty((*world_size, 4), dtype=np.uint8)
+    frame[:] = BACKGROUND_COLOR
+    if isinstance(survival_mask, SurvivalBoxes):
+        if not survival_mask.safe_boxes:
+            frame[:] = SAFE_COLOR
+        for boxes, color in ((survival_mask.safe_boxes, SAFE_COLOR), (survival_mask.death_boxes, BACKGROUND_COLOR)):
+            for (top, left), (bottom, right) in boxes:
+                frame[max(top, 0):max(bottom + 1, 0), max(left, 0):max(right + 1, 0)] = color
+    elif survival_mask is not None:
+        frame[survival_mask] = SAFE_COLOR
+    if heat_field:
+        heat_sources = np.asarray(heat_field.heat_sources, dtype=np.int64).reshape(-1, 2)
+        heat_sources = heat_sources[((heat_sources >= 0) & (heat_sources < world_size)).all(axis=1)]
+        frame[heat_sources[:, 0], heat_sources[:, 1]] = HEAT_COLOR
+    coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+    frame[coords[:, 0], coords[:, 1], :3] = colors
+    frame[coords[:, 0], coords[:, 1], 3] = 255
+    return frame
+
+
+def encode_png(frame: np.ndarray, compression_level: int = 1) -> bytes:
+    """PNG image of a (rows, cols, 4) `uint8` RGBA raster, with no filtering and fast zlib compression."""
+    height, width = frame.shape[:2]
+    scanlines = np.zeros((height, 1 + 4*width), dtype=np.uint8)
+    scanlines[:, 1:] = frame.reshape(height, -1)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    return b''.join([
+        PNG_SIGNATURE,
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(scanlines.tobytes(), compression_level)),
+        chunk(b'IEND', b''),
+    ])
+
+
+class FrameEncoder():
+    """Compact binary encoding of population snapshots.
+
+    Every frame holds the `uint16` coordinates of the individuals, `uint32` in worlds larger than 65536 cells a side,
+    and their index in a palette of colors, one per distinct genome. The palette is only rebuilt when the genomes
+    change, and only sent to clients that do not have its current version.
+
+    ### Frame layout (little-endian)
+    - header: magic `EVFR`, `uint8` version, `uint8` flags, `uint16` padding, `uint32` palette version, `uint32`
+      number of individuals N, `uint32` number of palette colors P (0 if the palette is not included).
+    - palette: P RGB triplets, zero padded to a multiple of 4 bytes.
+    - coordinates: N (row, col) `uint16` pairs, or `uint32` if the `FLAG_WIDE_COORDS` flag is set.
+    - palette indices: N `uint8`, or `uint16` if the `FLAG_WIDE_INDICES` flag is set.
+    """
+
+    def __init__(self) -> None:
+        self.palette_version = 0
+        self.sent_palette_version = None
+        self.genomes = None
+        self.palette = None
+        self.palette_indices = None
+
+    def update_palette(self, genomes: np.ndarray) -> None:
+        if self.genomes is not None and self.genomes.shape == genomes.shape and np.array_equal(self.genomes, genomes):
+            return
+        unique_genomes, palette_indices = np.unique(genomes, axis=0, return_inverse=True)
+        self.genomes = genomes.copy()
+        self.palette = genome_colors(unique_genomes)
+        self.palette_indices = palette_indices.reshape(-1)
+        self.palette_version += 1
+
+    def encode(
+        self,
+        genomes: np.ndarray,
+        coords: np.ndarray,
+        indices: Optional[np.ndarray] = None,
+        client_palette_version: Optional[int] = None,
+    ) -> bytes:
+        """Encodes a frame.
+
+        Args:
+            genomes (np.ndarray): (N, num_genes) genomes of the whole population.
+            coords (np.ndarray): (N, 2) coordinates of the whole population.
+            indices (Optional[np.ndarray]): individuals to draw. Defaults to all of them.
+            client_palette_version (Optional[int]): palette version the client has, the palette is included if it is
+                not the current one. Defaults to the last version this encoder sent.
+
+        Returns:
+            bytes: binary frame.
+        """
+        self.update_palette(np.asarray(genomes, dtype=np.uint32))
+        if indices is None:
+            indices = np.arange(len(coords))
+        coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)[indices]
+        known_version = self.sent_palette_version if client_palette_version is None else client_palette_version
+        include_palette = known_version != self.palette_version
+        wide_indices = len(self.palette) > 256
+        wide_coords = len(coords) > 0 and int(coords.max()) > 0xFFFF
+
+        flags = (
+            (FLAG_PALETTE if include_palette else 0)
+            | (FLAG_WIDE_INDICES if wide_indices else 0)
+            | (FLAG_WIDE_COORDS if wide_coords else 0)
+        )
+        palette = self.palette.tobytes() if include_palette else b''
+        chunks = [
+            HEADER.pack(
+                FRAME_MAGIC,
+                FRAME_VERSION,
+                flags,
+                0,
+                self.palette_version,
+                len(indices),
+                len(self.palette) if include_palette else 0,
+            ),
+            palette,
+            b'\0'*(-len(palette) % 4),
+            coords.astype('<u4' if wide_coords else '<u2').tobytes(),
+            self.palette_indices[indices].astype('<u2' if wide_indices else 'u1').tobytes(),
+        ]
+        self.sent_palette_version = self.palette_version
+        return b''.join(chunks)
+
+    def render(
+        self,
+        genomes: np.ndarray,
+        coords: np.ndarray,
+        world_size: Tuple[int, int],
+        indices: Optional[np.ndarray] = None,
+        survival_mask: Optional[Union[np.ndarray, SurvivalBoxes]] = None,
+        heat_field: Optional[HeatField] = None,
+    ) -> bytes:
+        """Renders a frame as a PNG image with the palette colors, see `render_frame`.
+
+        Args:
+            genomes (np.ndarray): (N, num_genes) genomes of the whole population.
+            coords (np.ndarray): (N, 2) coordinates of the whole population.
+            world_size (Tuple[int, int]): size of the 2-D world.
+            indices (Optional[np.ndarray]): individuals to draw. Defaults to all of them.
+            survival_mask (Optional[Union[np.ndarray, SurvivalBoxes]]): cells shaded as safe.
+            heat_field (Optional[HeatField]): heat sources.
+
+        Returns:
+            bytes: PNG image.
+        """
+        self.update_palette(np.asarray(genomes, dtype=np.uint32))
+        if indices is None:
+            indices = np.arange(len(coords))
+        return encode_png(render_frame(
+            world_size,
+            np.asarray(coords, dtype=np.int64).reshape(-1, 2)[indices],
+            self.palette[self.palette_indices[indices]],
+            survival_mask=survival_mask,
+            heat_field=heat_field,
+        ))
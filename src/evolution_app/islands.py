@@ -0,0 +1,176 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from evolution import evolve_vectorized, log_info
+from objects.population import Population
+
+
+def run_island_epoch(
+    config: Dict[str, Any],
+    genomes: Optional[np.ndarray],
+    coords: Optional[np.ndarray],
+    steps: Optional[np.ndarray],
+    num_generations: int,
+    start_generation: int,
+    end_generation: int,
+    seed: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Evolves one island for a few generations.
+
+    Runs in a worker process: only the compact genome, coordinate and step arrays go in and out of it.
+
+    Args:
+        config (Dict[str, Any]): `evolve_vectorized` arguments of the island.
+        genomes (Optional[np.ndarray]): (N, num_genes) genomes of the island, `None` for a random population. An
+            extinct island, with no genomes, stays extinct.
+        coords (Optional[np.ndarray]): (N, 2) coordinates of the island individuals.
+        steps (Optional[np.ndarray]): step counters of the island individuals.
+        num_generations (int): total number of generations of the run.
+        start_generation (int): first generation of the epoch.
+        end_generation (int): generation the epoch stops at.
+        seed (int): seed of the epoch.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: genomes, coordinates and step counters of the island.
+    """
+    population = None
+    if genomes is not None:
+        population = Population(
+            genomes=genomes,
+            coords=coords,
+            lifespan=config['lifespan'],
+            world_size=config['world_size'],
+            steps=steps,
+        )
+    population, _ = evolve_vectorized(
+        **config,
+        num_generations=num_generations,
+        start_generation=start_generation,
+        end_generation=end_generation,
+        population=population,
+        seed=seed,
+        verbosity='',
+    )
+    alive = np.flatnonzero(population.alive)
+    return population.genomes[alive], population.coords[alive], population.steps[alive]
+
+
+def migrate(
+    islands: List[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+    num_migrants: int,
+    rng: np.random.Generator,
+) -> None:
+    """Ring migration, in place.
+
+    Each island sends copies of `num_migrants` random genomes to the next one, where they replace the genomes of
+    random individuals. The migrants keep the coordinates of the individuals they replace.
+
+    Args:
+        islands (List[Tuple[np.ndarray, np.ndarray, np.ndarray]]): genomes, coordinates and steps of every island.
+        num_migrants (int): number of genomes sent by each island.
+        rng (np.random.Generator): random generator.
+    """
+    migrants = [
+        genomes[rng.choice(len(genomes), size=min(num_migrants, len(genomes)), replace=False)]
+        for genomes, _, _ in islands
+    ]
+    for i, (genomes, _, _) in enumerate(islands):
+        incoming = migrants[i - 1][:len(genomes)]
+        genomes[rng.choice(len(genomes), size=len(incoming), replace=False)] = incoming
+
+
+def run_islands(
+    island_configs: List[Dict[str, Any]],
+    num_generations: int,
+    migration_interval: int = 10,
+    num_migrants: int = 5,
+    max_workers: Optional[int] = None,
+    seed: Optional[int] = None,
+    verbosity: str = 'v',
+) -> List[Population]:
+    """Island model.
+
+    Evolves one population per island in a pool of worker processes, each one with its own configuration (world size,
+    death boxes, safe boxes, heat sources...). Every `migration_interval` generations the islands are gathered and
+    `num_migrants` genomes of each island migrate to the next one.
+
+    Args:
+        island_configs (List[Dict[str, Any]]): `evolve_vectorized` arguments of every island, at least
+            `population_size`, `num_genes`, `world_size` and `lifespan`. Every island must use the same `num_genes`.
+        num_generations (int): number of generations to evolve.
+        migration_interval (int): number of generations between migrations.
+        num_migrants (int): number of genomes sent by each island in each migration.
+        max_workers (Optional[int]): number of worker processes. Defaults to one per island, up to the number of cores.
+        seed (Optional[int]): seed of the run.
+        verbosity (str): verbosity level, 'v' logs every migration.
+
+    Returns:
+        List[Population]: final population of every island.
+    """
+    assert len({config['num_genes'] for config in island_configs}) == 1, "Every island must use the same 'num_genes'."
+    verbosity_level = 0 if not verbosity else len(verbosity)
+    seed_sequence = np.random.SeedSequence(seed)
+    rng = np.random.default_rng(seed_sequence.spawn(1)[0])
+    island_seeds = seed_sequence.spawn(len(island_configs))
+    max_workers = max_workers or min(len(island_configs), os.cpu_count() or 1)
+
+    islands = [(None, None, None)]*len(island_configs)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for start_generation in range(0, num_generations, migration_interval):
+            end_generation = min(start_generation + migration_interval, num_generations)
+            futures = [
+                executor.submit(
+                    run_island_epoch,
+                    config,
+                    *island,
+                    num_generations=num_generations,
+                    start_generation=start_generation,
+                    end_generation=end_generation,
+                    seed=int(island_seed.spawn(1)[0].generate_state(1)[0]),
+                )
+                for config, island, island_seed in zip(island_configs, islands, island_seeds)
+            ]
+            islands = [future.result() for future in futures]
+            if end_generation < num_generations and num_migrants > 0:
+                migrate(islands, num_migrants=num_migrants, rng=rng)
+            log_info(
+                f"Gen {end_generation}/{num_generations}, island sizes: {[len(genomes) for genomes, _, _ in islands]}",
+                1,
+                verbosity_level,
+            )
+
+    return [
+        Population(
+            genomes=genomes,
+            coords=coords,
+            lifespan=config['lifespan'],
+            world_size=config['world_size'],
+            steps=steps,
+        )
+        for config, (genomes, coords, steps) in zip(island_configs, islands)
+    ]
+
+
+if __name__ == '__main__':
+    COMMON_CONFIG = dict(
+        population_size=250,
+        num_genes=7,
+        world_size=(20, 60),
+        lifespan=50,
+        mute_probability=0.0005,
+        mate_probability=0.7,
+    )
+    ISLAND_CONFIGS = [
+        dict(COMMON_CONFIG, safe_boxes=[((0, 40), (15, 60))]),
+        dict(COMMON_CONFIG, safe_boxes=[((0, 0), (15, 20))]),
+        dict(COMMON_CONFIG, death_boxes=[((0, 0), (20, 45))]),
+        dict(COMMON_CONFIG, safe_boxes=[((0, 40), (15, 60))], heat_sources=[(10, 50)]),
+    ]
+
+    run_islands(
+        island_configs=ISLAND_CONFIGS,
+        num_generations=100,
+        migration_interval=10,
+        num_migrants=5,
+    )
@@ -1,7 +1,57 @@
 import os
-import binascii
+import math
+import threading
+from collections import OrderedDict
 import numpy as np
-from typing import List, Literal
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from .genome import hex_to_genes, genes_to_hex
+
+
+def fuse_tensors(
+    input_inner_tensor: np.ndarray,
+    inner_inner_tensor: np.ndarray,
+    inner_output_tensor: np.ndarray,
+    input_output_tensor: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compiles the four weight tensors of one brain, or of a (N, ...) stack of brains, into two layers.
+
+    The single hop inner-inner pass is linear, `x@W_ii + (x@W_ii)@W_inner` is `x@(W_ii + W_ii@W_inner)`, so it is
+    folded into the input-inner matrix. The input-output matrix is appended to it, so the first layer computes the
+    inner neuron sums and the direct output sums with a single product:
+
+        first_sum = x @ first_layer
+        output = tanh(tanh(first_sum[:4]) @ second_layer + first_sum[4:])
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (..., 16, 8) first layer and (..., 4, 4) second layer, the inner-output tensor.
+    """
+    return (
+        np.concatenate([input_inner_tensor + input_inner_tensor @ inner_inner_tensor, input_output_tensor], axis=-1),
+        inner_output_tensor,
+    )
+
+
+def decision_inputs(
+    input_inner_tensor: np.ndarray,
+    inner_inner_tensor: np.ndarray,
+    inner_output_tensor: np.ndarray,
+    input_output_tensor: np.ndarray,
+) -> np.ndarray:
+    """Inputs connected to each decision output, directly or through the inner neurons, of one brain or of a (N, ...)
+    stack of brains.
+
+    A decision output whose connected inputs are all 0 is exactly 0, however its sums are computed.
+
+    Returns:
+        np.ndarray: (..., 16, 2) boolean array.
+    """
+    reaches_inner = (input_inner_tensor != 0) | (
+        (input_inner_tensor != 0).astype(np.int64) @ (inner_inner_tensor != 0).astype(np.int64) > 0
+    )
+    decision_tensor = inner_output_tensor[..., :Brain.NUM_DECISION_OUTPUTS] != 0
+    return (input_output_tensor[..., :Brain.NUM_DECISION_OUTPUTS] != 0) | (
+        reaches_inner.astype(np.int64) @ decision_tensor.astype(np.int64) > 0
+    )
 
 
 class Brain():
@@ -62,63 +112,171 @@ class Brain():
     NEURON_TYPES: List[str] = [NEURON_TYPE_INPUT, NEURON_TYPE_INNER, NEURON_TYPE_OUTPUT]
     # CONNECTION_WEIGHT_SCALE: float = 2e6
     CONNECTION_WEIGHT_SCALE: float = 0.5e6
+    # outputs 0 and 1 decide the moves, see `Individual.take_step`
+    NUM_DECISION_OUTPUTS: Literal[2] = 2
+    # age and random inputs, the only ones that change while an individual and its neighbourhood stay still
+    TIME_VARYING_INPUTS: Tuple[int, ...] = (13, 14, 15)
+    DECISION_TOLERANCE: float = 1e-4
+    SPARSE_MAX_EDGES: int = 16
 
     def __init__(
         self,
-        hex_gene_sequence: str,
+        hex_gene_sequence: Optional[str] = None,
+        genes: Optional[np.ndarray] = None,
     ) -> None:
-        assert(
-            len(hex_gene_sequence) % self.GENE_LENGTH_HEX == 0
-        ), f"Length of 'hex_gene_sequence' must be multiple of {self.GENE_LENGTH_HEX}."
+        assert (hex_gene_sequence is None) != (genes is None), "Pass either 'hex_gene_sequence' or 'genes'."
+        if hex_gene_sequence is not None:
+            assert(
+                len(hex_gene_sequence) % self.GENE_LENGTH_HEX == 0
+            ), f"Length of 'hex_gene_sequence' must be multiple of {self.GENE_LENGTH_HEX}."
+            genes = hex_to_genes(hex_gene_sequence)
 
-        self.hex_gene_sequence = hex_gene_sequence
+        # the expressed tensors are shared by every brain with the same genes, so genes are never edited in place
+        self.genes = np.array(genes, dtype=np.uint32)
+        self.genes.setflags(write=False)
         self.express_genes()
 
+    @property
+    def hex_gene_sequence(self) -> str:
+        """Hex view of `genes`, computed on demand."""
+        return genes_to_hex(self.genes)
+
     @classmethod
     def init_random_genes(cls, num_genes: int):
-        hex_gene_sequence = binascii.b2a_hex(os.urandom(num_genes*4)).decode()
-        return cls(hex_gene_sequence=hex_gene_sequence)
+        return cls(genes=np.frombuffer(os.urandom(num_genes*4), dtype=np.uint32).copy())
+
+    @classmethod
+    def decode_genes(cls, genes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Decodes a batch of genomes into stacked weight tensors.
+
+        The gene fields are extracted with shifts and masks over the whole (N, num_genes) `uint32` array. When several
+        genes connect the same pair of neurons, the last one wins, as in a gene by gene decoding.
+
+        Args:
+            genes (np.ndarray): (N, num_genes) or (num_genes,) `uint32` array.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: (N, ...) input-inner, inner-inner, inner-output and
+                input-output tensors.
+        """
+        genes = np.atleast_2d(np.asarray(genes, dtype=np.uint32))
+        num_rows = cls.NUM_INPUT_NEURONS + cls.NUM_INNER_NEURONS
+        num_cols = cls.NUM_INNER_NEURONS + cls.NUM_OUTPUT_NEURONS
+
+        source_is_inner = (genes >> 31) & 0x1
+        source_id = np.where(source_is_inner, (genes >> 27) & 0x3, (genes >> 27) & 0xF)
+        target_is_output = (genes >> 26) & 0x1
+        target_id = (genes >> 24) & 0x3
+        weight = ((genes & 0xFFFFFF).astype(np.int32) ^ 0x800000) - 0x800000
+        weight = weight/cls.CONNECTION_WEIGHT_SCALE
+
+        # rows: input neurons then inner neurons, columns: inner neurons then output neurons
+        rows = source_is_inner*cls.NUM_INPUT_NEURONS + source_id
+        cols = target_is_output*cls.NUM_INNER_NEURONS + target_id
+        keys = (
+            np.arange(genes.shape[0], dtype=np.int64)[:, None]*num_rows*num_cols
+            + rows.astype(np.int64)*num_cols
+            + cols
+        ).ravel()
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+
+        connections = np.zeros((genes.shape[0], num_rows, num_cols))
+        connections.reshape(-1)[keys[last]] = weight.ravel()[last]
+        return (
+            connections[:, :cls.NUM_INPUT_NEURONS, :cls.NUM_INNER_NEURONS],
+            connections[:, cls.NUM_INPUT_NEURONS:, :cls.NUM_INNER_NEURONS],
+            connections[:, cls.NUM_INPUT_NEURONS:, cls.NUM_INNER_NEURONS:],
+            connections[:, :cls.NUM_INPUT_NEURONS, cls.NUM_INNER_NEURONS:],
+        )
 
     def express_genes(self):
-        self.hex_genes = [''.join(e) for e in zip(*[iter(self.hex_gene_sequence)]*self.GENE_LENGTH_HEX)]
-        self.bin_genes = [bin(int(g, 16))[2:].zfill(self.GENE_LENGTH) for g in self.hex_genes]
-
-        self.input_inner_tensor = np.zeros((self.NUM_INPUT_NEURONS, self.NUM_INNER_NEURONS))
-        self.inner_output_tensor = np.zeros((self.NUM_INNER_NEURONS, self.NUM_OUTPUT_NEURONS))
-
-        self.inner_inner_tensor = np.zeros((self.NUM_INNER_NEURONS, self.NUM_INNER_NEURONS))
-        self.input_output_tensor = np.zeros((self.NUM_INPUT_NEURONS, self.NUM_OUTPUT_NEURONS))
-        for gene in self.bin_genes:
-            # print(gene)
-            source_neuron_type = self.NEURON_TYPES[int(gene[0])]
-            # print(f"SOURCE_NEURON_TYPE: {source_neuron_type}")
-            source_neuron_id = (
-                int(gene[1:1+4], 2)
-                if source_neuron_type == self.NEURON_TYPE_INPUT
-                else int(gene[3:3+2], 2)
-            )
-            # print(f"SOURCE_NEURON_ID: {source_neuron_id}")
-
-            target_neuron_type = self.NEURON_TYPES[int(gene[5])+1]
-            # print(f"TARGET_NEURON_TYPE: {target_neuron_type}")
-            target_neuron_id = int(gene[6:6+2], 2)
-            # print(f"TARGET_NEURON_ID: {target_neuron_id}")
-
-            weight = -int(gene[8] + '0'*(self.GENE_LENGTH-8-1), 2) + int(gene[9:], 2)
-            weight = weight/self.CONNECTION_WEIGHT_SCALE
-            # print(f"WEIGHT: {weight}\n")
-
-            if source_neuron_type == self.NEURON_TYPE_INPUT and target_neuron_type == self.NEURON_TYPE_INNER:
-                self.input_inner_tensor[source_neuron_id, target_neuron_id] = weight
-            elif source_neuron_type == self.NEURON_TYPE_INNER and target_neuron_type == self.NEURON_TYPE_OUTPUT:
-                self.inner_output_tensor[source_neuron_id, target_neuron_id] = weight
-            elif source_neuron_type == self.NEURON_TYPE_INNER and target_neuron_type == self.NEURON_TYPE_INNER:
-                self.inner_inner_tensor[source_neuron_id, target_neuron_id] = weight
-            elif source_neuron_type == self.NEURON_TYPE_INPUT and target_neuron_type == self.NEURON_TYPE_OUTPUT:
-                self.input_output_tensor[source_neuron_id, target_neuron_id] = weight
-        # print(self.input_inner_tensor)
+        """Sets the weight tensors and the compiled form of `genes`, shared read-only with every brain with the same
+        genes through `BRAIN_CACHE`."""
+        (
+            self.input_inner_tensor,
+            self.inner_inner_tensor,
+            self.inner_output_tensor,
+            self.input_output_tensor,
+            self.first_layer,
+            self.second_layer,
+            self.first_edges,
+            self.second_edges,
+            self.sparse,
+            self.decision_inputs,
+        ) = BRAIN_CACHE.get(self.genes)
+
+    @classmethod
+    def compile_genes(cls, genes: np.ndarray) -> Tuple[Any, ...]:
+        """Decodes the genes of one brain and compiles them, see `fuse_tensors`.
+
+        Returns:
+            Tuple[Any, ...]: the four weight tensors, the fused first and second layers, their edge lists, whether the
+                brain runs the sparse kernel and the inputs connected to every decision output, see `decision_inputs`.
+        """
+        input_inner_tensor, inner_inner_tensor, inner_output_tensor, input_output_tensor = (
+            tensor[0] for tensor in cls.decode_genes(genes)
+        )
+        first_layer, second_layer = fuse_tensors(
+            input_inner_tensor,
+            inner_inner_tensor,
+            inner_output_tensor,
+            input_output_tensor,
+        )
+        first_edges = tuple(
+            (source, target, first_layer[source, target]) for source, target in zip(*np.nonzero(first_layer))
+        )
+        second_edges = tuple(
+            (source, target, second_layer[source, target]) for source, target in zip(*np.nonzero(second_layer))
+        )
+        connected_inputs = decision_inputs(
+            input_inner_tensor, inner_inner_tensor, inner_output_tensor, input_output_tensor,
+        )
+        tensors = (
+            input_inner_tensor, inner_inner_tensor, inner_output_tensor, input_output_tensor, first_layer, second_layer,
+        )
+        for tensor in tensors:
+            tensor.setflags(write=False)
+        return (
+            *tensors,
+            first_edges,
+            second_edges,
+            len(first_edges) + len(second_edges) <= cls.SPARSE_MAX_EDGES,
+            tuple(np.flatnonzero(connected_inputs[:, output_i]) for output_i in range(cls.NUM_DECISION_OUTPUTS)),
+        )
 
     def output(self, input_vector: np.ndarray) -> np.ndarray:
+        """Outputs of the compiled brain, with the same decisions as `reference_output`.
+
+        Sparse brains run an edge-list kernel, the other ones the fused dense layers. Decision outputs too close to
+        zero for the rounding differences of the fused layers to be ruled out, unless every input connected to them is
+        0, are recomputed with `reference_output`.
+        """
+        if self.sparse:
+            inputs = input_vector.ravel().tolist()
+            first_sum = [0.0]*(self.NUM_INNER_NEURONS + self.NUM_OUTPUT_NEURONS)
+            for source, target, weight in self.first_edges:
+                first_sum[target] += inputs[source]*weight
+            inner_result = [math.tanh(value) for value in first_sum[:self.NUM_INNER_NEURONS]]
+            output_sum = first_sum[self.NUM_INNER_NEURONS:]
+            for source, target, weight in self.second_edges:
+                output_sum[target] += inner_result[source]*weight
+            output = np.tanh(output_sum)
+        else:
+            first_sum = (input_vector @ self.first_layer).ravel()
+            inner_result = np.tanh(first_sum[:self.NUM_INNER_NEURONS])
+            output = np.tanh(inner_result @ self.second_layer + first_sum[self.NUM_INNER_NEURONS:])
+
+        inputs = input_vector.ravel()
+        if any(
+            abs(output[output_i]) <= self.DECISION_TOLERANCE and inputs[connected_inputs].any()
+            for output_i, connected_inputs in enumerate(self.decision_inputs)
+        ):
+            return self.reference_output(input_vector)
+        return output
+
+    def reference_output(self, input_vector: np.ndarray) -> np.ndarray:
+        """Outputs of the brain computed with the four weight tensors, one matrix product per tensor."""
         input_inner_sum = input_vector @ self.input_inner_tensor
         inner_inner_sum = input_inner_sum @ self.inner_inner_tensor
 
@@ -130,6 +288,114 @@ class Brain():
         return output_sum.ravel()
 
 
+class BrainCache():
+    """Bounded LRU cache of compiled brains, keyed by genome.
+
+    Identical genomes are common: clones, children of similar parents and genomes that did not mutate. Their brains
+    are only decoded and compiled once, see `Brain.compile_genes`, and the cached arrays are shared read-only.
+
+    Args:
+        max_size (int): maximum number of cached genomes, the least recently used one is evicted first.
+    """
+
+    DEFAULT_MAX_SIZE: int = 4096
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, genes: np.ndarray) -> Tuple[Any, ...]:
+        key = np.ascontiguousarray(genes, dtype=np.uint32).tobytes()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = Brain.compile_genes(genes)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def info(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'max_size': self.max_size}
+
+
+BRAIN_CACHE: BrainCache = BrainCache()
+
+
+class SparseBrains():
+    """Compiled brains of a population as batched edge lists, in compressed sparse row (CSR) layout.
+
+    The non-zero weights of the fused layers of every brain, see `fuse_tensors`, are stored brain after brain, so the
+    edges of any subset of brains are gathered with a few index operations and every layer runs as a single
+    weighted `np.bincount`.
+
+    Args:
+        first_layer (np.ndarray): (N, 16, 8) fused first layers.
+        second_layer (np.ndarray): (N, 4, 4) second layers.
+    """
+
+    def __init__(self, first_layer: np.ndarray, second_layer: np.ndarray) -> None:
+        self.num_brains = len(first_layer)
+        self.first_layer = self._edges(first_layer)
+        self.second_layer = self._edges(second_layer)
+
+    def _edges(self, layer: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        brains, sources, targets = np.nonzero(layer)
+        indptr = np.searchsorted(brains, np.arange(self.num_brains + 1))
+        return indptr, sources, targets, layer[brains, sources, targets]
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.first_layer[1]) + len(self.second_layer[1])
+
+    @staticmethod
+    def _layer(
+        edges: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        indices: np.ndarray,
+        values: np.ndarray,
+        num_targets: int,
+    ) -> np.ndarray:
+        """(n, num_targets) weighted sums of the (n, num_sources) values through the edges of the given brains."""
+        indptr, sources, targets, weights = edges
+        starts = indptr[indices]
+        counts = indptr[indices + 1] - starts
+        rows = np.repeat(np.arange(len(indices)), counts)
+        # edges of every brain are contiguous: offset every brain start by the position of its edges
+        edge_ids = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        return np.bincount(
+            rows*num_targets + targets[edge_ids],
+            weights=values[rows, sources[edge_ids]]*weights[edge_ids],
+            minlength=len(indices)*num_targets,
+        ).reshape(len(indices), num_targets)
+
+    def output(self, indices: np.ndarray, input_vectors: np.ndarray) -> np.ndarray:
+        """(n, 4) outputs of the given brains for their (n, 16) input vectors."""
+        first_sum = self._layer(
+            self.first_layer, indices, input_vectors, Brain.NUM_INNER_NEURONS + Brain.NUM_OUTPUT_NEURONS,
+        )
+        inner_result = np.tanh(first_sum[:, :Brain.NUM_INNER_NEURONS])
+        output_sum = self._layer(self.second_layer, indices, inner_result, Brain.NUM_OUTPUT_NEURONS)
+        return np.tanh(output_sum + first_sum[:, Brain.NUM_INNER_NEURONS:])
+
+
 if __name__ == '__main__':
     num_genes = 2
     brain = Brain.init_random_genes(num_genes)
@@ -0,0 +1,107 @@
+import os
+import json
+import numpy as np
+from typing import Any, Dict, Optional
+from .population import Population
+
+
+CHECKPOINT_VERSION: int = 1
+
+
+def rng_from_state(state: Dict[str, Any]) -> np.random.Generator:
+    """Random generator restored from the `bit_generator.state` of another one."""
+    bit_generator = getattr(np.random, state['bit_generator'])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+
+def save_checkpoint(
+    path: str,
+    population: Population,
+    generation: int,
+    step: int,
+    rng: Optional[np.random.Generator] = None,
+    config: Optional[Dict[str, Any]] = None,
+    survival_mask: Optional[np.ndarray] = None,
+) -> str:
+    """Saves the state of a simulation to an uncompressed `.npz` file.
+
+    Genomes, coordinates, step counters, alive flags and ids are stored as raw arrays, the random generator state and
+    the world configuration as JSON strings, so no object is pickled. The file is written next to `path` and renamed
+    once complete, an interrupted save never overwrites a good checkpoint.
+
+    Args:
+        path (str): checkpoint file.
+        population (Population): population to save.
+        generation (int): generation the simulation resumes at.
+        step (int): step of `generation` the simulation resumes at.
+        rng (Optional[np.random.Generator]): random generator of the simulation.
+        config (Optional[Dict[str, Any]]): JSON serializable `evolve` arguments (world size, lifespan, boxes...).
+        survival_mask (Optional[np.ndarray]): compiled survival mask of the world. A `SurvivalBoxes` mask is not
+            saved, it is compiled again from the boxes of `config`.
+
+    Returns:
+        str: `path`.
+    """
+    arrays = {
+        'version': np.asarray(CHECKPOINT_VERSION),
+        'genomes': population.genomes,
+        'coords': population.coords,
+        'steps': population.steps,
+        'alive': population.alive,
+        'ids': population.ids,
+        'lifespan': np.asarray(population.lifespan),
+        'world_size': np.asarray(population.world_size),
+        'generation': np.asarray(generation),
+        'step': np.asarray(step),
+        'rng_state': np.asarray(json.dumps(rng.bit_generator.state if rng is not None else None)),
+        'config': np.asarray(json.dumps(config or {})),
+    }
+    if isinstance(survival_mask, np.ndarray):
+        arrays['survival_mask'] = survival_mask
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    """Loads a checkpoint saved with `save_checkpoint`.
+
+    Args:
+        path (str): checkpoint file.
+
+    Returns:
+        Dict[str, Any]: `population`, `generation`, `step`, `rng` (`None` if it was not saved), `config` and
+            `survival_mask` (`None` if it was not saved).
+    """
+    with np.load(path, allow_pickle=False) as checkpoint:
+        if int(checkpoint['version']) != CHECKPOINT_VERSION:
+            raise Exception(f"Unsupported checkpoint version {int(checkpoint['version'])}.")
+        rng_state = json.loads(str(checkpoint['rng_state']))
+        config = json.loads(str(checkpoint['config']))
+        for key in ('world_size', 'heat_sources'):
+            if config.get(key) is not None:
+                config[key] = tuple(config[key]) if key == 'world_size' else [tuple(e) for e in config[key]]
+        for key in ('safe_boxes', 'death_boxes'):
+            if config.get(key) is not None:
+                config[key] = [tuple(map(tuple, box)) for box in config[key]]
+
+        return {
+            'population': Population(
+                genomes=checkpoint['genomes'],
+                coords=checkpoint['coords'],
+                lifespan=int(checkpoint['lifespan']),
+                world_size=tuple(checkpoint['world_size'].tolist()),
+                steps=checkpoint['steps'],
+                alive=checkpoint['alive'],
+                ids=checkpoint['ids'] if 'ids' in checkpoint else None,
+            ),
+            'generation': int(checkpoint['generation']),
+            'step': int(checkpoint['step']),
+            'rng': rng_from_state(rng_state) if rng_state is not None else None,
+            'config': config,
+            'survival_mask': checkpoint['survival_mask'] if 'survival_mask' in checkpoint else None,
+        }
@@ -0,0 +1,164 @@
+import numpy as np
+from typing import Optional, Tuple, Union
+
+
+GENE_LENGTH_HEX: int = 8
+
+
+def hex_to_genes(hex_gene_sequence: str) -> np.ndarray:
+    """Parses a hex gene sequence into a `uint32` array with one element per gene."""
+    return np.frombuffer(bytes.fromhex(hex_gene_sequence), dtype='>u4').astype(np.uint32)
+
+
+def genes_to_hex(genes: np.ndarray) -> str:
+    """Hex gene sequence of a `uint32` array of genes."""
+    return np.asarray(genes, dtype='>u4').tobytes().hex()
+
+
+def random_genomes(
+    population_size: int,
+    num_genes: int,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """(population_size, num_genes) array of random `uint32` genes."""
+    rng = rng or np.random.default_rng()
+    return rng.integers(0, 2**32, size=(population_size, num_genes), dtype=np.uint32)
+
+
+def mutate_genomes(
+    genomes: np.ndarray,
+    mute_probability: float,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """Mutes every hex digit of every genome with the given probability, in place.
+
+    Instead of drawing a random number per hex digit, the number of muted digits is drawn from a binomial distribution
+    and only those positions are sampled. Each muted digit is replaced with a random one (that can be the same digit)
+    using bit operations.
+
+    Args:
+        genomes (np.ndarray): (N, num_genes) C-contiguous `uint32` array.
+        mute_probability (float): probability of replacing each hex digit with a random one.
+        rng (Optional[np.random.Generator]): random generator.
+
+    Returns:
+        np.ndarray: sorted flat indices (genome*num_genes + gene) of the genes that changed.
+    """
+    rng = rng or np.random.default_rng()
+    flat_genomes = genomes.reshape(-1)
+    num_digits = flat_genomes.size*GENE_LENGTH_HEX
+    num_muted = rng.binomial(num_digits, mute_probability) if num_digits else 0
+    if num_muted == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    positions = rng.choice(num_digits, size=num_muted, replace=False)
+    genes = positions//GENE_LENGTH_HEX
+    shifts = ((GENE_LENGTH_HEX - 1 - positions % GENE_LENGTH_HEX)*4).astype(np.uint32)
+    digits = rng.integers(0, 16, size=num_muted, dtype=np.uint32)
+
+    changed = ((flat_genomes[genes] >> shifts) & 0xF) != digits
+    np.bitwise_and.at(flat_genomes, genes, ~(np.uint32(0xF) << shifts))
+    np.bitwise_or.at(flat_genomes, genes, digits << shifts)
+    return np.unique(genes[changed])
+
+
+def crossover_genomes(genomes1: np.ndarray, genomes2: np.ndarray) -> np.ndarray:
+    """Half-sequence crossover.
+
+    Each child takes the first half of the hex gene sequence of the first parent and the second half of the second
+    one. With an odd number of genes, the half falls in the middle of a gene.
+
+    Args:
+        genomes1 (np.ndarray): (N, num_genes) `uint32` genomes of the first parents.
+        genomes2 (np.ndarray): (N, num_genes) `uint32` genomes of the second parents.
+
+    Returns:
+        np.ndarray: (N, num_genes) `uint32` genomes of the children.
+    """
+    num_genes = genomes1.shape[-1]
+    mask = np.zeros(num_genes, dtype=np.uint32)
+    mask[:num_genes//2] = 0xFFFFFFFF
+    if num_genes % 2:
+        mask[num_genes//2] = 0xFFFF0000
+    return (genomes1 & mask) | (genomes2 & ~mask)
+
+
+def sample_mating_pairs(
+    num_parents: int,
+    mate_probability: float,
+    max_pairs: Optional[int] = None,
+    rng: Optional[np.random.Generator] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Samples the pairs of parents that mate, without enumerating every pair.
+
+    Mating every pair of `num_parents` individuals with probability `mate_probability` gives a binomial number of
+    matings among uniformly chosen pairs. That number is drawn first, capped to `max_pairs`, and only that many
+    distinct pairs are sampled, so the cost grows with the number of children instead of with the squared number of
+    parents.
+
+    Args:
+        num_parents (int): number of individuals that can mate.
+        mate_probability (float): probability of each pair mating.
+        max_pairs (Optional[int]): maximum number of pairs to return.
+        rng (Optional[np.random.Generator]): random generator.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: indices of the first and second parent of each pair, in random order.
+    """
+    rng = rng or np.random.default_rng()
+    num_pairs = num_parents*(num_parents - 1)//2
+    num_matings = rng.binomial(num_pairs, mate_probability or 0) if num_pairs else 0
+    if max_pairs is not None:
+        num_matings = min(num_matings, max_pairs)
+
+    # pair k is (i, j) with i < j and k = j*(j - 1)/2 + i
+    pairs = rng.choice(num_pairs, size=num_matings, replace=False) if num_matings else np.zeros(0, dtype=np.int64)
+    parents2 = ((1 + np.sqrt(1 + 8*pairs.astype(np.float64)))//2).astype(np.int64)
+    parents2 -= parents2*(parents2 - 1)//2 > pairs
+    parents2 += (parents2 + 1)*parents2//2 <= pairs
+    parents1 = pairs - parents2*(parents2 - 1)//2
+    return parents1, parents2
+
+
+def reproduce(
+    genomes: np.ndarray,
+    mate_probability: float,
+    max_children: Optional[int] = None,
+    rng: Optional[np.random.Generator] = None,
+    return_parents: bool = False,
+) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """Creates the genomes of the children of a generation.
+
+    Every mating pair gives two children with the half-sequence crossover of their parents, see `crossover_genomes`.
+    Only as many pairs as needed for `max_children` children are sampled, see `sample_mating_pairs`.
+
+    Args:
+        genomes (np.ndarray): (N, num_genes) `uint32` genomes of the parents.
+        mate_probability (float): probability of each pair mating.
+        max_children (Optional[int]): maximum number of children to return.
+        rng (Optional[np.random.Generator]): random generator.
+        return_parents (bool): also return the parents of every child.
+
+    Returns:
+        np.ndarray: (num_children, num_genes) `uint32` genomes of the children, and with `return_parents` a
+            (num_children, 2) array with the indices of their parents, the one giving the first half of the sequence
+            first.
+    """
+    parents1, parents2 = sample_mating_pairs(
+        num_parents=len(genomes),
+        mate_probability=mate_probability,
+        max_pairs=None if max_children is None else -(-max_children//2),
+        rng=rng,
+    )
+    genomes1, genomes2 = genomes[parents1], genomes[parents2]
+    children = np.stack([
+        crossover_genomes(genomes1, genomes2),
+        crossover_genomes(genomes2, genomes1),
+    ], axis=1).reshape(-1, genomes.shape[-1])
+    if not return_parents:
+        return children[:max_children]
+    parents = np.stack([
+        np.stack([parents1, parents2], axis=1),
+        np.stack([parents2, parents1], axis=1),
+    ], axis=1).reshape(-1, 2)
+    return children[:max_children], parents[:max_children]
@@ -0,0 +1,134 @@
+import numpy as np
+from typing import Iterable, List, Tuple
+from .world import DENSE_MAX_CELLS
+
+
+class HeatField():
+    """Cached heat risk field of the world.
+
+    Keeps the burn risk (sum of the inverse distance to every heat source) of every cell of the world in a NumPy
+    raster, so sensing the heat is an array lookup instead of a sum over every heat source. Adding or removing a heat
+    source updates the field with the contribution of that source only.
+
+    It supports `coords in field` to tell whether a cell holds a heat source. `version` goes up every time a heat
+    source is added or removed, so callers caching what they sensed can tell when it is stale.
+
+    Args:
+        world_size (Tuple[int, int]): size of the 2-D world.
+        heat_sources (Iterable[Tuple[int, int]]): initial heat sources.
+    """
+
+    def __init__(
+        self,
+        world_size: Tuple[int, int],
+        heat_sources: Iterable[Tuple[int, int]] = (),
+    ) -> None:
+        self.world_size = tuple(world_size)
+        self.heat_sources: List[Tuple[int, int]] = []
+        self.version = 0
+        self.field = np.zeros(self.world_size)
+        self.burning = np.zeros(self.world_size, dtype=np.int64)
+        for heat_source in heat_sources:
+            self.add_source(heat_source)
+
+    def __bool__(self) -> bool:
+        return len(self.heat_sources) > 0
+
+    def __contains__(self, coords: Tuple[int, int]) -> bool:
+        return self.in_bounds(coords) and self.burning[coords[0], coords[1]] > 0
+
+    def in_bounds(self, coords: Tuple[int, int]) -> bool:
+        return 0 <= coords[0] < self.world_size[0] and 0 <= coords[1] < self.world_size[1]
+
+    def _inverse_distances(self, heat_source: Tuple[int, int]) -> np.ndarray:
+        rows = np.arange(self.world_size[0])[:, None] - heat_source[0]
+        cols = np.arange(self.world_size[1])[None, :] - heat_source[1]
+        with np.errstate(divide='ignore'):
+            inverse_distances = 1/np.sqrt(rows**2 + cols**2)
+        inverse_distances[~np.isfinite(inverse_distances)] = 0
+        return inverse_distances
+
+    def add_source(self, heat_source: Tuple[int, int]) -> None:
+        heat_source = tuple(heat_source)
+        self.field += self._inverse_distances(heat_source)
+        if self.in_bounds(heat_source):
+            self.burning[heat_source[0], heat_source[1]] += 1
+        self.heat_sources.append(heat_source)
+        self.version += 1
+
+    def remove_source(self, heat_source: Tuple[int, int]) -> None:
+        heat_source = tuple(heat_source)
+        self.heat_sources.remove(heat_source)
+        if self.in_bounds(heat_source):
+            self.burning[heat_source[0], heat_source[1]] -= 1
+        if self.heat_sources:
+            self.field -= self._inverse_distances(heat_source)
+        else:
+            self.field[:] = 0
+        self.version += 1
+
+    def risk(self, coords: np.ndarray) -> np.ndarray:
+        """Burn risk of an (N, 2) array of coordinates, rounded to 3 decimals."""
+        return np.round(self.field[coords[:, 0], coords[:, 1]], 3)
+
+    def is_burning(self, coords: np.ndarray) -> np.ndarray:
+        """Whether each of an (N, 2) array of coordinates holds a heat source."""
+        return self.burning[coords[:, 0], coords[:, 1]] > 0
+
+
+class SparseHeatField(HeatField):
+    """Heat risk field of worlds too large for a raster.
+
+    Same interface as `HeatField`, but the risk of the sensed cells is summed over the heat sources when asked for,
+    in the order they were added as the raster does, so memory grows with the population instead of with the area of
+    the world.
+
+    Args:
+        world_size (Tuple[int, int]): size of the 2-D world.
+        heat_sources (Iterable[Tuple[int, int]]): initial heat sources.
+    """
+
+    def __init__(
+        self,
+        world_size: Tuple[int, int],
+        heat_sources: Iterable[Tuple[int, int]] = (),
+    ) -> None:
+        self.world_size = tuple(world_size)
+        self.heat_sources: List[Tuple[int, int]] = []
+        self.version = 0
+        for heat_source in heat_sources:
+            self.add_source(heat_source)
+
+    def __contains__(self, coords: Tuple[int, int]) -> bool:
+        return self.in_bounds(coords) and tuple(coords) in self.heat_sources
+
+    def add_source(self, heat_source: Tuple[int, int]) -> None:
+        self.heat_sources.append(tuple(heat_source))
+        self.version += 1
+
+    def remove_source(self, heat_source: Tuple[int, int]) -> None:
+        self.heat_sources.remove(tuple(heat_source))
+        self.version += 1
+
+    def risk(self, coords: np.ndarray) -> np.ndarray:
+        risk = np.zeros(len(coords))
+        for heat_source in self.heat_sources:
+            with np.errstate(divide='ignore'):
+                inverse_distances = 1/np.sqrt(
+                    (coords[:, 0] - heat_source[0])**2 + (coords[:, 1] - heat_source[1])**2
+                )
+            inverse_distances[~np.isfinite(inverse_distances)] = 0
+            risk += inverse_distances
+        return np.round(risk, 3)
+
+    def is_burning(self, coords: np.ndarray) -> np.ndarray:
+        burning = np.zeros(len(coords), dtype=bool)
+        for heat_source in self.heat_sources:
+            burning |= (coords[:, 0] == heat_source[0]) & (coords[:, 1] == heat_source[1])
+        return burning
+
+
+def create_heat_field(world_size: Tuple[int, int], heat_sources: Iterable[Tuple[int, int]] = ()) -> HeatField:
+    """`HeatField` of the world, or `SparseHeatField` if it has more than `DENSE_MAX_CELLS` cells."""
+    field_class = HeatField if world_size[0]*world_size[1] <= DENSE_MAX_CELLS else SparseHeatField
+    return field_class(world_size, heat_sources=heat_sources)
@@ -1,7 +1,9 @@
-from math import dist
 import numpy as np
-from typing import Tuple, List, Optional
+from typing import Tuple, Optional
 from .brain import Brain
+from .genome import mutate_genomes, crossover_genomes
+from .heat import HeatField
+from .world import OccupancyGrid
 # from .keras_brain import Brain as KerasBrain
 
 
@@ -19,69 +21,77 @@ class Individual():
 
     def __init__(
         self,
-        individual_id: str,
+        individual_id: int,
         lifespan: int,
         world_size: Tuple[int, int],
         initial_coords: Optional[Tuple[int, int]] = None,
         num_genes: Optional[int] = None,
+        brain: Optional[Brain] = None,
     ) -> None:
         self.id = individual_id
-        self.brain = Brain.init_random_genes(num_genes or self.DEFAULT_NUM_GENES)
+        self.brain = brain or Brain.init_random_genes(num_genes or self.DEFAULT_NUM_GENES)
         self.coords = initial_coords
         self.lifespan = lifespan
         self.world_size = world_size
         self.input_vector = None
         self.alive = True
         self.step = 0
-        self.express_color()
 
-    def express_color(self):
-        self.color = self.brain.hex_gene_sequence
+    @property
+    def name(self) -> str:
+        """String id for the UI, see `Lineage.names`."""
+        return f"individual_{self.id}"
+
+    @property
+    def color(self) -> str:
+        return self.brain.hex_gene_sequence
 
     def sense_env(
         self,
-        mate_coordinates: List[Tuple[int, int]],
-        heat_sources: List[Tuple[int, int]],
+        occupancy: OccupancyGrid,
+        heat_field: Optional[HeatField] = None,
+        rng: Optional[np.random.Generator] = None,
     ):
         heat_risk = 0
-        if heat_sources:
-            try:
-                heat_risk = np.round(np.sum([1/dist(self.coords, heat) for heat in heat_sources]), 3)
+        if heat_field:
+            if self.coords in heat_field:
+                self.alive = False
+            else:
+                heat_risk = heat_field.risk(np.asarray([self.coords]))[0]
                 if heat_risk > self.HEAT_RISK_THRESHOLD:
                     self.alive = False
-            except ZeroDivisionError:
-                self.alive = False
 
         if self.alive:
+            random_inputs = (np.random.rand(2) if rng is None else rng.random(2)) - 0.5
             self.input_vector = np.array([
                 np.uint16(self.coords[0]),  # distance to the top
                 np.uint16(self.world_size[0] - self.coords[0] - 1),  # distance to the bottom
                 np.uint16(self.coords[1]),  # distance to the left wall
                 np.uint16(self.world_size[1] - self.coords[1] - 1),  # distance to the right wall
-                np.uint8((self.coords[0] - 1, self.coords[1] - 1) in mate_coordinates),  # top left
-                np.uint8((self.coords[0] - 1, self.coords[1]) in mate_coordinates),  # top
-                np.uint8((self.coords[0] - 1, self.coords[1] + 1) in mate_coordinates),  # top right
-                np.uint8((self.coords[0], self.coords[1] - 1) in mate_coordinates),  # left
-                np.uint8((self.coords[0], self.coords[1] + 1) in mate_coordinates),  # right
-                np.uint8((self.coords[0] + 1, self.coords[1] - 1) in mate_coordinates),  # bottom left
-                np.uint8((self.coords[0] + 1, self.coords[1]) in mate_coordinates),  # bottom
-                np.uint8((self.coords[0] + 1, self.coords[1] + 1) in mate_coordinates),  # bottom right
+                np.uint8((self.coords[0] - 1, self.coords[1] - 1) in occupancy),  # top left
+                np.uint8((self.coords[0] - 1, self.coords[1]) in occupancy),  # top
+                np.uint8((self.coords[0] - 1, self.coords[1] + 1) in occupancy),  # top right
+                np.uint8((self.coords[0], self.coords[1] - 1) in occupancy),  # left
+                np.uint8((self.coords[0], self.coords[1] + 1) in occupancy),  # right
+                np.uint8((self.coords[0] + 1, self.coords[1] - 1) in occupancy),  # bottom left
+                np.uint8((self.coords[0] + 1, self.coords[1]) in occupancy),  # bottom
+                np.uint8((self.coords[0] + 1, self.coords[1] + 1) in occupancy),  # bottom right
                 heat_risk,  # burn risk
                 np.round(self.step/self.lifespan, 3),  # lifespan
-                (np.random.rand() - 0.5),  # random
-                (np.random.rand() - 0.5),  # random
+                random_inputs[0],  # random
+                random_inputs[1],  # random
             ]).reshape(1, -1)
     
-    def valid_coordinates(self, coords: Tuple[int, int], mate_coordinates: List[Tuple[int, int]]):
+    def valid_coordinates(self, coords: Tuple[int, int], occupancy: OccupancyGrid):
         return (
             coords[0] >= 0
             and coords[1] >= 0
             and coords[0] < self.world_size[0]
             and coords[1] < self.world_size[1]
-            and coords not in mate_coordinates
+            and coords not in occupancy
         )
 
-    def take_step(self, mate_coordinates: List[Tuple[int, int]]):
+    def take_step(self, occupancy: OccupancyGrid):
         output = self.brain.output(self.input_vector)
 
         kill_threshold = 1
@@ -105,37 +115,38 @@ class Individual():
         
         if coords_delta != [0, 0]:
             new_coords = tuple(sum(e) for e in zip(self.coords, coords_delta))
-            if self.valid_coordinates(new_coords, mate_coordinates):
+            if self.valid_coordinates(new_coords, occupancy):
+                occupancy.move(self.coords, new_coords)
                 self.coords = new_coords
 
         self.step += 1
         return output
 
-    def mute(self, mute_probability: float) -> None:
+    def mute(self, mute_probability: float, rng: Optional[np.random.Generator] = None) -> int:
         """Mute function.
 
         Args:
             mute_probability (float): _description_
+            rng (Optional[np.random.Generator]): random generator, shared by the whole population.
+
+        Returns:
+            int: number of genes that changed.
         """
-        new_hex_gene_sequence = ''.join([
-            (
-                hex(np.random.randint(0, 16))[2:]
-                if np.random.rand() < mute_probability
-                else self.brain.hex_gene_sequence[i]
-            )
-            for i in range(len(self.brain.hex_gene_sequence))
-        ])
-        if new_hex_gene_sequence != self.brain.hex_gene_sequence:
-            self.brain.hex_gene_sequence = new_hex_gene_sequence
-            self.brain.express_genes()
+        # the brain can be shared with clones, so mutations go to a new brain
+        genes = self.brain.genes.copy()
+        changed = mutate_genomes(genes.reshape(1, -1), mute_probability=mute_probability, rng=rng)
+        if len(changed):
+            self.brain = Brain(genes=genes)
+        return len(changed)
 
 
 def mate(
     ind1: Individual,
     ind2: Individual,
     mate_probability: float,
-    child1_id: str,
-    child2_id: str,
+    child1_id: int,
+    child2_id: int,
+    rng: Optional[np.random.Generator] = None,
 ) -> Tuple[Individual, Individual]:
     """Mate function.
 
@@ -143,31 +154,26 @@ def mate(
         ind1 (Individual): _description_
         ind2 (Individual): _description_
         mate_probability (float): _description_
+        rng (Optional[np.random.Generator]): random generator. Defaults to the global `np.random` state.
 
     Returns:
         Tuple[Individual, Individual]: _description_
     """
-    if np.random.rand() < mate_probability:
+    if (np.random.rand() if rng is None else rng.random()) < mate_probability:
         child1 = Individual(
             individual_id=child1_id,
             initial_coords=None,
             lifespan=ind1.lifespan,
             world_size=ind1.world_size,
+            brain=Brain(genes=crossover_genomes(ind1.brain.genes, ind2.brain.genes)),
         )
         child2 = Individual(
             individual_id=child2_id,
             initial_coords=None,
             lifespan=ind2.lifespan,
             world_size=ind2.world_size,
+            brain=Brain(genes=crossover_genomes(ind2.brain.genes, ind1.brain.genes)),
         )
-        
-        half_sequence = int(len(ind1.brain.hex_gene_sequence)/2)
-        child1_seq = ind1.brain.hex_gene_sequence[:half_sequence] + ind2.brain.hex_gene_sequence[half_sequence:]
-        child2_seq = ind2.brain.hex_gene_sequence[:half_sequence] + ind1.brain.hex_gene_sequence[half_sequence:]
-        child1.brain = Brain(hex_gene_sequence=child1_seq)
-        child1.express_color()
-        child2.brain = Brain(hex_gene_sequence=child2_seq)
-        child2.express_color()
         return (child1, child2)
     else:
         return (None, None)
@@ -0,0 +1,163 @@
+import numpy as np
+from typing import List, Literal
+
+
+class Lineage():
+    """Append-only record of the births and mutations of a run.
+
+    Every individual gets a compact integer id, its row in the birth arrays, and keeps it while it survives from one
+    generation to the next:
+    - `parents`: (N, 2) ids of the parents, the first one gives the first half of the genome, see `crossover_genomes`.
+      Founders have no parents (-1), clones have the cloned individual as both parents.
+    - `generations`: generation every individual was born into.
+    - `kinds`: `FOUNDER`, `CROSSOVER` or `CLONE`.
+
+    Mutations are recorded as events: `mutation_ids`, `mutation_generations` and `mutation_counts` (number of genes
+    that changed). Arrays grow by doubling their capacity, so appending a generation of births costs a few array
+    copies. String ids for the UI are only built when asked for, see `names`.
+
+    Args:
+        capacity (int): initial number of births that fit in the arrays.
+    """
+
+    FOUNDER: Literal[0] = 0
+    CROSSOVER: Literal[1] = 1
+    CLONE: Literal[2] = 2
+    NO_PARENT: Literal[-1] = -1
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.num_births = 0
+        self.num_mutations = 0
+        self._parents = np.full((capacity, 2), self.NO_PARENT, dtype=np.int64)
+        self._generations = np.zeros(capacity, dtype=np.int64)
+        self._kinds = np.zeros(capacity, dtype=np.uint8)
+        self._mutations = np.zeros((capacity, 3), dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.num_births
+
+    @staticmethod
+    def _reserve(array: np.ndarray, size: int, fill_value: int = 0) -> np.ndarray:
+        if size <= len(array):
+            return array
+        grown = np.full((max(size, 2*len(array)), *array.shape[1:]), fill_value, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    @property
+    def parents(self) -> np.ndarray:
+        return self._parents[:self.num_births]
+
+    @property
+    def generations(self) -> np.ndarray:
+        return self._generations[:self.num_births]
+
+    @property
+    def kinds(self) -> np.ndarray:
+        return self._kinds[:self.num_births]
+
+    @property
+    def mutation_ids(self) -> np.ndarray:
+        return self._mutations[:self.num_mutations, 0]
+
+    @property
+    def mutation_generations(self) -> np.ndarray:
+        return self._mutations[:self.num_mutations, 1]
+
+    @property
+    def mutation_counts(self) -> np.ndarray:
+        return self._mutations[:self.num_mutations, 2]
+
+    def add_births(self, parents: np.ndarray, generation: int, kind: int) -> np.ndarray:
+        """Records a batch of births.
+
+        Args:
+            parents (np.ndarray): (n, 2) ids of the parents of every newborn.
+            generation (int): generation they are born into.
+            kind (int): `FOUNDER`, `CROSSOVER` or `CLONE`.
+
+        Returns:
+            np.ndarray: ids of the newborns.
+        """
+        parents = np.asarray(parents, dtype=np.int64).reshape(-1, 2)
+        start, end = self.num_births, self.num_births + len(parents)
+        self._parents = self._reserve(self._parents, end, self.NO_PARENT)
+        self._generations = self._reserve(self._generations, end)
+        self._kinds = self._reserve(self._kinds, end)
+        self._parents[start:end] = parents
+        self._generations[start:end] = generation
+        self._kinds[start:end] = kind
+        self.num_births = end
+        return np.arange(start, end)
+
+    def add_founders(self, num_founders: int, generation: int = 0) -> np.ndarray:
+        return self.add_births(np.full((num_founders, 2), self.NO_PARENT), generation=generation, kind=self.FOUNDER)
+
+    def add_clones(self, ids: np.ndarray, generation: int) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        return self.add_births(np.stack([ids, ids], axis=1), generation=generation, kind=self.CLONE)
+
+    def add_mutations(self, ids: np.ndarray, generation: int, counts: np.ndarray) -> None:
+        """Records that the given individuals had `counts` genes changed at the beginning of `generation`."""
+        start, end = self.num_mutations, self.num_mutations + len(ids)
+        self._mutations = self._reserve(self._mutations, end)
+        self._mutations[start:end, 0] = ids
+        self._mutations[start:end, 1] = generation
+        self._mutations[start:end, 2] = counts
+        self.num_mutations = end
+
+    def ancestry(self, ids: np.ndarray) -> List[np.ndarray]:
+        """Traces individuals back to the founders they descend from.
+
+        Args:
+            ids (np.ndarray): ids of the individuals, e.g. the survivors of the last generation.
+
+        Returns:
+            List[np.ndarray]: sorted unique ids of every level of ancestors: the individuals themselves, their
+                parents, their grandparents... up to the last level with parents.
+        """
+        levels = [np.unique(np.asarray(ids, dtype=np.int64))]
+        while True:
+            parents = self._parents[levels[-1]].reshape(-1)
+            parents = np.unique(parents[parents != self.NO_PARENT])
+            if len(parents) == 0:
+                return levels
+            levels.append(parents)
+
+    def ancestors(self, ids: np.ndarray) -> np.ndarray:
+        """Sorted unique ids of every ancestor of the given individuals, see `ancestry`."""
+        levels = self.ancestry(ids)[1:]
+        return np.unique(np.concatenate(levels)) if levels else np.zeros(0, dtype=np.int64)
+
+    def mutations(self, ids: np.ndarray) -> np.ndarray:
+        """Indices of the mutation events of the given individuals."""
+        return np.flatnonzero(np.isin(self.mutation_ids, ids))
+
+    @staticmethod
+    def names(ids: np.ndarray) -> List[str]:
+        """String ids of individuals, for the UI."""
+        return [f"individual_{i}" for i in np.asarray(ids).tolist()]
+
+    def save(self, path: str) -> str:
+        """Saves the record to an uncompressed `.npz` file, see `load`."""
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                parents=self.parents,
+                generations=self.generations,
+                kinds=self.kinds,
+                mutations=self._mutations[:self.num_mutations],
+            )
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'Lineage':
+        with np.load(path, allow_pickle=False) as arrays:
+            lineage = cls(capacity=max(len(arrays['parents']), 1))
+            lineage.add_births(arrays['parents'], generation=0, kind=cls.FOUNDER)
+            lineage._generations[:lineage.num_births] = arrays['generations']
+            lineage._kinds[:lineage.num_births] = arrays['kinds']
+            mutations = arrays['mutations']
+            lineage.add_mutations(mutations[:, 0], generation=0, counts=mutations[:, 2])
+            lineage._mutations[:lineage.num_mutations, 1] = mutations[:, 1]
+        return lineage
@@ -0,0 +1,90 @@
+import time
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class MetricsCollector():
+    """Per-phase timers and counters of `evolve()`.
+
+    The engines time each phase of a generation with `phase` and count processed items with `count`. At the end of
+    every generation the accumulated timings (in seconds) and counters are passed to `callback` as a record, and added
+    to the run totals returned by `summary`.
+
+    ### Phases
+    - sensing: building the input vectors, including heat deaths.
+    - brain_forward: running the brains (the object engine times it as part of movement).
+    - movement: validating and applying the moves.
+    - survivor_selection: selecting the individuals that survive the generation.
+    - mating: creating the children of the next generation.
+    - mutation: muting the next generation.
+    - repositioning: placing the next generation in the world.
+
+    Args:
+        callback (Optional[Callable[[Dict[str, Any]], None]]): called with the record of every generation.
+    """
+
+    def __init__(self, callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        self.callback = callback
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.total_timings = defaultdict(float)
+        self.total_counters = defaultdict(int)
+        self.num_generations = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] += value
+
+    def end_generation(self, generation: int) -> None:
+        record = {
+            'generation': generation,
+            'timings': dict(self.timings),
+            'counters': dict(self.counters),
+        }
+        for name, value in self.timings.items():
+            self.total_timings[name] += value
+        for name, value in self.counters.items():
+            self.total_counters[name] += value
+        self.num_generations += 1
+        self.timings.clear()
+        self.counters.clear()
+        if self.callback:
+            self.callback(record)
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals of every generation ended so far, plus the timings and counters of the current one."""
+        return {
+            'num_generations': self.num_generations,
+            'timings': dict(self.total_timings),
+            'counters': dict(self.total_counters),
+            'current_generation': {
+                'timings': dict(self.timings),
+                'counters': dict(self.counters),
+            },
+        }
+
+
+class NullMetricsCollector(MetricsCollector):
+    """Collector used when instrumentation is off, every call is a no-op."""
+
+    _NULL_CONTEXT = nullcontext()
+
+    def phase(self, name: str) -> nullcontext:
+        return self._NULL_CONTEXT
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def end_generation(self, generation: int) -> None:
+        pass
+
+
+NULL_METRICS: NullMetricsCollector = NullMetricsCollector()
@@ -0,0 +1,459 @@
+import numpy as np
+from typing import List, Optional, Tuple
+from .brain import Brain, SparseBrains, decision_inputs, fuse_tensors
+from .genome import genes_to_hex, random_genomes, mutate_genomes, reproduce
+from .heat import HeatField
+from .individual import Individual
+from .metrics import MetricsCollector, NULL_METRICS
+from .world import OccupancyGrid, create_occupancy_grid
+
+
+class Population():
+    """Struct-of-arrays population.
+
+    Vectorized counterpart of a list of `Individual` objects. Coordinates, step counters, alive flags and the
+    brain weight tensors of every individual are kept in stacked NumPy arrays, so the whole population senses the
+    environment, runs its brains and moves with a few batched array operations per step. Genomes are stored as a
+    single (N, num_genes) `uint32` array, hex gene sequences are only computed when asked for.
+
+    Individuals that die during a generation are not removed from the arrays, they are just flagged in `alive`.
+
+    Args:
+        genomes (np.ndarray): (N, num_genes) `uint32` genes of every individual.
+        coords (np.ndarray): (N, 2) array with the coordinates of every individual.
+        lifespan (int): number of steps the individuals can take in each generation.
+        world_size (Tuple[int, int]): size of the 2-D world.
+        steps (Optional[np.ndarray]): step counter of every individual. Defaults to zeros.
+        alive (Optional[np.ndarray]): alive flag of every individual. Defaults to all alive.
+        ids (Optional[np.ndarray]): integer id of every individual, see `Lineage`. Defaults to -1, no id.
+    """
+
+    HEAT_RISK_THRESHOLD: float = Individual.HEAT_RISK_THRESHOLD
+
+    def __init__(
+        self,
+        genomes: np.ndarray,
+        coords: np.ndarray,
+        lifespan: int,
+        world_size: Tuple[int, int],
+        steps: Optional[np.ndarray] = None,
+        alive: Optional[np.ndarray] = None,
+        ids: Optional[np.ndarray] = None,
+    ) -> None:
+        self.genomes = np.ascontiguousarray(genomes, dtype=np.uint32)
+        self.coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+        self.lifespan = lifespan
+        self.world_size = tuple(world_size)
+        self.steps = (
+            np.zeros(len(self.genomes), dtype=np.int64)
+            if steps is None
+            else np.asarray(steps, dtype=np.int64)
+        )
+        self.alive = (
+            np.ones(len(self.genomes), dtype=bool)
+            if alive is None
+            else np.asarray(alive, dtype=bool)
+        )
+        self.ids = (
+            np.full(len(self.genomes), -1, dtype=np.int64)
+            if ids is None
+            else np.asarray(ids, dtype=np.int64)
+        )
+        self.express_genes()
+
+    def __len__(self) -> int:
+        return len(self.genomes)
+
+    @property
+    def hex_gene_sequences(self) -> List[str]:
+        """Hex view of `genomes`, computed on demand for the UI."""
+        return [genes_to_hex(genes) for genes in self.genomes]
+
+    @classmethod
+    def random(
+        cls,
+        population_size: int,
+        lifespan: int,
+        world_size: Tuple[int, int],
+        coords: np.ndarray,
+        num_genes: Optional[int] = None,
+        rng: Optional[np.random.Generator] = None,
+    ):
+        rng = rng or np.random.default_rng()
+        num_genes = num_genes or Individual.DEFAULT_NUM_GENES
+        return cls(
+            genomes=random_genomes(population_size, num_genes, rng=rng),
+            coords=coords,
+            lifespan=lifespan,
+            world_size=world_size,
+        )
+
+    @classmethod
+    def from_individuals(cls, individuals: List[Individual]):
+        return cls(
+            genomes=np.stack([ind.brain.genes for ind in individuals]),
+            coords=[ind.coords for ind in individuals],
+            lifespan=individuals[0].lifespan,
+            world_size=individuals[0].world_size,
+            steps=[ind.step for ind in individuals],
+            alive=[ind.alive for ind in individuals],
+            ids=[ind.id for ind in individuals],
+        )
+
+    def to_individuals(self) -> List[Individual]:
+        """`Individual` objects of the alive individuals, individuals with no id get their index as id."""
+        individuals = []
+        ids = np.where(self.ids >= 0, self.ids, np.arange(len(self)))
+        for i in np.flatnonzero(self.alive):
+            ind = Individual(
+                individual_id=int(ids[i]),
+                lifespan=self.lifespan,
+                world_size=self.world_size,
+                initial_coords=tuple(self.coords[i].tolist()),
+                brain=Brain(genes=self.genomes[i].copy()),
+            )
+            ind.step = int(self.steps[i])
+            individuals.append(ind)
+        return individuals
+
+    def express_genes(self, indices: Optional[np.ndarray] = None):
+        """Decodes the genomes of the population into stacked weight tensors with a single batched call.
+
+        Args:
+            indices (Optional[np.ndarray]): only re-express the brains of these individuals. Defaults to all of them.
+        """
+        if indices is None:
+            (
+                self.input_inner_tensor,
+                self.inner_inner_tensor,
+                self.inner_output_tensor,
+                self.input_output_tensor,
+            ) = Brain.decode_genes(self.genomes)
+        else:
+            tensors = Brain.decode_genes(self.genomes[indices])
+            self.input_inner_tensor[indices] = tensors[0]
+            self.inner_inner_tensor[indices] = tensors[1]
+            self.inner_output_tensor[indices] = tensors[2]
+            self.input_output_tensor[indices] = tensors[3]
+        self.compile_brains()
+
+    def compile_brains(self):
+        """Fuses the weight tensors of every brain, see `fuse_tensors`, and builds their edge lists if the brains are
+        sparse enough, see `SparseBrains`."""
+        self.first_layer, self.second_layer = fuse_tensors(
+            self.input_inner_tensor,
+            self.inner_inner_tensor,
+            self.inner_output_tensor,
+            self.input_output_tensor,
+        )
+        self.sparse_brains = SparseBrains(self.first_layer, self.second_layer)
+        if self.sparse_brains.num_edges > Brain.SPARSE_MAX_EDGES*len(self):
+            self.sparse_brains = None
+        self.decision_inputs = decision_inputs(
+            self.input_inner_tensor,
+            self.inner_inner_tensor,
+            self.inner_output_tensor,
+            self.input_output_tensor,
+        )
+        self.static_decisions = ~self.decision_inputs[:, Brain.TIME_VARYING_INPUTS].any(axis=(1, 2))
+
+    def subset(self, indices: np.ndarray):
+        """Creates a new population with the given individuals.
+
+        Args:
+            indices (np.ndarray): indices of the individuals to keep, repeated indices clone the individual.
+
+        Returns:
+            Population: new population sharing no arrays with this one.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        population = Population.__new__(Population)
+        population.genomes = self.genomes[indices]
+        population.coords = self.coords[indices]
+        population.lifespan = self.lifespan
+        population.world_size = self.world_size
+        population.steps = self.steps[indices]
+        population.alive = self.alive[indices]
+        population.ids = self.ids[indices]
+        population.input_inner_tensor = self.input_inner_tensor[indices]
+        population.inner_inner_tensor = self.inner_inner_tensor[indices]
+        population.inner_output_tensor = self.inner_output_tensor[indices]
+        population.input_output_tensor = self.input_output_tensor[indices]
+        population.compile_brains()
+        return population
+
+    @classmethod
+    def concatenate(cls, populations: List['Population']):
+        population = cls.__new__(cls)
+        population.genomes = np.concatenate([pop.genomes for pop in populations])
+        population.coords = np.concatenate([pop.coords for pop in populations])
+        population.lifespan = populations[0].lifespan
+        population.world_size = populations[0].world_size
+        population.steps = np.concatenate([pop.steps for pop in populations])
+        population.alive = np.concatenate([pop.alive for pop in populations])
+        population.ids = np.concatenate([pop.ids for pop in populations])
+        for tensor in ('input_inner_tensor', 'inner_inner_tensor', 'inner_output_tensor', 'input_output_tensor'):
+            setattr(population, tensor, np.concatenate([getattr(pop, tensor) for pop in populations]))
+        population.compile_brains()
+        return population
+
+    def occupancy(self) -> OccupancyGrid:
+        """Occupancy grid of the alive individuals, with their indices as occupant ids.
+
+        Worlds too large for a raster get a `SparseOccupancyGrid`, see `create_occupancy_grid`.
+        """
+        indices = np.flatnonzero(self.alive)
+        return create_occupancy_grid(self.world_size, self.coords[indices], occupant_ids=indices)
+
+    def sense_env(
+        self,
+        occupancy: OccupancyGrid,
+        heat_field: Optional[HeatField],
+        rng: np.random.Generator,
+        idle: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Builds the input vectors of every alive individual.
+
+        Individuals that get burnt by a heat source are flagged as dead and removed from `occupancy`.
+
+        Args:
+            occupancy (OccupancyGrid): occupancy grid of the population.
+            heat_field (Optional[HeatField]): heat risk field of the world.
+            rng (np.random.Generator): random generator for the random neurons.
+            idle (Optional[np.ndarray]): alive individuals that are not sensed, see `take_step`. Their random neurons
+                are drawn anyway, so the random stream does not depend on them.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: indices of the individuals still alive and their (n, 16) input vectors.
+        """
+        indices = np.flatnonzero(self.alive if idle is None else self.alive & ~idle)
+        coords = self.coords[indices]
+
+        heat_risk = np.zeros(len(indices))
+        if heat_field:
+            heat_risk = heat_field.risk(coords)
+            dead = heat_field.is_burning(coords) | (heat_risk > self.HEAT_RISK_THRESHOLD)
+            self.alive[indices[dead]] = False
+            occupancy.remove_many(coords[dead])
+            indices, coords, heat_risk = indices[~dead], coords[~dead], heat_risk[~dead]
+
+        random_inputs = rng.random((int(self.alive.sum()) if idle is not None else len(indices), 2)) - 0.5
+        if idle is not None:
+            # one row per alive individual, in index order
+            random_inputs = random_inputs[np.searchsorted(np.flatnonzero(self.alive), indices)]
+
+        input_vectors = np.empty((len(indices), Brain.NUM_INPUT_NEURONS))
+        input_vectors[:, 0] = coords[:, 0]  # distance to the top
+        input_vectors[:, 1] = self.world_size[0] - coords[:, 0] - 1  # distance to the bottom
+        input_vectors[:, 2] = coords[:, 1]  # distance to the left wall
+        input_vectors[:, 3] = self.world_size[1] - coords[:, 1] - 1  # distance to the right wall
+        input_vectors[:, 4:12] = occupancy.neighbours(coords)  # top left ... bottom right
+        input_vectors[:, 12] = heat_risk  # burn risk
+        input_vectors[:, 13] = np.round(self.steps[indices]/self.lifespan, 3)  # lifespan
+        input_vectors[:, 14:16] = random_inputs  # random
+        return indices, input_vectors
+
+    def output(self, indices: np.ndarray, input_vectors: np.ndarray) -> np.ndarray:
+        """Batched `Brain.output` for the given individuals, with the compiled brains.
+
+        Decision outputs too close to zero for the rounding differences of the compiled brains to be ruled out, unless
+        every input connected to them is 0, are recomputed with `reference_output`, so the decisions are the same.
+        """
+        if self.sparse_brains is not None:
+            output = self.sparse_brains.output(indices, input_vectors)
+        else:
+            first_sum = np.einsum('ni,nij->nj', input_vectors, self.first_layer[indices])
+            inner_result = np.tanh(first_sum[:, :Brain.NUM_INNER_NEURONS])
+            output = np.tanh(
+                np.einsum('ni,nij->nj', inner_result, self.second_layer[indices])
+                + first_sum[:, Brain.NUM_INNER_NEURONS:]
+            )
+
+        near_zero = np.abs(output[:, :Brain.NUM_DECISION_OUTPUTS]) <= Brain.DECISION_TOLERANCE
+        candidates = np.flatnonzero(near_zero.any(axis=1))
+        # decisions whose connected inputs are all 0 are exactly 0 with both computations
+        connected = ((input_vectors[candidates, :, None] != 0) & self.decision_inputs[indices[candidates]]).any(axis=1)
+        ambiguous = candidates[(near_zero[candidates] & connected).any(axis=1)]
+        if len(ambiguous):
+            output[ambiguous] = self.reference_output(indices[ambiguous], input_vectors[ambiguous])
+        return output
+
+    def reference_output(self, indices: np.ndarray, input_vectors: np.ndarray) -> np.ndarray:
+        """Batched `Brain.reference_output` for the given individuals."""
+        input_inner_sum = np.einsum('ni,nij->nj', input_vectors, self.input_inner_tensor[indices])
+        inner_inner_sum = np.einsum('ni,nij->nj', input_inner_sum, self.inner_inner_tensor[indices])
+
+        inner_result = np.tanh(input_inner_sum + inner_inner_sum)
+        inner_output_sum = np.einsum('ni,nij->nj', inner_result, self.inner_output_tensor[indices])
+        input_output_sum = np.einsum('ni,nij->nj', input_vectors, self.input_output_tensor[indices])
+
+        return np.tanh(inner_output_sum + input_output_sum)
+
+    def move(self, indices: np.ndarray, output: np.ndarray, occupancy: OccupancyGrid) -> np.ndarray:
+        """Moves the given individuals according to the outputs of their brains.
+
+        A move is valid if the target cell is inside the world and was free before anyone moved. When several
+        individuals want the same cell, the one with the lowest index gets it.
+
+        Args:
+            indices (np.ndarray): indices of the individuals that move.
+            output (np.ndarray): (n, 4) outputs of their brains.
+            occupancy (OccupancyGrid): occupancy grid of the population, updated in place.
+
+        Returns:
+            np.ndarray: indices of the individuals that actually moved.
+        """
+        coords = self.coords[indices]
+        new_coords = coords + np.sign(output[:, :2]).astype(np.int64)
+        valid = (new_coords != coords).any(axis=1) & occupancy.free(new_coords)
+
+        # lowest index wins when several individuals want the same cell
+        candidates = np.flatnonzero(valid)
+        flat_targets = new_coords[candidates, 0]*self.world_size[1] + new_coords[candidates, 1]
+        _, first = np.unique(flat_targets, return_index=True)
+        movers = candidates[first]
+
+        occupancy.remove_many(coords[movers])
+        occupancy.place_many(new_coords[movers], indices[movers])
+        self.coords[indices[movers]] = new_coords[movers]
+        self.steps[indices] += 1
+        return indices[movers]
+
+    def take_step(
+        self,
+        occupancy: OccupancyGrid,
+        heat_field: Optional[HeatField],
+        rng: np.random.Generator,
+        metrics: MetricsCollector = NULL_METRICS,
+        idle: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Advances the whole population one step.
+
+        Every alive individual senses the environment at the same time and then tries to move, see `move`.
+
+        If `idle` is given, individuals that can not move before something changes around them are skipped. An
+        individual is idle after a step where it did not move if its decisions do not depend on the age and random
+        inputs, see `static_decisions`: its next decision is the same as long as no cell next to it changes, and
+        it stays blocked or still. The step, and the random stream, are the same as without skipping.
+
+        Args:
+            occupancy (OccupancyGrid): occupancy grid of the population, updated in place.
+            heat_field (Optional[HeatField]): heat risk field of the world.
+            rng (np.random.Generator): random generator for the random neurons.
+            metrics (MetricsCollector): collector timing the sensing, brain forward and movement phases.
+            idle (Optional[np.ndarray]): (N,) idle flags, all `False` at the beginning of a generation and after the
+                heat sources change, updated in place.
+
+        Returns:
+            np.ndarray: outputs of the brains of the individuals that took the step.
+        """
+        alive = np.flatnonzero(self.alive) if idle is not None else None
+        num_idle = 0 if idle is None else int(np.count_nonzero(idle))
+        with metrics.phase('sensing'):
+            indices, input_vectors = self.sense_env(occupancy=occupancy, heat_field=heat_field, rng=rng, idle=idle)
+        with metrics.phase('brain_forward'):
+            output = self.output(indices, input_vectors)
+        with metrics.phase('movement'):
+            coords = self.coords[indices]
+            movers = self.move(indices, output, occupancy)
+            if idle is not None:
+                self.steps[idle] += 1
+                dead = alive[~self.alive[alive]]
+                changed_cells = np.concatenate([
+                    coords[np.searchsorted(indices, movers)],
+                    self.coords[movers],
+                    self.coords[dead],
+                ])
+                self.update_idle(idle, indices, movers, changed_cells, occupancy)
+        metrics.count('individuals_processed', len(indices))
+        metrics.count('moves', len(movers))
+        metrics.count('individuals_skipped', num_idle)
+        return output
+
+    def update_idle(
+        self,
+        idle: np.ndarray,
+        indices: np.ndarray,
+        movers: np.ndarray,
+        changed_cells: np.ndarray,
+        occupancy: OccupancyGrid,
+    ) -> None:
+        """Updates the idle flags after a step, see `take_step`.
+
+        Args:
+            idle (np.ndarray): (N,) idle flags, updated in place.
+            indices (np.ndarray): individuals that took the step.
+            movers (np.ndarray): individuals that moved.
+            changed_cells (np.ndarray): (n, 2) cells that were left, taken or freed by a death during the step.
+            occupancy (OccupancyGrid): occupancy grid after the step.
+        """
+        idle[indices] = self.static_decisions[indices]
+        idle[movers] = False
+        idle[~self.alive] = False
+        offsets = np.asarray(((0, 0),) + OccupancyGrid.NEIGHBOUR_OFFSETS)
+        occupants = occupancy.occupants((changed_cells[:, None, :] + offsets).reshape(-1, 2))
+        idle[occupants[occupants != OccupancyGrid.EMPTY]] = False
+
+    def settled(self, idle: np.ndarray) -> bool:
+        """Whether every alive individual is idle, so the rest of the generation only ages the population."""
+        return bool(idle[self.alive].all())
+
+    def idle_step(self, rng: np.random.Generator) -> None:
+        """Step of a settled population, see `settled`: only the step counters and the random stream advance."""
+        alive = np.flatnonzero(self.alive)
+        rng.random((len(alive), 2))
+        self.steps[alive] += 1
+
+    def mute(self, mute_probability: float, rng: np.random.Generator) -> np.ndarray:
+        """Mutes every hex digit of every genome with the given probability, see `mutate_genomes`.
+
+        Only the brains whose genome changed are expressed again.
+
+        Args:
+            mute_probability (float): probability of replacing each hex digit with a random one.
+            rng (np.random.Generator): random generator.
+
+        Returns:
+            np.ndarray: sorted flat indices, `individual*num_genes + gene`, of the genes that changed.
+        """
+        changed = mutate_genomes(self.genomes, mute_probability=mute_probability, rng=rng)
+        if len(changed):
+            self.express_genes(np.unique(changed//self.genomes.shape[1]))
+        return changed
+
+    def mate(
+        self,
+        mate_probability: float,
+        rng: np.random.Generator,
+        max_children: Optional[int] = None,
+        return_parents: bool = False,
+    ):
+        """Mates the individuals of the population.
+
+        Each pair mates with probability `mate_probability` and gives two children, each one with one half of the gene
+        sequence of each parent, as `mate` does for `Individual` objects. Only the pairs needed for `max_children`
+        children are sampled, see `reproduce`.
+
+        Args:
+            mate_probability (float): probability of each pair mating.
+            rng (np.random.Generator): random generator.
+            max_children (Optional[int]): maximum number of children.
+            return_parents (bool): also return the (num_children, 2) indices of the parents of every child.
+
+        Returns:
+            Population: the children, with no coordinates and no ids assigned yet.
+        """
+        genomes, parents = reproduce(
+            self.genomes,
+            mate_probability=mate_probability,
+            max_children=max_children,
+            rng=rng,
+            return_parents=True,
+        )
+        children = Population(
+            genomes=genomes,
+            coords=np.zeros((len(genomes), 2), dtype=np.int64),
+            lifespan=self.lifespan,
+            world_size=self.world_size,
+        )
+        return (children, parents) if return_parents else children
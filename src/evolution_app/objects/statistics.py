@@ -0,0 +1,157 @@
+import os
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from .brain import Brain
+
+
+def allele_counts(genomes: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """Number of genomes with each bit set.
+
+    Args:
+        genomes (np.ndarray): (N, num_genes) `uint32` genomes.
+        chunk_size (int): number of genomes unpacked at once, to bound the memory used.
+
+    Returns:
+        np.ndarray: (num_genes*32,) counts, gene by gene, most significant bit first as in the gene structure of
+            `Brain`.
+    """
+    counts = np.zeros(genomes.shape[1]*Brain.GENE_LENGTH, dtype=np.int64)
+    for start in range(0, len(genomes), chunk_size):
+        big_endian = genomes[start:start + chunk_size].astype('>u4')
+        counts += np.unpackbits(big_endian.view(np.uint8), axis=1).sum(axis=0, dtype=np.int64)
+    return counts
+
+
+def mean_hamming_distance(counts: np.ndarray, num_genomes: int) -> float:
+    """Mean Hamming distance between every pair of genomes, from their allele counts.
+
+    Each bit set in `c` of the `n` genomes differs in `c*(n - c)` pairs, so the sum over every bit divided by the
+    number of pairs is the mean distance, without comparing any pair.
+    """
+    if num_genomes < 2:
+        return 0.0
+    return float((counts*(num_genomes - counts)).sum()/(num_genomes*(num_genomes - 1)/2))
+
+
+def num_unique_genomes(genomes: np.ndarray) -> int:
+    """Number of distinct genomes, comparing each genome as a single opaque value."""
+    genomes = np.ascontiguousarray(genomes, dtype=np.uint32)
+    return len(np.unique(genomes.view(np.dtype((np.void, genomes.shape[1]*genomes.itemsize)))))
+
+
+def safe_box_counts(
+    coords: np.ndarray,
+    world_size: Tuple[int, int],
+    safe_boxes: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Individuals standing in each safe box, and the fraction of the cells of each box they occupy.
+
+    Boxes are inclusive ((top, left), (bottom, right)) rectangles clipped to the world, see `compile_survival_mask`.
+    """
+    safe_boxes = safe_boxes or []
+    counts = np.zeros(len(safe_boxes), dtype=np.int64)
+    occupancy = np.zeros(len(safe_boxes))
+    for i, ((top, left), (bottom, right)) in enumerate(safe_boxes):
+        top, left = max(top, 0), max(left, 0)
+        bottom, right = min(bottom, world_size[0] - 1), min(right, world_size[1] - 1)
+        counts[i] = np.count_nonzero(
+            (coords[:, 0] >= top) & (coords[:, 0] <= bottom) & (coords[:, 1] >= left) & (coords[:, 1] <= right)
+        )
+        num_cells = max(bottom - top + 1, 0)*max(right - left + 1, 0)
+        occupancy[i] = counts[i]/num_cells if num_cells else 0
+    return counts, occupancy
+
+
+def generation_statistics(
+    generation: int,
+    genomes: np.ndarray,
+    coords: np.ndarray,
+    alive: np.ndarray,
+    survived: np.ndarray,
+    world_size: Tuple[int, int],
+    safe_boxes: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]] = None,
+) -> Dict[str, np.ndarray]:
+    """Statistics of a generation at its end, before survivor selection.
+
+    Survival and genetic statistics cover every individual of the generation, safe box occupancy the alive ones.
+
+    Args:
+        generation (int): generation index.
+        genomes (np.ndarray): (N, num_genes) genomes of the population.
+        coords (np.ndarray): (N, 2) coordinates of the population.
+        alive (np.ndarray): alive flags of the population.
+        survived (np.ndarray): survival flags of the population.
+        world_size (Tuple[int, int]): size of the 2-D world.
+        safe_boxes (Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]]): safe boxes.
+
+    Returns:
+        Dict[str, np.ndarray]: one row of every column of a `StatisticsLog`.
+    """
+    population_size = len(genomes)
+    num_survivors = int(np.count_nonzero(survived))
+    counts = allele_counts(genomes)
+    box_counts, box_occupancy = safe_box_counts(coords[alive], world_size, safe_boxes)
+    return {
+        'generation': np.int64(generation),
+        'population_size': np.int64(population_size),
+        'num_survivors': np.int64(num_survivors),
+        'survival_rate': np.float64(num_survivors/population_size if population_size else 0),
+        'unique_genomes': np.int64(num_unique_genomes(genomes)),
+        'allele_frequencies': counts/max(population_size, 1),
+        'mean_hamming_distance': np.float64(mean_hamming_distance(counts, population_size)),
+        'safe_box_counts': box_counts,
+        'safe_box_occupancy': box_occupancy,
+    }
+
+
+class StatisticsLog():
+    """Columnar log of per-generation statistics, see `generation_statistics`.
+
+    Every column is a raw little-endian file, `<column>.bin`, that rows are appended to, so a log can be extended by
+    a resumed run and a column can be read without reading the other ones. `columns.json` holds the dtype and the
+    row shape of every column, see `read_statistics`.
+
+    Args:
+        path (str): directory of the log.
+    """
+
+    COLUMNS_FILE: str = 'columns.json'
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        columns_path = os.path.join(path, self.COLUMNS_FILE)
+        self.columns = None
+        if os.path.exists(columns_path):
+            with open(columns_path) as f:
+                self.columns = json.load(f)
+
+    def append(self, row: Dict[str, np.ndarray]) -> None:
+        row = {name: np.asarray(value) for name, value in row.items()}
+        columns = {
+            name: {'dtype': value.dtype.newbyteorder('<').str, 'shape': list(value.shape)}
+            for name, value in row.items()
+        }
+        if self.columns is None:
+            with open(os.path.join(self.path, self.COLUMNS_FILE), 'w') as f:
+                json.dump(columns, f)
+            self.columns = columns
+        elif columns != self.columns:
+            raise Exception(f"Statistics do not match the columns of the log at {self.path}.")
+
+        for name, value in row.items():
+            with open(os.path.join(self.path, f"{name}.bin"), 'ab') as f:
+                f.write(value.astype(self.columns[name]['dtype']).tobytes())
+
+
+def read_statistics(path: str, columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+    """Reads the columns of a `StatisticsLog`, all of them by default, as (num_generations, ...) arrays."""
+    with open(os.path.join(path, StatisticsLog.COLUMNS_FILE)) as f:
+        layout = json.load(f)
+    return {
+        name: np.fromfile(os.path.join(path, f"{name}.bin"), dtype=layout[name]['dtype']).reshape(
+            -1, *layout[name]['shape']
+        )
+        for name in columns or layout
+    }
@@ -0,0 +1,157 @@
+import os
+import json
+import numpy as np
+from typing import Dict, Optional, Tuple
+from .population import Population
+
+
+class TrajectoryRecorder():
+    """Records the trajectory of a simulation to preallocated memory-mapped arrays.
+
+    Every recorded step appends one (individual, row, col) entry per alive individual, and the genomes of every
+    generation are stored once. Files, all of them `.npy` so they can be memory-mapped:
+    - `individuals.npy`, `coords.npy`: index of every entry in the genomes of its generation, and its coordinates.
+    - `frame_starts.npy`, `frame_counts.npy`: first entry and number of entries of every (generation, step) frame.
+    - `genomes.npy`, `population_sizes.npy`: genomes and population size of every generation.
+    - `meta.json`: world configuration.
+
+    Args:
+        path (str): directory the trajectory is saved to.
+        num_generations (int): number of generations that can be recorded.
+        lifespan (int): number of steps of every generation.
+        population_size (int): maximum number of individuals of a generation.
+        num_genes (int): number of genes of every individual.
+        world_size (Tuple[int, int]): size of the 2-D world.
+        start_generation (int): first generation that can be recorded.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        num_generations: int,
+        lifespan: int,
+        population_size: int,
+        num_genes: int,
+        world_size: Tuple[int, int],
+        start_generation: int = 0,
+    ) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.num_generations = num_generations
+        self.lifespan = lifespan
+        self.population_size = population_size
+        self.start_generation = start_generation
+        self.meta = {
+            'num_generations': num_generations,
+            'lifespan': lifespan,
+            'population_size': population_size,
+            'num_genes': num_genes,
+            'world_size': list(world_size),
+            'start_generation': start_generation,
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f)
+
+        capacity = num_generations*lifespan*population_size
+        num_frames = num_generations*lifespan
+        self.individuals = self._open('individuals', (capacity,), np.uint32)
+        self.coords = self._open('coords', (capacity, 2), np.uint16)
+        self.frame_starts = self._open('frame_starts', (num_frames,), np.int64)
+        self.frame_counts = self._open('frame_counts', (num_frames,), np.int64)
+        self.genomes = self._open('genomes', (num_generations, population_size, num_genes), np.uint32)
+        self.population_sizes = self._open('population_sizes', (num_generations,), np.int64)
+        self.num_entries = 0
+        self.last_generation = None
+
+    def _open(self, name: str, shape: Tuple[int, ...], dtype: np.dtype) -> np.memmap:
+        return np.lib.format.open_memmap(os.path.join(self.path, f"{name}.npy"), mode='w+', dtype=dtype, shape=shape)
+
+    def record_step(self, generation: int, step: int, population: Population) -> None:
+        """Appends the alive individuals of a step, and the genomes of its generation the first time it is seen."""
+        generation_i = generation - self.start_generation
+        if generation != self.last_generation:
+            if len(population) > self.population_size:
+                raise Exception(f"Population too big for the recorder: {len(population)} > {self.population_size}.")
+            self.genomes[generation_i, :len(population)] = population.genomes
+            self.population_sizes[generation_i] = len(population)
+            self.last_generation = generation
+
+        alive = np.flatnonzero(population.alive)
+        frame = generation_i*self.lifespan + step
+        self.frame_starts[frame] = self.num_entries
+        self.frame_counts[frame] = len(alive)
+        self.individuals[self.num_entries:self.num_entries + len(alive)] = alive
+        self.coords[self.num_entries:self.num_entries + len(alive)] = population.coords[alive]
+        self.num_entries += len(alive)
+
+    def close(self) -> None:
+        for array in (
+            self.individuals, self.coords, self.frame_starts, self.frame_counts, self.genomes, self.population_sizes,
+        ):
+            array.flush()
+
+
+class Trajectory():
+    """Replay of a trajectory saved by `TrajectoryRecorder`.
+
+    Every array is memory-mapped, so reading any range of generations and steps only reads that part of the files.
+
+    Args:
+        path (str): directory of the trajectory.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.num_generations = self.meta['num_generations']
+        self.lifespan = self.meta['lifespan']
+        self.start_generation = self.meta['start_generation']
+        self.world_size = tuple(self.meta['world_size'])
+        for name in ('individuals', 'coords', 'frame_starts', 'frame_counts', 'genomes', 'population_sizes'):
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+
+    def generation_genomes(self, generation: int) -> np.ndarray:
+        """Genomes of a generation, indexed by the `individual` column of its entries."""
+        generation_i = generation - self.start_generation
+        return self.genomes[generation_i, :self.population_sizes[generation_i]]
+
+    def frame(self, generation: int, step: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Individuals and (N, 2) coordinates of one step."""
+        frame = (generation - self.start_generation)*self.lifespan + step
+        start, count = self.frame_starts[frame], self.frame_counts[frame]
+        return self.individuals[start:start + count], self.coords[start:start + count]
+
+    def entries(
+        self,
+        start_generation: int,
+        end_generation: int,
+        start_step: int = 0,
+        end_step: Optional[int] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Every entry of a range of generations and steps, without re-simulating.
+
+        Args:
+            start_generation (int): first generation.
+            end_generation (int): generation the range stops at.
+            start_step (int): first step of every generation.
+            end_step (Optional[int]): step every generation stops at. Defaults to the lifespan.
+
+        Returns:
+            Dict[str, np.ndarray]: `generation`, `step`, `individual` and (N, 2) `coords` columns.
+        """
+        end_step = self.lifespan if end_step is None else end_step
+        generations = np.arange(start_generation, end_generation)
+        steps = np.arange(start_step, end_step)
+        frames = ((generations[:, None] - self.start_generation)*self.lifespan + steps[None, :]).reshape(-1)
+        starts = self.frame_starts[frames]
+        counts = self.frame_counts[frames]
+
+        # entries of every frame are contiguous: offset every frame start by the position of its entries
+        frame_offsets = np.cumsum(counts) - counts
+        rows = np.repeat(starts - frame_offsets, counts) + np.arange(counts.sum())
+        return {
+            'generation': np.repeat(np.repeat(generations, len(steps)), counts),
+            'step': np.repeat(np.tile(steps, len(generations)), counts),
+            'individual': self.individuals[rows],
+            'coords': self.coords[rows],
+        }
@@ -0,0 +1,354 @@
+import numpy as np
+from typing import Iterable, List, Optional, Tuple
+
+
+DENSE_SAMPLING_FRACTION: float = 0.5
+DENSE_MAX_CELLS: int = 1 << 22
+
+
+def sample_coordinates(
+    pop_size: int,
+    world_size: Tuple[int, int],
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """Samples `pop_size` distinct cells of the world uniformly at random.
+
+    Cells are drawn as flat indices with replacement and duplicates are dropped until there are enough of them, which
+    takes time and memory proportional to `pop_size`. Only when the population takes more than
+    `DENSE_SAMPLING_FRACTION` of the world, a permutation of every cell is used instead.
+
+    Args:
+        pop_size (int): number of cells to sample.
+        world_size (Tuple[int, int]): size of the 2-D world.
+        rng (Optional[np.random.Generator]): random generator.
+
+    Returns:
+        np.ndarray: (pop_size, 2) array of coordinates, in random order.
+    """
+    rng = rng or np.random.default_rng()
+    num_cells = world_size[0]*world_size[1]
+    if pop_size > num_cells:
+        raise Exception(f"Population size of {pop_size} is too big for a {world_size} world.")
+
+    if pop_size > num_cells*DENSE_SAMPLING_FRACTION:
+        cells = rng.permutation(num_cells)[:pop_size]
+    else:
+        cells = np.zeros(0, dtype=np.int64)
+        while len(cells) < pop_size:
+            missing = pop_size - len(cells)
+            cells = np.unique(np.concatenate([cells, rng.integers(0, num_cells, size=missing + missing//8 + 1)]))
+        cells = rng.permutation(cells)[:pop_size]
+    return np.stack(np.divmod(cells, world_size[1]), axis=1)
+
+
+class OccupancyGrid():
+    """World occupancy index.
+
+    Keeps a (height, width) NumPy grid with the id of the individual occupying each cell, or `EMPTY`. The grid is
+    updated in place as individuals move, so neighbour checks and move validation take constant time instead of
+    scanning a list of coordinates.
+
+    It supports `coords in grid`, so it can be used wherever a list of coordinates was used for membership tests.
+
+    Args:
+        world_size (Tuple[int, int]): size of the 2-D world.
+        coordinates (Optional[Iterable[Tuple[int, int]]]): initial occupied cells.
+        occupant_ids (Optional[np.ndarray]): ids of the occupants of `coordinates`. Defaults to their positions.
+    """
+
+    EMPTY: int = -1
+    NEIGHBOUR_OFFSETS: Tuple[Tuple[int, int], ...] = (
+        (-1, -1),  # top left
+        (-1, 0),  # top
+        (-1, 1),  # top right
+        (0, -1),  # left
+        (0, 1),  # right
+        (1, -1),  # bottom left
+        (1, 0),  # bottom
+        (1, 1),  # bottom right
+    )
+
+    def __init__(
+        self,
+        world_size: Tuple[int, int],
+        coordinates: Optional[Iterable[Tuple[int, int]]] = None,
+        occupant_ids: Optional[np.ndarray] = None,
+    ) -> None:
+        self.world_size = tuple(world_size)
+        self.grid = np.full(self.world_size, self.EMPTY, dtype=np.int64)
+        if coordinates is not None:
+            self.place_many(np.asarray(list(coordinates), dtype=np.int64).reshape(-1, 2), occupant_ids)
+
+    def in_bounds(self, coords: Tuple[int, int]) -> bool:
+        return 0 <= coords[0] < self.world_size[0] and 0 <= coords[1] < self.world_size[1]
+
+    def __contains__(self, coords: Tuple[int, int]) -> bool:
+        return self.in_bounds(coords) and self.grid[coords[0], coords[1]] != self.EMPTY
+
+    def is_free(self, coords: Tuple[int, int]) -> bool:
+        return self.in_bounds(coords) and self.grid[coords[0], coords[1]] == self.EMPTY
+
+    def occupant(self, coords: Tuple[int, int]) -> int:
+        return int(self.grid[coords[0], coords[1]]) if self.in_bounds(coords) else self.EMPTY
+
+    def place(self, coords: Tuple[int, int], occupant_id: int = 0) -> None:
+        self.grid[coords[0], coords[1]] = occupant_id
+
+    def remove(self, coords: Tuple[int, int]) -> None:
+        self.grid[coords[0], coords[1]] = self.EMPTY
+
+    def move(self, old_coords: Tuple[int, int], new_coords: Tuple[int, int]) -> None:
+        self.grid[new_coords[0], new_coords[1]] = self.grid[old_coords[0], old_coords[1]]
+        self.grid[old_coords[0], old_coords[1]] = self.EMPTY
+
+    def place_many(self, coords: np.ndarray, occupant_ids: Optional[np.ndarray] = None) -> None:
+        """Vectorized `place` for an (N, 2) array of coordinates."""
+        occupant_ids = np.arange(len(coords)) if occupant_ids is None else occupant_ids
+        self.grid[coords[:, 0], coords[:, 1]] = occupant_ids
+
+    def remove_many(self, coords: np.ndarray) -> None:
+        """Vectorized `remove` for an (N, 2) array of coordinates."""
+        self.grid[coords[:, 0], coords[:, 1]] = self.EMPTY
+
+    def in_bounds_many(self, coords: np.ndarray) -> np.ndarray:
+        return (
+            (coords[:, 0] >= 0)
+            & (coords[:, 1] >= 0)
+            & (coords[:, 0] < self.world_size[0])
+            & (coords[:, 1] < self.world_size[1])
+        )
+
+    def occupants(self, coords: np.ndarray) -> np.ndarray:
+        """Ids of the occupants of an (N, 2) array of coordinates, `EMPTY` for free or out of the world cells."""
+        inside = self.in_bounds_many(coords)
+        occupants = np.full(len(coords), self.EMPTY, dtype=np.int64)
+        occupants[inside] = self.grid[coords[inside, 0], coords[inside, 1]]
+        return occupants
+
+    def occupied(self, coords: np.ndarray) -> np.ndarray:
+        return self.occupants(coords) != self.EMPTY
+
+    def free(self, coords: np.ndarray) -> np.ndarray:
+        return self.in_bounds_many(coords) & (self.occupants(coords) == self.EMPTY)
+
+    def neighbours(self, coords: np.ndarray) -> np.ndarray:
+        """(N, 8) flags telling which of the eight neighbour cells are occupied, in `NEIGHBOUR_OFFSETS` order."""
+        return np.stack(
+            [self.occupied(coords + np.asarray(offset)) for offset in self.NEIGHBOUR_OFFSETS],
+            axis=1,
+        )
+
+
+class SparseOccupancyGrid(OccupancyGrid):
+    """World occupancy index for worlds far larger than their population.
+
+    Same interface as `OccupancyGrid`, but the world is split in (`chunk_size`, `chunk_size`) chunks that are only
+    allocated while some cell of them is occupied, so memory grows with the population instead of with the area of the
+    world. Chunks live in a pool array that doubles its capacity when full, and are looked up by binary search in the
+    sorted keys of the allocated chunks, so batched queries stay a few array operations. Chunks left empty by
+    `remove_many` are recycled.
+
+    Args:
+        world_size (Tuple[int, int]): size of the 2-D world.
+        coordinates (Optional[Iterable[Tuple[int, int]]]): initial occupied cells.
+        occupant_ids (Optional[np.ndarray]): ids of the occupants of `coordinates`. Defaults to their positions.
+        chunk_size (Optional[int]): side of the chunks. Defaults to `CHUNK_SIZE`.
+    """
+
+    CHUNK_SIZE: int = 8
+
+    def __init__(
+        self,
+        world_size: Tuple[int, int],
+        coordinates: Optional[Iterable[Tuple[int, int]]] = None,
+        occupant_ids: Optional[np.ndarray] = None,
+        chunk_size: Optional[int] = None,
+    ) -> None:
+        self.world_size = tuple(world_size)
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.num_chunk_cols = -(-self.world_size[1]//self.chunk_size)
+        self.keys = np.zeros(0, dtype=np.int64)  # sorted keys of the allocated chunks
+        self.slots = np.zeros(0, dtype=np.int64)  # slot of each of `keys` in `chunks`
+        self.chunks = np.full((0, self.chunk_size, self.chunk_size), self.EMPTY, dtype=np.int64)
+        self.free_slots: List[int] = []
+        if coordinates is not None:
+            self.place_many(np.asarray(list(coordinates), dtype=np.int64).reshape(-1, 2), occupant_ids)
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self.keys)
+
+    def _locate(self, coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Chunk keys and cells within their chunks of an (N, 2) array of coordinates inside the world."""
+        chunk_rows, rows = np.divmod(coords[:, 0], self.chunk_size)
+        chunk_cols, cols = np.divmod(coords[:, 1], self.chunk_size)
+        return chunk_rows*self.num_chunk_cols + chunk_cols, rows, cols
+
+    def _find(self, keys: np.ndarray) -> np.ndarray:
+        """Slots of the chunks with the given keys, -1 for chunks that are not allocated."""
+        if len(self.keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[positions] == keys, self.slots[positions], -1)
+
+    def _allocate(self, keys: np.ndarray) -> np.ndarray:
+        """Slots of the chunks with the given keys, allocating the missing ones."""
+        slots = self._find(keys)
+        missing = np.unique(keys[slots < 0])
+        if len(missing) == 0:
+            return slots
+
+        num_missing_slots = len(missing) - len(self.free_slots)
+        if num_missing_slots > 0:
+            num_slots = len(self.chunks)
+            grown = np.full(
+                (max(2*num_slots, num_slots + num_missing_slots), self.chunk_size, self.chunk_size),
+                self.EMPTY,
+                dtype=np.int64,
+            )
+            grown[:num_slots] = self.chunks
+            self.chunks = grown
+            self.free_slots = list(range(len(grown) - 1, num_slots - 1, -1)) + self.free_slots
+        new_slots = self.free_slots[len(self.free_slots) - len(missing):]
+        del self.free_slots[len(self.free_slots) - len(missing):]
+
+        all_keys = np.concatenate([self.keys, missing])
+        order = np.argsort(all_keys)
+        self.keys = all_keys[order]
+        self.slots = np.concatenate([self.slots, np.asarray(new_slots, dtype=np.int64)])[order]
+        return self._find(keys)
+
+    def _release(self, slots: np.ndarray) -> None:
+        """Recycles the chunks of the given slots that are empty."""
+        slots = np.unique(slots)
+        empty = slots[(self.chunks[slots] == self.EMPTY).all(axis=(1, 2))]
+        if len(empty):
+            kept = ~np.isin(self.slots, empty)
+            self.keys, self.slots = self.keys[kept], self.slots[kept]
+            self.free_slots.extend(empty.tolist())
+
+    def __contains__(self, coords: Tuple[int, int]) -> bool:
+        return self.occupant(coords) != self.EMPTY
+
+    def is_free(self, coords: Tuple[int, int]) -> bool:
+        return self.in_bounds(coords) and self.occupant(coords) == self.EMPTY
+
+    def occupant(self, coords: Tuple[int, int]) -> int:
+        return int(self.occupants(np.asarray([coords], dtype=np.int64))[0])
+
+    def place(self, coords: Tuple[int, int], occupant_id: int = 0) -> None:
+        self.place_many(np.asarray([coords], dtype=np.int64), np.asarray([occupant_id]))
+
+    def remove(self, coords: Tuple[int, int]) -> None:
+        self.remove_many(np.asarray([coords], dtype=np.int64))
+
+    def move(self, old_coords: Tuple[int, int], new_coords: Tuple[int, int]) -> None:
+        occupant_id = self.occupant(old_coords)
+        self.remove(old_coords)
+        self.place(new_coords, occupant_id)
+
+    def place_many(self, coords: np.ndarray, occupant_ids: Optional[np.ndarray] = None) -> None:
+        occupant_ids = np.arange(len(coords)) if occupant_ids is None else occupant_ids
+        keys, rows, cols = self._locate(coords)
+        slots = self._allocate(keys)
+        self.chunks[slots, rows, cols] = occupant_ids
+
+    def remove_many(self, coords: np.ndarray) -> None:
+        keys, rows, cols = self._locate(coords)
+        slots = self._find(keys)
+        found = slots >= 0
+        self.chunks[slots[found], rows[found], cols[found]] = self.EMPTY
+        self._release(slots[found])
+
+    def occupants(self, coords: np.ndarray) -> np.ndarray:
+        inside = np.flatnonzero(self.in_bounds_many(coords))
+        keys, rows, cols = self._locate(coords[inside])
+        slots = self._find(keys)
+        found = slots >= 0
+        occupants = np.full(len(coords), self.EMPTY, dtype=np.int64)
+        occupants[inside[found]] = self.chunks[slots[found], rows[found], cols[found]]
+        return occupants
+
+
+def create_occupancy_grid(
+    world_size: Tuple[int, int],
+    coordinates: Optional[Iterable[Tuple[int, int]]] = None,
+    occupant_ids: Optional[np.ndarray] = None,
+) -> OccupancyGrid:
+    """`OccupancyGrid` of the world, or `SparseOccupancyGrid` if it has more than `DENSE_MAX_CELLS` cells."""
+    grid_class = OccupancyGrid if world_size[0]*world_size[1] <= DENSE_MAX_CELLS else SparseOccupancyGrid
+    return grid_class(world_size, coordinates, occupant_ids=occupant_ids)
+
+
+class SurvivalBoxes():
+    """Survival mask of a world too large for a raster, see `compile_survival_mask`.
+
+    It is indexed like the raster, `mask[rows, cols]` with arrays of rows and columns, and tests those cells against
+    the boxes, so it takes no memory per cell.
+
+    Args:
+        world_size (Tuple[int, int]): size of the 2-D world.
+        safe_boxes (Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]]): safe boxes.
+        death_boxes (Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]]): death boxes.
+    """
+
+    def __init__(
+        self,
+        world_size: Tuple[int, int],
+        safe_boxes: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]] = None,
+        death_boxes: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]] = None,
+    ) -> None:
+        self.world_size = tuple(world_size)
+        self.safe_boxes = list(safe_boxes or [])
+        self.death_boxes = list(death_boxes or [])
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.world_size
+
+    @staticmethod
+    def _in_boxes(
+        rows: np.ndarray,
+        cols: np.ndarray,
+        boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]],
+    ) -> np.ndarray:
+        inside = np.zeros(rows.shape, dtype=bool)
+        for (top, left), (bottom, right) in boxes:
+            inside |= (rows >= top) & (rows <= bottom) & (cols >= left) & (cols <= right)
+        return inside
+
+    def __getitem__(self, index: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        rows, cols = np.broadcast_arrays(*(np.asarray(e, dtype=np.int64) for e in index))
+        survive = self._in_boxes(rows, cols, self.safe_boxes) if self.safe_boxes else np.ones(rows.shape, dtype=bool)
+        return survive & ~self._in_boxes(rows, cols, self.death_boxes)
+
+
+def compile_survival_mask(
+    world_size: Tuple[int, int],
+    safe_boxes: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]] = None,
+    death_boxes: Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]] = None,
+) -> np.ndarray:
+    """Compiles the safe and death boxes into a boolean world raster.
+
+    A cell is `True` if an individual standing on it at the end of a generation survives: it lies in some safe box
+    (or there are no safe boxes) and in no death box. Boxes are inclusive ((top, left), (bottom, right)) rectangles and
+    are clipped to the world.
+
+    Args:
+        world_size (Tuple[int, int]): size of the 2-D world.
+        safe_boxes (Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]]): safe boxes.
+        death_boxes (Optional[List[Tuple[Tuple[int, int], Tuple[int, int]]]]): death boxes.
+
+    Worlds with more than `DENSE_MAX_CELLS` cells get a `SurvivalBoxes` instead, indexed the same way.
+
+    Returns:
+        np.ndarray: (height, width) boolean raster.
+    """
+    if world_size[0]*world_size[1] > DENSE_MAX_CELLS:
+        return SurvivalBoxes(world_size, safe_boxes=safe_boxes, death_boxes=death_boxes)
+    mask = np.zeros(world_size, dtype=bool) if safe_boxes else np.ones(world_size, dtype=bool)
+    for (top, left), (bottom, right) in safe_boxes or []:
+        mask[max(top, 0):max(bottom + 1, 0), max(left, 0):max(right + 1, 0)] = True
+    for (top, left), (bottom, right) in death_boxes or []:
+        mask[max(top, 0):max(bottom + 1, 0), max(left, 0):max(right + 1, 0)] = False
+    return mask
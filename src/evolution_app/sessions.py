@@ -0,0 +1,391 @@
+import os
+import re
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+from evolution import create_population, evolve, iter_evolve_vectorized
+from objects.brain import Brain
+from objects.checkpoint import load_checkpoint, save_checkpoint
+from objects.heat import HeatField
+from objects.individual import Individual
+from objects.metrics import MetricsCollector
+from objects.population import Population
+from objects.world import compile_survival_mask
+from frames import FrameEncoder
+
+
+SESSION_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+class Simulation():
+    """State of the simulation of one session of the web app.
+
+    Every attribute used to be a global of `app.py`. Calls that read or modify the state must hold `lock`, see
+    `SimulationManager.run`.
+    """
+
+    DEFAULT_WORLD_SIZE: Tuple[int, int] = (150, 150)
+    DEFAULT_NUM_GENERATIONS: int = 100
+    DEFAULT_LIFESPAN: int = 60
+    DEFAULT_NUM_GENES: int = 6
+    DEFAULT_MUTE_PROBABILITY: float = 0.0001
+    DEFAULT_MATE_PROBABILITY: float = 0.5
+    DEFAULT_SAFE_BOXES: List[Tuple[Tuple[int, int], Tuple[int, int]]] = [((0, 0), (20, 15))]
+
+    def __init__(self) -> None:
+        self.world_size = self.DEFAULT_WORLD_SIZE
+        self.num_generations = self.DEFAULT_NUM_GENERATIONS
+        self.lifespan = self.DEFAULT_LIFESPAN
+        self.num_genes = self.DEFAULT_NUM_GENES
+        self.mute_probability = self.DEFAULT_MUTE_PROBABILITY
+        self.mate_probability = self.DEFAULT_MATE_PROBABILITY
+        self.step_idx = 0
+        self.generation_idx = 0
+
+        self.population: List[Individual] = []
+        self.current_coordinates: List[Tuple[int, int]] = []
+        self.death_boxes = None
+        self.safe_boxes = self.DEFAULT_SAFE_BOXES
+        self.survival_mask = compile_survival_mask(
+            self.world_size, safe_boxes=self.safe_boxes, death_boxes=self.death_boxes,
+        )
+        self.heat_field = HeatField(self.world_size)
+        self.metrics = MetricsCollector()
+        self.frame_encoder = FrameEncoder()
+
+        self.lock = threading.RLock()
+        self.num_active = 0
+        self.last_access = time.monotonic()
+
+    def config(self) -> Dict[str, Any]:
+        """JSON serializable `evolve` arguments of the simulation."""
+        return {
+            'population_size': len(self.population),
+            'num_genes': self.num_genes,
+            'world_size': self.world_size,
+            'num_generations': self.num_generations,
+            'lifespan': self.lifespan,
+            'mute_probability': self.mute_probability,
+            'mate_probability': self.mate_probability,
+            'death_boxes': self.death_boxes,
+            'safe_boxes': self.safe_boxes,
+            'heat_sources': self.heat_field.heat_sources,
+        }
+
+    def save(self, path: str) -> str:
+        if self.population:
+            population = Population.from_individuals(self.population)
+        else:
+            # extinct
+            population = Population(
+                genomes=self.genomes(), coords=[], lifespan=self.lifespan, world_size=self.world_size,
+            )
+        return save_checkpoint(
+            path,
+            population=population,
+            generation=self.generation_idx,
+            step=self.step_idx,
+            config=self.config(),
+            survival_mask=self.survival_mask,
+        )
+
+    def load(self, path: str) -> None:
+        checkpoint = load_checkpoint(path)
+        config = checkpoint['config']
+        self.world_size = config['world_size']
+        self.num_genes = config['num_genes']
+        self.num_generations = config['num_generations']
+        self.lifespan = config['lifespan']
+        self.mute_probability = config['mute_probability']
+        self.mate_probability = config['mate_probability']
+        self.death_boxes = config['death_boxes']
+        self.safe_boxes = config['safe_boxes']
+        self.survival_mask = checkpoint['survival_mask']
+        self.heat_field = HeatField(self.world_size, heat_sources=config['heat_sources'])
+        self.generation_idx = checkpoint['generation']
+        self.step_idx = checkpoint['step']
+        self.population = checkpoint['population'].to_individuals()
+        self.current_coordinates = [ind.coords for ind in self.population]
+
+    def genomes(self) -> np.ndarray:
+        """(N, num_genes) genomes of the population."""
+        if not self.population:
+            return np.zeros((0, self.num_genes), dtype=np.uint32)
+        return np.stack([ind.brain.genes for ind in self.population])
+
+    def reset_population(self, population_size: int) -> None:
+        self.population, self.current_coordinates = create_population(
+            population_size=population_size,
+            lifespan=self.lifespan,
+            world_size=self.world_size,
+            num_genes=self.num_genes,
+        )
+
+    def set_world_size(self, world_size: Tuple[int, int]) -> None:
+        self.world_size = world_size
+        for ind in self.population:
+            ind.world_size = world_size
+        self.survival_mask = compile_survival_mask(
+            world_size, safe_boxes=self.safe_boxes, death_boxes=self.death_boxes,
+        )
+        self.heat_field = HeatField(world_size, heat_sources=self.heat_field.heat_sources)
+
+    def set_boxes(
+        self,
+        safe_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]],
+        death_boxes: List[Tuple[Tuple[int, int], Tuple[int, int]]],
+    ) -> None:
+        self.safe_boxes = safe_boxes
+        self.death_boxes = death_boxes
+        self.survival_mask = compile_survival_mask(
+            self.world_size, safe_boxes=safe_boxes, death_boxes=death_boxes,
+        )
+
+    def set_lifespan(self, lifespan: int) -> None:
+        self.lifespan = lifespan
+        for ind in self.population:
+            ind.lifespan = lifespan
+
+    def set_num_genes(self, num_genes: int) -> None:
+        self.num_genes = num_genes
+        for ind in self.population:
+            ind.brain = Brain.init_random_genes(num_genes)
+
+    def evolve_step(self, generation_idx: int, step_idx: int) -> None:
+        self.population, self.current_coordinates = evolve(
+            population_size=len(self.population),
+            num_genes=self.num_genes,
+            world_size=self.world_size,
+            num_generations=self.num_generations,
+            lifespan=self.lifespan,
+            start_generation=generation_idx,
+            end_generation=min(self.num_generations-1, generation_idx+1),
+            start_step=step_idx,
+            end_step=min(self.num_generations-1, step_idx+1),
+            mute_probability=self.mute_probability,
+            mate_probability=self.mate_probability,
+            death_boxes=self.death_boxes,
+            safe_boxes=self.safe_boxes,
+            survival_mask=self.survival_mask,
+            heat_field=self.heat_field,
+            population=self.population,
+            metrics=self.metrics,
+        )
+
+    def iter_steps(self, seed: Optional[int] = None) -> Generator[Tuple[int, int, Population], None, Any]:
+        """Whole simulation from the current generation, see `iter_evolve_vectorized`.
+
+        The population is copied when the call is made, the caller must hold `lock`. When the run ends the simulation
+        gets the population and the generation it ended with, a run closed before its end leaves it unchanged.
+        """
+        records = []
+        steps = iter_evolve_vectorized(
+            population_size=len(self.population),
+            num_genes=self.num_genes,
+            world_size=self.world_size,
+            num_generations=self.num_generations,
+            lifespan=self.lifespan,
+            start_generation=self.generation_idx,
+            mute_probability=self.mute_probability,
+            mate_probability=self.mate_probability,
+            death_boxes=self.death_boxes,
+            safe_boxes=self.safe_boxes,
+            survival_mask=self.survival_mask,
+            heat_field=self.heat_field,
+            population=Population.from_individuals(self.population),
+            verbosity='',
+            seed=seed,
+            on_generation=records.append,
+            metrics=self.metrics,
+        )
+        return self._store_run(steps, records)
+
+    def _store_run(
+        self,
+        steps: Generator[Tuple[int, int, Population], None, Tuple[Population, np.ndarray]],
+        records: List[Dict[str, Any]],
+    ) -> Generator[Tuple[int, int, Population], None, Population]:
+        population, _ = yield from steps
+        with self.lock:
+            self.population = population.to_individuals()
+            self.current_coordinates = [ind.coords for ind in self.population]
+            if records:
+                self.generation_idx = records[-1]['generation'] + 1
+            self.step_idx = 0
+        return population
+
+
+class SimulationManager():
+    """One `Simulation` per session, run on a bounded pool of worker threads.
+
+    Streamed simulations hold a thread for their whole run, so they get their own pool of `max_streams` threads, see
+    `submit_stream`, and can not starve the requests of the other sessions.
+
+    At most `max_sessions` simulations are kept in memory. Sessions idle for more than `idle_timeout` seconds, and the
+    least recently used ones above `max_sessions`, are evicted: they are saved to `checkpoint_dir/<session_id>.npz`
+    and restored on their next request, or discarded if there is no `checkpoint_dir`. Simulations with running work,
+    or pinned by `get` and not released yet, are never evicted. Checkpoints are written and read without holding
+    `lock`, so disk I/O does not block the other sessions.
+
+    Args:
+        max_sessions (int): maximum number of simulations kept in memory.
+        idle_timeout (float): seconds without requests after which a session is evicted.
+        max_workers (Optional[int]): number of worker threads. Defaults to the number of cores.
+        checkpoint_dir (Optional[str]): directory the evicted sessions are saved to.
+        max_streams (Optional[int]): number of simulations streamed at the same time, the other ones wait for a
+            thread. Defaults to `max_sessions`.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 64,
+        idle_timeout: float = 15*60,
+        max_workers: Optional[int] = None,
+        checkpoint_dir: Optional[str] = None,
+        max_streams: Optional[int] = None,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.checkpoint_dir = checkpoint_dir
+        self.sessions: Dict[str, Simulation] = OrderedDict()
+        self.evicting: Dict[str, Simulation] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1)
+        self.stream_executor = ThreadPoolExecutor(max_workers=max_streams or max_sessions)
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def checkpoint_path(self, session_id: str) -> Optional[str]:
+        if not self.checkpoint_dir or not SESSION_ID_PATTERN.fullmatch(session_id):
+            return None
+        return os.path.join(self.checkpoint_dir, f"{session_id}.npz")
+
+    def get(self, session_id: str) -> Simulation:
+        """Simulation of a session, restored from its checkpoint or created if it is not in memory.
+
+        The simulation is pinned: it is not evicted before the caller calls `release`.
+        """
+        with self.lock:
+            evicted = self.evict_idle()
+            simulation = self.sessions.pop(session_id, None)
+            if simulation is None:
+                # a simulation still being saved is taken back as it is
+                simulation = self.evicting.pop(session_id, None)
+            checkpoint_path = None
+            if simulation is None:
+                simulation = Simulation()
+                checkpoint_path = self.checkpoint_path(session_id)
+                if checkpoint_path and os.path.exists(checkpoint_path):
+                    # the other requests of the session wait on the lock of the simulation until it is loaded
+                    simulation.lock.acquire()
+                else:
+                    checkpoint_path = None
+            simulation.num_active += 1
+            simulation.last_access = time.monotonic()
+            self.sessions[session_id] = simulation
+
+            for evicted_id in [
+                evicted_id for evicted_id, evicted in self.sessions.items() if not evicted.num_active
+            ][:max(len(self.sessions) - self.max_sessions, 0)]:
+                evicted += self.evict(evicted_id)
+
+        if checkpoint_path:
+            try:
+                simulation.load(checkpoint_path)
+                os.remove(checkpoint_path)
+            except Exception:
+                self.release(simulation)
+                raise
+            finally:
+                simulation.lock.release()
+        self.save_evicted(evicted)
+        return simulation
+
+    def release(self, simulation: Simulation) -> None:
+        """Unpins a simulation returned by `get`."""
+        with self.lock:
+            simulation.num_active -= 1
+            simulation.last_access = time.monotonic()
+
+    def evict(self, session_id: str) -> List[Tuple[str, Simulation]]:
+        """Removes a simulation from memory, the caller must hold `lock`.
+
+        Returns:
+            List[Tuple[str, Simulation]]: the session and its simulation if it must be saved, see `save_evicted`.
+        """
+        simulation = self.sessions.pop(session_id)
+        if not self.checkpoint_path(session_id) or not simulation.population:
+            return []
+        self.evicting[session_id] = simulation
+        return [(session_id, simulation)]
+
+    def evict_idle(self) -> List[Tuple[str, Simulation]]:
+        """Evicts the simulations idle for more than `idle_timeout` seconds, see `evict`."""
+        deadline = time.monotonic() - self.idle_timeout
+        evicted = []
+        for session_id in [
+            session_id for session_id, simulation in self.sessions.items()
+            if simulation.last_access < deadline and not simulation.num_active
+        ]:
+            evicted += self.evict(session_id)
+        return evicted
+
+    def save_evicted(self, evicted: List[Tuple[str, Simulation]]) -> None:
+        """Saves evicted simulations to their checkpoints, the caller must not hold `lock`."""
+        for session_id, simulation in evicted:
+            checkpoint_path = self.checkpoint_path(session_id)
+            with simulation.lock:
+                simulation.save(checkpoint_path)
+            with self.lock:
+                if self.evicting.get(session_id) is simulation:
+                    del self.evicting[session_id]
+                elif self.sessions.get(session_id) is simulation:
+                    # taken back while it was saved, the checkpoint is stale
+                    os.remove(checkpoint_path)
+
+    def submit(self, simulation: Simulation, func: Callable[..., Any], *args, **kwargs):
+        """Runs `func(*args, **kwargs)` on the worker pool, the simulation is not evicted while it runs.
+
+        Returns:
+            Future: future of the result.
+        """
+        return self._submit(self.executor, simulation, func, *args, **kwargs)
+
+    def submit_stream(self, simulation: Simulation, func: Callable[..., Any], *args, **kwargs):
+        """`submit` for long running streamed simulations, on the stream pool."""
+        return self._submit(self.stream_executor, simulation, func, *args, **kwargs)
+
+    def _submit(
+        self,
+        executor: ThreadPoolExecutor,
+        simulation: Simulation,
+        func: Callable[..., Any],
+        *args,
+        **kwargs,
+    ):
+        with self.lock:
+            simulation.num_active += 1
+
+        def job():
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self.lock:
+                    simulation.num_active -= 1
+                    simulation.last_access = time.monotonic()
+
+        return executor.submit(job)
+
+    def run(self, simulation: Simulation, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs `func(*args, **kwargs)` on the worker pool holding the simulation lock, and waits for its result."""
+        def locked():
+            with simulation.lock:
+                return func(*args, **kwargs)
+
+        return self.submit(simulation, locked).result()
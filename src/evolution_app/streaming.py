@@ -0,0 +1,140 @@
+import json
+import time
+import threading
+from typing import Any, Callable, Iterator, Optional, Tuple
+from objects.population import Population
+
+
+class LatestFrame():
+    """Single frame slot shared by a simulation thread and a streaming response.
+
+    The simulation publishes frames and the response waits for them. Publishing a frame the response has not sent
+    yet overwrites it, so a slow client drops frames instead of holding the simulation back. A simulation that fails
+    records its error, see `fail`.
+    """
+
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.frame = None
+        self.finished = False
+        self.error = None
+        self.num_published = 0
+        self.num_dropped = 0
+
+    def publish(self, frame: Any) -> None:
+        with self.condition:
+            if self.frame is not None:
+                self.num_dropped += 1
+            self.frame = frame
+            self.num_published += 1
+            self.condition.notify()
+
+    def fail(self, error: str) -> None:
+        with self.condition:
+            self.error = error
+            self.condition.notify()
+
+    def finish(self) -> None:
+        with self.condition:
+            self.finished = True
+            self.condition.notify()
+
+    def take(self) -> Tuple[Optional[Any], bool]:
+        """Waits for a frame or the end of the simulation.
+
+        Returns:
+            Tuple[Optional[Any], bool]: latest unsent frame, `None` if there is none, and whether the simulation is
+                finished.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame is not None or self.finished)
+            frame, self.frame = self.frame, None
+            return frame, self.finished
+
+
+def run_simulation(
+    steps: Iterator[Tuple[int, int, Population]],
+    encode: Callable[[int, int, Population], Any],
+    latest_frame: LatestFrame,
+    stop: threading.Event,
+    fps: float,
+    steps_per_second: Optional[float] = None,
+) -> None:
+    """Runs a simulation, publishing at most `fps` frames per second.
+
+    Only the steps that fall on a frame are encoded, the other ones are dropped. The simulation runs as fast as it can
+    unless `steps_per_second` is given. An exception of the simulation or of `encode` is published as the error of
+    `latest_frame` instead of being raised, so the response can report it.
+
+    Args:
+        steps (Iterator[Tuple[int, int, Population]]): simulation, e.g. `iter_evolve_vectorized`.
+        encode (Callable[[int, int, Population], Any]): encodes a step into a frame.
+        latest_frame (LatestFrame): slot the frames are published to.
+        stop (threading.Event): set by the response when the client goes away.
+        fps (float): target frame rate.
+        steps_per_second (Optional[float]): maximum simulation speed.
+    """
+    frame_interval = 1/fps
+    step_interval = 1/steps_per_second if steps_per_second else 0
+    next_frame = next_step = time.perf_counter()
+    try:
+        for gen_i, step_i, population in steps:
+            if stop.is_set():
+                break
+            now = time.perf_counter()
+            if now >= next_frame:
+                latest_frame.publish(encode(gen_i, step_i, population))
+                next_frame = max(next_frame + frame_interval, now)
+            next_step += step_interval
+            if next_step > now:
+                time.sleep(next_step - now)
+    except Exception as e:
+        latest_frame.fail(f"{type(e).__name__}: {e}")
+    finally:
+        steps.close()
+        latest_frame.finish()
+
+
+def stream_simulation(
+    steps: Iterator[Tuple[int, int, Population]],
+    encode: Callable[[int, int, Population], Any],
+    fps: float = 30,
+    steps_per_second: Optional[float] = None,
+    submit: Optional[Callable[..., Any]] = None,
+) -> Iterator[str]:
+    """Server-sent events stream of a simulation.
+
+    The simulation runs once, in a background thread or worker pool, and every frame is sent as a `data:` event. The
+    stream ends with an `end` event, after an `error` event if the simulation failed. Closing the stream stops the
+    simulation.
+
+    Args:
+        steps (Iterator[Tuple[int, int, Population]]): simulation, e.g. `iter_evolve_vectorized`.
+        encode (Callable[[int, int, Population], Any]): encodes a step into a JSON serializable frame.
+        fps (float): target frame rate.
+        steps_per_second (Optional[float]): maximum simulation speed.
+        submit (Optional[Callable[..., Any]]): starts the simulation, called like `ThreadPoolExecutor.submit`.
+            Defaults to starting a new daemon thread.
+
+    Yields:
+        str: server-sent events.
+    """
+    latest_frame = LatestFrame()
+    stop = threading.Event()
+    args = (steps, encode, latest_frame, stop, fps, steps_per_second)
+    if submit:
+        submit(run_simulation, *args)
+    else:
+        threading.Thread(target=run_simulation, args=args, daemon=True).start()
+    try:
+        while True:
+            frame, finished = latest_frame.take()
+            if frame is not None:
+                yield f"data: {json.dumps(frame)}\n\n"
+            if finished:
+                break
+        if latest_frame.error is not None:
+            yield f"event: error\ndata: {json.dumps({'error': latest_frame.error})}\n\n"
+        yield f"event: end\ndata: {json.dumps({'dropped': latest_frame.num_dropped})}\n\n"
+    finally:
+        stop.set()
@@ -0,0 +1,170 @@
+import os
+import csv
+import json
+import hashlib
+from itertools import product
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Union
+from evolution import evolve_vectorized, log_info
+
+
+RESULT_COLUMNS: List[str] = [
+    'run_id',
+    'seed',
+    'config',
+    'generation',
+    'population_size',
+    'num_survivors',
+    'num_children',
+    'survival_rate',
+    'survival_type',
+]
+
+
+def expand_grid(param_grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Every combination of the values of a parameter grid, e.g. {'lifespan': [30, 60], 'num_genes': [6, 12]}."""
+    keys = list(param_grid)
+    return [dict(zip(keys, values)) for values in product(*(param_grid[key] for key in keys))]
+
+
+def run_id(config: Dict[str, Any], seed: int) -> str:
+    """Stable id of a run, used to find its results on disk."""
+    key = json.dumps({'config': config, 'seed': seed}, sort_keys=True, default=list)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def run_sweep_job(config: Dict[str, Any], seed: int, run_path: str) -> str:
+    """Runs one configuration of a sweep and saves its per-generation records.
+
+    Runs in a worker process. The results are written to a temporary file that is renamed once complete, so an
+    interrupted run never leaves a partial result behind.
+
+    Args:
+        config (Dict[str, Any]): `evolve_vectorized` arguments.
+        seed (int): seed of the run.
+        run_path (str): JSON file where the results are saved.
+
+    Returns:
+        str: `run_path`.
+    """
+    generations = []
+    evolve_vectorized(**config, seed=seed, verbosity='', on_generation=generations.append)
+
+    tmp_path = f"{run_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'config': config, 'seed': seed, 'generations': generations}, f, default=list)
+    os.replace(tmp_path, run_path)
+    return run_path
+
+
+def append_results(writer: csv.DictWriter, run_path: str) -> None:
+    with open(run_path) as f:
+        run = json.load(f)
+    for record in run['generations']:
+        writer.writerow({
+            'run_id': os.path.splitext(os.path.basename(run_path))[0],
+            'seed': run['seed'],
+            'config': json.dumps(run['config'], sort_keys=True),
+            **record,
+        })
+
+
+def run_sweep(
+    configs: Union[Dict[str, List[Any]], List[Dict[str, Any]]],
+    seeds: List[int],
+    output_dir: str,
+    base_config: Optional[Dict[str, Any]] = None,
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    verbosity: str = 'v',
+) -> str:
+    """Parameter sweep of `evolve_vectorized` configurations.
+
+    Every configuration is run once per seed in a pool of worker processes, with at most `max_pending` runs submitted
+    at any time. Each run saves its per-generation records to `output_dir/runs/<run_id>.json`, and they are appended to
+    the aggregated `output_dir/results.csv` table as soon as the run finishes. Runs whose results are already on disk
+    are not run again, so an interrupted sweep resumes where it stopped.
+
+    Args:
+        configs (Union[Dict[str, List[Any]], List[Dict[str, Any]]]): list of configurations, or parameter grid to be
+            expanded with `expand_grid`.
+        seeds (List[int]): seeds every configuration is run with.
+        output_dir (str): directory where the results are saved.
+        base_config (Optional[Dict[str, Any]]): arguments shared by every configuration, overridden by them.
+        max_workers (Optional[int]): number of worker processes. Defaults to the number of cores.
+        max_pending (Optional[int]): maximum number of submitted runs. Defaults to twice `max_workers`.
+        verbosity (str): verbosity level, 'v' logs every finished run.
+
+    Returns:
+        str: path of the aggregated results table.
+    """
+    verbosity_level = 0 if not verbosity else len(verbosity)
+    if isinstance(configs, dict):
+        configs = expand_grid(configs)
+    configs = [{**(base_config or {}), **config} for config in configs]
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2*max_workers
+
+    runs_dir = os.path.join(output_dir, 'runs')
+    os.makedirs(runs_dir, exist_ok=True)
+    results_path = os.path.join(output_dir, 'results.csv')
+
+    jobs = []
+    done = []
+    for config in configs:
+        for seed in seeds:
+            run_path = os.path.join(runs_dir, f"{run_id(config, seed)}.json")
+            if os.path.exists(run_path):
+                done.append(run_path)
+            else:
+                jobs.append((config, seed, run_path))
+    log_info(f"{len(done)} runs already done, {len(jobs)} runs left.", 1, verbosity_level)
+
+    with open(results_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        for run_path in done:
+            append_results(writer, run_path)
+        f.flush()
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            jobs = iter(jobs)
+            num_finished = 0
+            while True:
+                for config, seed, run_path in jobs:
+                    pending.add(executor.submit(run_sweep_job, config, seed, run_path))
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    append_results(writer, future.result())
+                    num_finished += 1
+                    log_info(f"Finished run {num_finished}: {future.result()}", 1, verbosity_level)
+                f.flush()
+
+    return results_path
+
+
+if __name__ == '__main__':
+    BASE_CONFIG = dict(
+        population_size=250,
+        world_size=(20, 60),
+        num_generations=50,
+        safe_boxes=[((0, 40), (15, 60))],
+    )
+    PARAM_GRID = dict(
+        mute_probability=[0.0001, 0.0005, 0.001],
+        mate_probability=[0.3, 0.7],
+        num_genes=[6, 12],
+        lifespan=[30, 50],
+    )
+
+    run_sweep(
+        configs=PARAM_GRID,
+        seeds=[0, 1, 2],
+        output_dir='sweep_results',
+        base_config=BASE_CONFIG,
+    )
@@ -3,29 +3,32 @@ var mainCanvas = document.getElementById("grid");
 var numFires = 0;
 var numInds = -1;
 
-mainCanvas.addEventListener("click", clickOnCanvas, false);
+// world cells are gridCellSize pixels wide, see updateGrid in grid.js
+gridCanvas.addEventListener("click", clickOnCanvas, false);
 
 function clickOnCanvas(event) {
-    const rect = this.getBoundingClientRect();
-    const x = event.clientX - rect.left;
-    const y = event.clientY - rect.top;
-    document.getElementById("posX").innerHTML = x;
-    document.getElementById("posY").innerHTML = y;
-    createFire(this, x, y);
+    const row = Math.floor(event.offsetY / gridCellSize);
+    const col = Math.floor(event.offsetX / gridCellSize);
+    createFire(event.pageX, event.pageY, row, col);
 }
 
-function createFire(x, y) {
+function createFire(x, y, row, col) {
     var newFire = document.createElement("div");
     newFire.innerHTML = "🔥";
     newFire.setAttribute("id", "fire" + numFires);
     newFire.setAttribute("class", "fires");
-    mainCanvas.appendChild(newFire);
+    document.body.appendChild(newFire);
     newFire.style.left = (x - 20) + 'px';
     newFire.style.top = (y - 20) + 'px';
     newFire.style.zIndex = numFires + 1;
     numFires += 1;
 
     //Communicate python that another fire has been created.
+    fetch(
+        "/add_heat_source"
+        + "?row=" + row
+        + "&col=" + col
+    );
 }
 
 function createIndividual(id) {
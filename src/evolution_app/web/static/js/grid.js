@@ -1,59 +1,77 @@
 var mainGrid = document.getElementById("grid");
 var gridH = document.forms.settingsForm.gridH;
 var gridW = document.forms.settingsForm.gridW;
+const MAX_GRID_PIXELS = 750;
+var gridCellSize = 1;
+var gridCanvas = document.createElement("canvas");
+var gridContext = gridCanvas.getContext("2d");
+gridCanvas.setAttribute("class", "gridCanvas");
+mainGrid.appendChild(gridCanvas);
 
 function updateGrid(h, w) {
-    Array.from(document.getElementsByClassName("gridItem")).forEach(gridItem => gridItem.remove());
-    mainGrid.style.gridTemplateColumns = "repeat(" + w + ", 5px)";
-    mainGrid.style.gridTemplateRows = "repeat(" + w + ", 5px)";
-    for (let ih = 0; ih < h; ih++) {
-        for (let iw = 0; iw < w; iw++) {
-            var newCell = document.createElement("div");
-            newCell.setAttribute("id", "cell_" + ih + "-" + iw);
-            newCell.setAttribute("class", "gridItem");
-            mainGrid.appendChild(newCell);
-        }
-    }
+    // one canvas pixel per world cell, scaled up by CSS
+    gridCellSize = Math.max(1, Math.floor(MAX_GRID_PIXELS / Math.max(h, w)));
+    gridCanvas.height = h;
+    gridCanvas.width = w;
+    gridCanvas.style.height = (h * gridCellSize) + "px";
+    gridCanvas.style.width = (w * gridCellSize) + "px";
+    clearGrid();
+}
+
+function clearGrid() {
+    gridContext.fillStyle = "white";
+    gridContext.fillRect(0, 0, gridCanvas.width, gridCanvas.height);
 }
 
 function plotIndividuals(individuals) {
-    Array.from(document.getElementsByClassName("gridItem")).forEach(e => e.style.backgroundColor = "white");
+    clearGrid();
     for (let index = 0; index < individuals.length; index++) {
-        var coordX = individuals[index].coords[0];
-        var coordY = individuals[index].coords[1];
-        var color = individuals[index].color;
-        var gridItem = document.getElementById("cell_" + coordX + "-" + coordY);
-        gridItem.style.backgroundColor = stringToColor(color);
+        gridContext.fillStyle = stringToColor(individuals[index].color);
+        gridContext.fillRect(individuals[index].coords[1], individuals[index].coords[0], 1, 1);
     }
 }
 
+function plotImage(blob) {
+    // frames rendered on the server, see render_frame in frames.py
+    return createImageBitmap(blob).then(function (bitmap) {
+        if (gridCanvas.width != bitmap.width || gridCanvas.height != bitmap.height) {
+            updateGrid(bitmap.height, bitmap.width);
+        }
+        gridContext.drawImage(bitmap, 0, 0);
+        bitmap.close();
+    });
+}
+
+function fetchImage(url) {
+    return fetch(url, {headers: {"Accept": "image/png"}})
+    .then(function (response) {return response.blob();})
+    .then(plotImage);
+}
+
 function update_population() {
-    fetch(
+    fetchImage(
         "/update_population"
         + "?pop_size=" + popSizeSlider.value
         + "&lifespan=" + lifespanSlider.value
         + "&worldY=" + gridH.value
         + "&worldX=" + gridW.value
         + "&num_genes=" + numGenesSlider.value
-    )
-    .then(function (response) {return response.json();})
-    .then(function (json_data) {plotIndividuals(json_data);});
+    );
 }
 
+var evolutionStream = null;
+
 function evolve() {
-    for (let generationIdx = 0; generationIdx < 100; generationIdx++) {
-        for (let stepIdx = 0; stepIdx < 60; stepIdx++) {
-            fetch(
-                "/evolve_step"
-                + "?generationIdx=" + generationIdx
-                + "&stepIdx=" + stepIdx
-            )
-            .then(function (response) {return response.json();})
-            .then(function (json_data) {
-                plotIndividuals(json_data);
-            })
-        }
-    }
+    if (evolutionStream) {evolutionStream.close();}
+    evolutionStream = new EventSource("/evolve_stream?fps=30&format=png");
+    evolutionStream.onmessage = function (event) {
+        var png = Uint8Array.from(atob(JSON.parse(event.data).png), c => c.charCodeAt(0));
+        plotImage(new Blob([png], {type: "image/png"}));
+    };
+    evolutionStream.addEventListener("end", function () {
+        evolutionStream.close();
+        evolutionStream = null;
+    });
 }
 
 
@@ -73,9 +91,7 @@ lifespanSlider.onchange = function() {
     .then()
 };
 numGenesSlider.onchange = function() {
-    fetch("/update_num_genes?num_genes=" + numGenesSlider.value)
-    .then(function (response) {return response.json();})
-    .then(function (json_data) {plotIndividuals(json_data);});
+    fetchImage("/update_num_genes?num_genes=" + numGenesSlider.value);
 };
 
 document.getElementById("startButton").onclick = function () {evolve();};
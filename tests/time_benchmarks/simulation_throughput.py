@@ -0,0 +1,178 @@
+"""Throughput benchmarks of the simulation hot paths.
+
+Measures steps/s and generations/s of `evolve()` for both engines across population sizes, world sizes, gene counts
+and heat source counts, and calls/s of the hot components (`Brain.express_genes` without `BRAIN_CACHE`, `Brain.output`,
+`Individual.sense_env`, `mate` and `Individual.mute`). Every benchmark is seeded: the engines and the components draw
+from generators seeded with `SEED`.
+
+Usage:
+    python simulation_throughput.py --output results.json
+    python simulation_throughput.py --output new.json --baseline results.json --tolerance 0.1
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+from itertools import product
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'evolution_app'))
+
+from evolution import evolve  # noqa: E402
+from objects.brain import Brain  # noqa: E402
+from objects.genome import random_genomes  # noqa: E402
+from objects.heat import HeatField  # noqa: E402
+from objects.individual import Individual, mate  # noqa: E402
+from objects.world import OccupancyGrid, sample_coordinates  # noqa: E402
+
+
+SEED = 0
+POPULATION_SIZES = [100, 1000]
+WORLD_SIZES = [(150, 150)]
+NUM_GENES = [6, 30]
+NUM_HEAT_SOURCES = [0, 10]
+ENGINES = ['object', 'vectorized']
+NUM_GENERATIONS = 2
+LIFESPAN = 20
+
+
+def time_calls(func: Callable[[], Any], min_time: float = 0.2, repeat: int = 3) -> float:
+    """Best calls per second of `func` over `repeat` rounds of at least `min_time` seconds."""
+    best = 0
+    for _ in range(repeat):
+        num_calls = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < min_time:
+            func()
+            num_calls += 1
+        best = max(best, num_calls/(time.perf_counter() - start))
+    return best
+
+
+def benchmark_evolve(
+    engine: str,
+    population_size: int,
+    world_size: tuple,
+    num_genes: int,
+    num_heat_sources: int,
+    repeat: int = 3,
+) -> Dict[str, float]:
+    """Best throughput of `repeat` identically seeded `evolve()` runs."""
+    heat_sources = [tuple(coords) for coords in sample_coordinates(
+        num_heat_sources, world_size, rng=np.random.default_rng(SEED),
+    ).tolist()]
+    elapsed = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        evolve(
+            population_size=population_size,
+            num_genes=num_genes,
+            world_size=world_size,
+            num_generations=NUM_GENERATIONS,
+            lifespan=LIFESPAN,
+            mute_probability=0.001,
+            mate_probability=0.5,
+            safe_boxes=[((0, 0), (world_size[0]//2, world_size[1]//2))],
+            heat_sources=heat_sources,
+            verbosity='',
+            vectorized=engine == 'vectorized',
+            seed=SEED,
+        )
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return {
+        'steps_per_second': NUM_GENERATIONS*LIFESPAN/elapsed,
+        'generations_per_second': NUM_GENERATIONS/elapsed,
+    }
+
+
+def benchmark_components(num_genes: int, population_size: int, world_size: tuple) -> Dict[str, float]:
+    rng = np.random.default_rng(SEED)
+    coordinates = [tuple(coords) for coords in sample_coordinates(population_size, world_size, rng=rng).tolist()]
+    occupancy = OccupancyGrid(world_size, coordinates)
+    heat_field = HeatField(world_size, heat_sources=[(0, 0)])
+    genes1, genes2 = random_genomes(2, num_genes, rng=rng)
+    ind1 = Individual(1, LIFESPAN, world_size, initial_coords=coordinates[0], brain=Brain(genes=genes1))
+    ind2 = Individual(2, LIFESPAN, world_size, initial_coords=coordinates[1], brain=Brain(genes=genes2))
+    ind1.sense_env(occupancy=occupancy, heat_field=heat_field, rng=rng)
+    input_vector = ind1.input_vector
+
+    return {
+        # express_genes goes through BRAIN_CACHE, compile_genes is the decoding a cache miss pays
+        'brain_express_genes_calls_per_second': time_calls(lambda: Brain.compile_genes(ind1.brain.genes)),
+        'brain_output_calls_per_second': time_calls(lambda: ind1.brain.output(input_vector)),
+        'individual_sense_env_calls_per_second': time_calls(
+            lambda: ind1.sense_env(occupancy=occupancy, heat_field=heat_field, rng=rng)
+        ),
+        'mate_calls_per_second': time_calls(lambda: mate(ind1, ind2, 1.0, 3, 4, rng=rng)),
+        'individual_mute_calls_per_second': time_calls(lambda: ind2.mute(mute_probability=0.001, rng=rng)),
+    }
+
+
+def run_benchmarks() -> Dict[str, float]:
+    results = {}
+    for engine, population_size, world_size, num_genes, num_heat_sources in product(
+        ENGINES, POPULATION_SIZES, WORLD_SIZES, NUM_GENES, NUM_HEAT_SOURCES,
+    ):
+        name = (
+            f"evolve[{engine},pop={population_size},world={world_size[0]}x{world_size[1]},"
+            f"genes={num_genes},heat={num_heat_sources}]"
+        )
+        print(f"Running {name}...")
+        for metric, value in benchmark_evolve(
+            engine, population_size, world_size, num_genes, num_heat_sources,
+        ).items():
+            results[f"{name}.{metric}"] = value
+
+    for num_genes in NUM_GENES:
+        name = f"components[genes={num_genes}]"
+        print(f"Running {name}...")
+        for metric, value in benchmark_components(num_genes, POPULATION_SIZES[-1], WORLD_SIZES[0]).items():
+            results[f"{name}.{metric}"] = value
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    """Names of the benchmarks more than `tolerance` slower than the baseline. Every metric is higher-is-better."""
+    regressions = []
+    for name, value in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = value/baseline[name]
+        flag = 'REGRESSION' if ratio < 1 - tolerance else ''
+        print(f"{name}: {baseline[name]:.2f} -> {value:.2f} ({ratio:.2f}x) {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='simulation_throughput.json', help='JSON file to save the results to.')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed slowdown before flagging a regression.')
+    args = parser.parse_args()
+
+    results = run_benchmarks()
+    with open(args.output, 'w') as f:
+        json.dump({
+            'metadata': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'seed': SEED,
+            },
+            'results': results,
+        }, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions found.")
+            sys.exit(1)